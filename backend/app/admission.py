@@ -0,0 +1,320 @@
+import asyncio
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Dict, Optional, Tuple
+
+import redis.asyncio as aioredis
+from fastapi import HTTPException, status
+from fastapi_jwt_auth import AuthJWT
+from fastapi_limiter import FastAPILimiter
+from fastapi_limiter.depends import RateLimiter
+from prometheus_client import Counter, Gauge
+from starlette.requests import Request
+from starlette.responses import Response
+
+from backend.app.config import settings
+
+# Set up logging
+logger = logging.getLogger("admission")
+
+ADMISSION_DECISIONS = Counter(
+    "ldcs_admission_decisions_total",
+    "Admission decisions for limited pipelines (admitted, queued, or shed with a reason)",
+    ["pipeline", "decision"],
+)
+ADMISSION_WAITING = Gauge(
+    "ldcs_admission_waiting",
+    "Requests waiting for a slot in a limited pipeline",
+    ["pipeline"],
+    multiprocess_mode="livesum",
+)
+
+OVERLOADED_DETAIL = "Server is busy, please retry later"
+
+class Overloaded(Exception):
+    """Raised when a request is shed; `retry_after` is a whole number of seconds."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+class _Waiter:
+    """A queued request, waiting on its own event loop rather than in a thread."""
+    __slots__ = ("loop", "future", "granted")
+
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.future = self.loop.create_future()
+        self.granted = False
+
+    def wake(self):
+        # The slot may be freed from another thread than the one running the waiter's loop
+        self.loop.call_soon_threadsafe(self._wake)
+
+    def _wake(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+# ----------------------------------------
+# Admission Controller
+# ----------------------------------------
+
+class AdmissionController:
+    """
+    Concurrency limiter with a bounded, per-user fair wait queue.
+
+    At most `max_concurrency` requests hold a slot. Further requests wait in a
+    queue per user, and freed slots are handed out round-robin across users, so
+    one user submitting a batch only delays their own films. A request is shed
+    with `Overloaded` when the queue is full, or when its predicted wait (its
+    place in the round-robin times the average slot hold time) exceeds
+    `slo_seconds`. A queued request that is still waiting when the SLO runs out
+    is shed too. Waiting happens on the event loop, so queued requests do not
+    hold threadpool threads.
+    """
+
+    def __init__(self, pipeline: str, max_concurrency: int, max_queue: int, slo_seconds: float,
+                 initial_service_time: float = 1.0):
+        self.pipeline = pipeline
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.slo_seconds = slo_seconds
+        self.service_time = initial_service_time
+        self.in_flight = 0
+        self.queued = 0
+        self._queues: "OrderedDict[str, deque]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _waiters_ahead(self, user: str) -> int:
+        # Round-robin serves each user once per turn: a request that would be the
+        # n-th of its user's waiters goes after up to n waiters of every other user
+        position = len(self._queues.get(user, ())) + 1
+        others = sum(min(len(queue), position) for key, queue in self._queues.items() if key != user)
+        return others + position - 1
+
+    def _predicted_wait(self, user: str) -> float:
+        if self.in_flight < self.max_concurrency and not self.queued:
+            return 0.0
+        return (self._waiters_ahead(user) + 1) * self.service_time / self.max_concurrency
+
+    def _retry_after(self) -> int:
+        # Time for the work already admitted to drain
+        backlog = (self.in_flight + self.queued) * self.service_time / self.max_concurrency
+        return max(1, math.ceil(backlog))
+
+    def _shed_reason(self, user: str) -> Optional[str]:
+        if self.in_flight < self.max_concurrency and not self.queued:
+            return None
+        if self.queued >= self.max_queue:
+            return "queue_full"
+        if self._predicted_wait(user) > self.slo_seconds:
+            return "slo"
+        return None
+
+    def _shed(self, reason: str) -> Overloaded:
+        ADMISSION_DECISIONS.labels(self.pipeline, f"shed_{reason}").inc()
+        logger.info(f"Shedding {self.pipeline} request ({reason}), {self.in_flight} running, {self.queued} queued")
+        return Overloaded(reason, self._retry_after())
+
+    def check(self, user: str) -> None:
+        """Raises Overloaded if a request from `user` would be shed right now; takes no slot."""
+        with self._lock:
+            reason = self._shed_reason(user)
+            if reason is not None:
+                raise self._shed(reason)
+
+    async def acquire(self, user: str) -> None:
+        with self._lock:
+            if self.in_flight < self.max_concurrency and not self.queued:
+                self.in_flight += 1
+                ADMISSION_DECISIONS.labels(self.pipeline, "admitted").inc()
+                return
+            reason = self._shed_reason(user)
+            if reason is not None:
+                raise self._shed(reason)
+            waiter = _Waiter()
+            self._queues.setdefault(user, deque()).append(waiter)
+            self.queued += 1
+            ADMISSION_DECISIONS.labels(self.pipeline, "queued").inc()
+            ADMISSION_WAITING.labels(self.pipeline).inc()
+
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.slo_seconds)
+            return
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            # The client went away while queued
+            with self._lock:
+                if waiter.granted:
+                    self._free_slot()
+                else:
+                    self._dequeue(user, waiter)
+            raise
+
+        with self._lock:
+            # The slot may have been handed over between the timeout and taking the lock
+            if waiter.granted:
+                return
+            self._dequeue(user, waiter)
+            raise self._shed("timeout")
+
+    def _dequeue(self, user: str, waiter: _Waiter) -> None:
+        queue = self._queues[user]
+        queue.remove(waiter)
+        if not queue:
+            del self._queues[user]
+        self.queued -= 1
+        ADMISSION_WAITING.labels(self.pipeline).dec()
+
+    def release(self, service_time: float) -> None:
+        with self._lock:
+            self.service_time = 0.8 * self.service_time + 0.2 * service_time
+            self._free_slot()
+
+    def _free_slot(self) -> None:
+        """Hands a slot to the next waiter or returns it; call with the lock held."""
+        if not self.queued:
+            self.in_flight -= 1
+            return
+        # Hand the slot straight to the next user in turn, then move that user to the back
+        user, queue = next(iter(self._queues.items()))
+        waiter = queue.popleft()
+        if queue:
+            self._queues.move_to_end(user)
+        else:
+            del self._queues[user]
+        self.queued -= 1
+        ADMISSION_WAITING.labels(self.pipeline).dec()
+        waiter.granted = True
+        waiter.wake()
+
+@asynccontextmanager
+async def admitted(controller: AdmissionController, user: str):
+    """
+    Holds a slot of `controller` for the body of the block, or raises a 503 with
+    Retry-After if the request is shed:
+
+        async with admitted(inference_admission, current_user):
+            ...
+    """
+    try:
+        await controller.acquire(user)
+    except Overloaded as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=OVERLOADED_DETAIL,
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        controller.release(time.perf_counter() - started)
+
+def admission_slot(controller: AdmissionController):
+    """
+    Builds a dependency that holds a slot of `controller` while a (sync)
+    endpoint runs. The slot is awaited before the endpoint is given a
+    threadpool thread, so queued requests only cost a coroutine:
+
+        @router.post("/api/tests", dependencies=[Depends(inference_slot)])
+    """
+    async def dependency(request: Request):
+        user = _jwt_subject(request.scope)
+        if user is None:
+            # Unauthenticated requests are refused by the endpoint
+            yield
+            return
+        async with admitted(controller, user):
+            yield
+    return dependency
+
+# Upload, decode and model inference for new tests
+inference_admission = AdmissionController(
+    "new_test",
+    max_concurrency=settings.INFERENCE_MAX_CONCURRENCY,
+    max_queue=settings.INFERENCE_MAX_QUEUE,
+    slo_seconds=settings.INFERENCE_SLO_SECONDS,
+)
+inference_slot = admission_slot(inference_admission)
+
+ADMISSION_ROUTES: Dict[Tuple[str, str], AdmissionController] = {
+    ("POST", "/api/tests"): inference_admission,
+}
+
+def _jwt_subject(scope) -> Optional[str]:
+    try:
+        return AuthJWT(req=Request(scope)).get_jwt_subject()
+    except Exception:
+        return None
+
+# ----------------------------------------
+# Early Load Shedding Middleware
+# ----------------------------------------
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware that sheds requests to limited routes before their body is
+    read, so a saturated server does not first accept a large upload only to
+    reject it. The slot itself is taken inside the endpoint.
+    """
+
+    def __init__(self, app, routes: Dict[Tuple[str, str], AdmissionController] = ADMISSION_ROUTES):
+        self.app = app
+        self.routes = routes
+
+    async def __call__(self, scope, receive, send):
+        controller = self.routes.get((scope.get("method"), scope.get("path"))) if scope["type"] == "http" else None
+        if controller is None:
+            return await self.app(scope, receive, send)
+
+        # Unauthenticated requests fall through and are refused by the endpoint
+        user = _jwt_subject(scope)
+        if user is not None:
+            try:
+                controller.check(user)
+            except Overloaded as e:
+                return await self._overloaded(e, send)
+        await self.app(scope, receive, send)
+
+    @staticmethod
+    async def _overloaded(error: Overloaded, send):
+        await send({
+            "type": "http.response.start",
+            "status": status.HTTP_503_SERVICE_UNAVAILABLE,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"retry-after", str(error.retry_after).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": f'{{"detail":"{OVERLOADED_DETAIL}"}}'.encode()})
+
+# ----------------------------------------
+# Per-User Rate Limit (fastapi-limiter)
+# ----------------------------------------
+
+async def _user_identifier(request: Request) -> str:
+    user = _jwt_subject(request.scope) or request.client.host
+    return f"{user}:{request.scope['path']}"
+
+async def init_rate_limiter() -> None:
+    """Enables the per-user inference rate limit when REDIS_URL is configured."""
+    if not settings.REDIS_URL or not settings.INFERENCE_RATE_LIMIT_PER_MINUTE:
+        return
+    connection = aioredis.from_url(settings.REDIS_URL, encoding="utf-8", decode_responses=True)
+    await FastAPILimiter.init(connection, identifier=_user_identifier)
+    logger.info(f"Inference rate limit: {settings.INFERENCE_RATE_LIMIT_PER_MINUTE} per user per minute")
+
+_inference_rate_limiter = RateLimiter(times=settings.INFERENCE_RATE_LIMIT_PER_MINUTE, minutes=1)
+
+async def inference_rate_limit(request: Request, response: Response):
+    """Dependency returning 429 with Retry-After once a user exceeds the sustained rate."""
+    if FastAPILimiter.redis is None:
+        return
+    await _inference_rate_limiter(request, response)
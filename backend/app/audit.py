@@ -0,0 +1,289 @@
+import fcntl
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from fastapi_jwt_auth import AuthJWT
+from sqlalchemy import insert, select
+from starlette.requests import Request
+
+from backend.app.config import settings
+from backend.app.extensions import SessionLocal
+from backend.app.models import User, UserActivity
+
+# Set up logging
+logger = logging.getLogger("audit")
+
+# Patient and test reads that must be recorded, matched against GET request paths
+AUDITED_ROUTES = [
+    (re.compile(r"^/api/patients/?$"), "Viewed patient list"),
+    (re.compile(r"^/api/patients/(?P<patient_id>\d+)$"), "Viewed patient"),
+    (re.compile(r"^/api/tests/patient/(?P<patient_id>\d+)$"), "Viewed patient tests"),
+    (re.compile(r"^/api/tests/(?P<test_id>\d+)$"), "Viewed test"),
+    (re.compile(r"^/api/report/download/(?P<test_id>\d+)$"), "Downloaded report"),
+    (re.compile(r"^/api/export/(?P<table>patients|tests)$"), "Exported data"),
+]
+
+# ----------------------------------------
+# Batched Background Writer
+# ----------------------------------------
+
+class AuditWriter:
+    """
+    Collects audit events in a bounded in-memory queue and writes them to the
+    user_activities table from a background thread, one multi-row insert per batch.
+
+    A batch is flushed every `flush_interval_ms` or as soon as `batch_size` events
+    are waiting. Events that cannot be queued (buffer full) or written (database
+    error) are appended to a JSONL spill file and replayed once the database
+    accepts writes again, so nothing is lost while SQLite is busy. Worker
+    processes share the spill file: appends and the hand-over to a replay
+    take an exclusive lock on `<spill_path>.lock`, and each replay file is
+    locked by the process replaying it.
+    """
+
+    def __init__(self, flush_interval_ms: int, batch_size: int, buffer_size: int, spill_path: str):
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.batch_size = batch_size
+        self.spill_path = spill_path
+        self._queue = queue.Queue(maxsize=buffer_size)
+        self._spill_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+        logger.info("Audit writer started.")
+
+    def stop(self, timeout: float = 10.0):
+        """Stops the writer thread after flushing everything still queued."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+        # Anything left behind (e.g. the thread timed out) goes to disk
+        self._spill(self._drain())
+        logger.info("Audit writer stopped.")
+
+    def record(self, username: str, activity: str, details: Optional[Dict] = None):
+        """Queues an event without blocking the request."""
+        event = {
+            "username": username,
+            "activity": activity,
+            "details": json.dumps(details) if details else None,
+            "timestamp": datetime.utcnow().isoformat(),
+        }
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self._spill([event])
+
+    def _drain(self, limit: Optional[int] = None) -> List[Dict]:
+        events = []
+        while limit is None or len(events) < limit:
+            try:
+                events.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return events
+
+    def _run(self):
+        while not self._stop.is_set():
+            deadline = time.monotonic() + self.flush_interval
+            # Sleep until the interval elapses or a full batch is waiting
+            while not self._stop.is_set() and self._queue.qsize() < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._stop.wait(min(remaining, 0.05))
+            try:
+                self.flush()
+            except Exception:
+                # Keep the writer alive; events not yet written stay queued or spilled
+                logger.exception("Audit flush failed")
+
+        # Final flush on shutdown
+        while not self._queue.empty():
+            try:
+                if not self.flush():
+                    break
+            except Exception:
+                logger.exception("Audit flush failed")
+                break
+
+    def flush(self) -> bool:
+        """Writes queued events (and any spilled backlog) to the database."""
+        ok = True
+        while True:
+            events = self._drain(self.batch_size)
+            if not events:
+                break
+            try:
+                written = self._write(events)
+            except Exception:
+                logger.exception(f"Audit batch of {len(events)} events could not be written")
+                written = False
+            if not written:
+                self._spill(events)
+                ok = False
+                break
+        if ok:
+            self._replay_spill()
+        return ok
+
+    def _write(self, events: List[Dict]) -> bool:
+        db = SessionLocal()
+        try:
+            # Resolve all usernames in the batch with one query
+            usernames = {event["username"] for event in events}
+            user_ids = dict(db.execute(select(User.username, User.id).where(User.username.in_(usernames))).all())
+            rows = [
+                {
+                    "user_id": user_ids[event["username"]],
+                    "activity": event["activity"],
+                    "details": event["details"],
+                    "timestamp": datetime.fromisoformat(event["timestamp"]),
+                }
+                for event in events if event["username"] in user_ids
+            ]
+            if rows:
+                db.execute(insert(UserActivity), rows)
+                db.commit()
+            return True
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"Audit batch of {len(events)} events could not be written: {e}")
+            return False
+        finally:
+            db.close()
+
+    @contextmanager
+    def _spill_file_lock(self):
+        """Serializes spill file access between threads and worker processes."""
+        with self._spill_lock, open(f"{self.spill_path}.lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    def _spill(self, events: List[Dict]):
+        if not events:
+            return
+        with self._spill_file_lock():
+            with open(self.spill_path, "a") as spill:
+                for event in events:
+                    spill.write(json.dumps(event) + "\n")
+        logger.warning(f"Spilled {len(events)} audit events to {self.spill_path}")
+
+    def _replay_spill(self):
+        with self._spill_file_lock():
+            if os.path.exists(self.spill_path):
+                # Take the file out of the way so new spills start a fresh one
+                os.replace(self.spill_path, f"{self.spill_path}.replay-{uuid.uuid4().hex}")
+
+        # Also picks up replays left behind by a process that died partway
+        directory, name = os.path.split(os.path.abspath(self.spill_path))
+        for entry in sorted(os.listdir(directory)):
+            if entry.startswith(f"{name}.replay"):
+                self._replay_file(os.path.join(directory, entry))
+
+    def _replay_file(self, replay_path: str):
+        try:
+            spill = open(replay_path)
+        except FileNotFoundError:
+            return
+        with spill:
+            try:
+                fcntl.flock(spill, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Another process is replaying it
+                return
+            if not os.path.exists(replay_path):
+                # Finished by another process between our open and lock
+                return
+
+            events = []
+            for line in spill:
+                if not line.strip():
+                    continue
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    logger.warning(f"Skipping malformed audit event in {replay_path}")
+
+            for start in range(0, len(events), self.batch_size):
+                batch = events[start:start + self.batch_size]
+                if not self._write(batch):
+                    self._spill(events[start:])
+                    break
+            os.remove(replay_path)
+        logger.info(f"Replayed {len(events)} spilled audit events.")
+
+
+audit_writer = AuditWriter(
+    flush_interval_ms=settings.AUDIT_FLUSH_INTERVAL_MS,
+    batch_size=settings.AUDIT_BATCH_SIZE,
+    buffer_size=settings.AUDIT_BUFFER_SIZE,
+    spill_path=settings.AUDIT_SPILL_PATH,
+)
+
+# ----------------------------------------
+# Audit Logging Middleware
+# ----------------------------------------
+
+class AuditMiddleware:
+    """
+    ASGI middleware that records successful patient and test reads. Requests
+    that do not match an audited route pass straight through.
+    """
+
+    def __init__(self, app, writer: AuditWriter = audit_writer):
+        self.app = app
+        self.writer = writer
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET":
+            return await self.app(scope, receive, send)
+
+        path = scope["path"]
+        match = None
+        for pattern, activity in AUDITED_ROUTES:
+            match = pattern.match(path)
+            if match:
+                break
+        if not match:
+            return await self.app(scope, receive, send)
+
+        response_status = {}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response_status["code"] = message["status"]
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+        if response_status.get("code", 500) < 400:
+            username = self._username(scope)
+            if username:
+                details = {"path": path, **match.groupdict()}
+                self.writer.record(username, activity, details)
+
+    @staticmethod
+    def _username(scope) -> Optional[str]:
+        # The route already validated the token, so this only reads the subject
+        try:
+            return AuthJWT(req=Request(scope)).get_jwt_subject()
+        except Exception:
+            return None
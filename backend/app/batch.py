@@ -0,0 +1,65 @@
+import logging
+import time
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import select
+
+from backend.app.models import Test
+
+# Set up logging
+logger = logging.getLogger("batch")
+
+# ----------------------------------------
+# Helpers Shared by the Offline Jobs
+# ----------------------------------------
+
+def iter_test_pages(db, after_id: int, page_size: int, date_from=None, date_to=None):
+    """Keyset-paginates (id, image_path) of tests, so each page is one indexed range scan."""
+    while True:
+        statement = select(Test.id, Test.image_path).where(Test.id > after_id)
+        if date_from is not None:
+            statement = statement.where(Test.date_conducted >= date_from)
+        if date_to is not None:
+            statement = statement.where(Test.date_conducted < date_to)
+        rows = db.execute(statement.order_by(Test.id).limit(page_size)).all()
+        if not rows:
+            return
+        yield rows
+        after_id = rows[-1][0]
+
+def load_input(image_ref: str) -> Optional[np.ndarray]:
+    """
+    Returns the 224x224x3 model input for a stored image: the memory-mapped
+    derivative when one exists, otherwise a fresh decode. None if it cannot be read.
+    Safe to run in worker processes; the heavy imports happen on first use.
+    """
+    from backend.app.derivatives import load_tensor
+    from backend.app.helpers import preprocess_image
+    from backend.app.storage import blob_store
+
+    try:
+        tensor = load_tensor(image_ref)
+        if tensor is None:
+            with blob_store.local_path(image_ref) as path:
+                tensor = preprocess_image(path)
+        return tensor[0]
+    except Exception as e:
+        logger.warning(f"Could not load {image_ref}: {e}")
+        return None
+
+class Throttle:
+    """Caps throughput at `rate` units (images, bytes) per second so live traffic keeps its share of resources."""
+
+    def __init__(self, rate: Optional[float]):
+        self.rate = rate
+        self.started = time.monotonic()
+        self.count = 0
+
+    def wait(self, n: int):
+        self.count += n
+        if not self.rate:
+            return
+        ahead = self.count / self.rate - (time.monotonic() - self.started)
+        if ahead > 0:
+            time.sleep(ahead)
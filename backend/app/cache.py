@@ -0,0 +1,292 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import redis
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import String, cast, literal, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from starlette.requests import Request
+from starlette.responses import Response
+
+from backend.app.config import settings
+from backend.app.metrics import record_cache
+from backend.app.models import CacheVersion
+
+# Set up logging
+logger = logging.getLogger("cache")
+
+CACHE_CONTROL = "private, no-cache"
+
+# Dialects with INSERT ... ON CONFLICT, used to bump a version in one statement
+UPSERT_INSERTS = {"postgresql": postgresql_insert, "sqlite": sqlite_insert}
+
+def patient_key(patient_id: int) -> str:
+    """Version key covering a patient's details and test list."""
+    return f"patient:{patient_id}"
+
+def test_key(test_id: int) -> str:
+    return f"test:{test_id}"
+
+def test_key_expression(test_id_column):
+    """SQL expression equal to test_key() of a test ID column, for set-based bumps."""
+    return literal("test:") + cast(test_id_column, String)
+
+# ----------------------------------------
+# Cached Responses
+# ----------------------------------------
+
+class CachedResponse:
+    """A serialized JSON body, its strong ETag and the user who owns the resource."""
+
+    __slots__ = ("body", "etag", "owner_id")
+
+    def __init__(self, body: bytes, etag: str, owner_id: int):
+        self.body = body
+        self.etag = etag
+        self.owner_id = owner_id
+
+    @classmethod
+    def build(cls, owner_id: int, data: Any) -> "CachedResponse":
+        # Same encoding as FastAPI's JSONResponse
+        body = json.dumps(jsonable_encoder(data), ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+        return cls(body, f'"{hashlib.sha256(body).hexdigest()[:32]}"', owner_id)
+
+    def dumps(self) -> bytes:
+        return json.dumps({"owner_id": self.owner_id, "etag": self.etag, "body": self.body.decode()}).encode()
+
+    @classmethod
+    def loads(cls, raw: bytes) -> "CachedResponse":
+        data = json.loads(raw)
+        return cls(data["body"].encode(), data["etag"], data["owner_id"])
+
+    def matches(self, request: Request) -> bool:
+        header = request.headers.get("if-none-match")
+        if not header:
+            return False
+        # If-None-Match uses weak comparison, so a W/ prefix still matches
+        candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+        return "*" in candidates or self.etag in candidates
+
+    def to_response(self, request: Request) -> Response:
+        headers = {"ETag": self.etag, "Cache-Control": CACHE_CONTROL}
+        if self.matches(request):
+            return Response(status_code=304, headers=headers)
+        return Response(content=self.body, media_type="application/json", headers=headers)
+
+# ----------------------------------------
+# In-Process LRU
+# ----------------------------------------
+
+class LRUCache:
+    """Thread-safe LRU bounded by entry count and total body bytes, with a TTL per entry."""
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.bytes = 0
+        self._entries: "OrderedDict[str, Tuple[float, CachedResponse]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires, entry = item
+            if expires < time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, entry: CachedResponse) -> None:
+        if len(entry.body) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, entry)
+            self.bytes += len(entry.body)
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def _remove(self, key: str) -> None:
+        _, entry = self._entries.pop(key)
+        self.bytes -= len(entry.body)
+
+# ----------------------------------------
+# Shared Cache Backends
+# ----------------------------------------
+
+class SharedCacheBackend(ABC):
+    """Cache shared by all worker processes, consulted when the local LRU misses."""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[bytes]:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value: bytes, ttl_seconds: int) -> None:
+        ...
+
+class RedisCacheBackend(SharedCacheBackend):
+    def __init__(self, client: redis.Redis, prefix: str = "ldcs:responses:"):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.client.get(self.prefix + key)
+
+    def set(self, key: str, value: bytes, ttl_seconds: int) -> None:
+        self.client.set(self.prefix + key, value, ex=ttl_seconds)
+
+class LocalCacheBackend(SharedCacheBackend):
+    """
+    Dictionary standing in for redis, for tests and single-process development.
+    Entries expire like redis keys but are never evicted otherwise.
+    """
+
+    def __init__(self):
+        self._values: Dict[str, Tuple[float, bytes]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            item = self._values.get(key)
+            if item is None or item[0] < time.monotonic():
+                self._values.pop(key, None)
+                return None
+            return item[1]
+
+    def set(self, key: str, value: bytes, ttl_seconds: int) -> None:
+        with self._lock:
+            self._values[key] = (time.monotonic() + ttl_seconds, value)
+
+def create_shared_backend() -> Optional[SharedCacheBackend]:
+    """Builds the shared backend selected by RESPONSE_CACHE_SHARED ("", "redis" or "local")."""
+    if settings.RESPONSE_CACHE_SHARED == "redis":
+        return RedisCacheBackend(redis.Redis.from_url(settings.REDIS_URL))
+    if settings.RESPONSE_CACHE_SHARED == "local":
+        return LocalCacheBackend()
+    return None
+
+# ----------------------------------------
+# Read-Through Response Cache
+# ----------------------------------------
+
+class ResponseCache:
+    """
+    Caches serialized read responses under the current version of the resource
+    they were built from. Versions live in the `cache_versions` table and are
+    bumped in the same transaction as the write, so every worker process sees
+    the change as soon as it commits, and entries for old versions are simply
+    never looked up again.
+    """
+
+    def __init__(self, local: LRUCache, shared: Optional[SharedCacheBackend] = None):
+        self.local = local
+        self.shared = shared
+
+    def version(self, db, version_key: str) -> int:
+        row = db.get(CacheVersion, version_key)
+        return row.version if row is not None else 0
+
+    def bump(self, db, *version_keys: str) -> None:
+        """Invalidates cached responses for the given resources; call before the write commits."""
+        upsert = UPSERT_INSERTS.get(db.get_bind().dialect.name)
+        for version_key in version_keys:
+            if upsert is not None:
+                db.execute(
+                    upsert(CacheVersion)
+                    .values(key=version_key, version=1)
+                    .on_conflict_do_update(index_elements=[CacheVersion.key], set_={"version": CacheVersion.version + 1})
+                )
+                continue
+            statement = update(CacheVersion).where(CacheVersion.key == version_key).values(version=CacheVersion.version + 1)
+            if not db.execute(statement).rowcount:
+                db.add(CacheVersion(key=version_key, version=1))
+                # Flush now, so a second bump of this key in the same transaction updates the row
+                db.flush()
+
+    def bump_from(self, db, version_keys) -> None:
+        """
+        Bumps every key returned by a one-column SELECT, in a single statement
+        where the dialect supports it. The SELECT needs a WHERE clause, which
+        SQLite requires to tell INSERT ... SELECT apart from ON CONFLICT.
+        """
+        upsert = UPSERT_INSERTS.get(db.get_bind().dialect.name)
+        if upsert is None:
+            self.bump(db, *db.execute(version_keys).scalars())
+            return
+        db.execute(
+            upsert(CacheVersion)
+            .from_select(["key", "version"], version_keys.add_columns(literal(1)))
+            .on_conflict_do_update(index_elements=[CacheVersion.key], set_={"version": CacheVersion.version + 1})
+        )
+
+    def read_through(self, db, resource: str, version_key: str,
+                     load: Callable[[], Optional[Tuple[int, Any]]]) -> Optional[CachedResponse]:
+        """
+        Returns the cached response for `resource` at the current version of
+        `version_key`, or calls `load` for (owner_id, data) and caches that.
+        Returns None when `load` finds nothing; misses are not cached.
+        """
+        # Read the version before the data, so data is never cached under a newer version
+        key = f"{resource}:{version_key}:{self.version(db, version_key)}"
+
+        entry = self.local.get(key)
+        record_cache("responses", entry is not None)
+        if entry is not None:
+            return entry
+
+        if self.shared is not None:
+            entry = self._shared_get(key)
+            if entry is not None:
+                self.local.set(key, entry)
+                return entry
+
+        loaded = load()
+        if loaded is None:
+            return None
+        entry = CachedResponse.build(*loaded)
+        self.local.set(key, entry)
+        if self.shared is not None:
+            self._shared_set(key, entry)
+        return entry
+
+    def _shared_get(self, key: str) -> Optional[CachedResponse]:
+        try:
+            raw = self.shared.get(key)
+        except Exception as e:
+            logger.warning(f"Shared cache read failed: {e}")
+            return None
+        record_cache("responses_shared", raw is not None)
+        return CachedResponse.loads(raw) if raw is not None else None
+
+    def _shared_set(self, key: str, entry: CachedResponse) -> None:
+        try:
+            self.shared.set(key, entry.dumps(), int(self.local.ttl_seconds))
+        except Exception as e:
+            logger.warning(f"Shared cache write failed: {e}")
+
+response_cache = ResponseCache(
+    LRUCache(
+        max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES,
+        max_bytes=settings.RESPONSE_CACHE_MAX_BYTES,
+        ttl_seconds=settings.RESPONSE_CACHE_TTL_SECONDS,
+    ),
+    create_shared_backend(),
+)
@@ -0,0 +1,270 @@
+import logging
+import os
+import re
+import time
+from datetime import datetime
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List
+
+from sqlalchemy import delete, func, inspect, or_, select, update
+
+from backend.app.cache import patient_key, response_cache, test_key_expression
+from backend.app.cold_storage import PACK_PREFIX
+from backend.app.config import settings
+from backend.app.derivatives import delete_derivatives, derivative_stem
+from backend.app.extensions import SessionLocal, engine
+from backend.app.models import ArchivedBlob, MedicalHistory, Patient, PredictionRecord, ResumableUpload, StoredBlob, Test, User
+from backend.app.resumable import collect_expired_uploads
+from backend.app.storage import LEGACY_UPLOAD_PREFIXES, blob_store
+
+# Set up logging
+logger = logging.getLogger("cleanup")
+
+# Directory of the flat upload layout used before the blob store
+LEGACY_UPLOAD_DIR = "uploads"
+
+# Derivative file names: "<stem>.npy" and "<stem>_<size>.webp"
+DERIVATIVE_NAME = re.compile(r"^(?P<stem>.+?)(\.npy|_\d+\.webp)$")
+
+def _batches(items: Iterable, size: int) -> Iterator[List]:
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+def _is_legacy_column(column):
+    return or_(*[column.startswith(prefix) for prefix in LEGACY_UPLOAD_PREFIXES])
+
+# ----------------------------------------
+# Set-Based Patient Deletion
+# ----------------------------------------
+
+# (child table, parent table) pairs that must delete with their parent
+CASCADED_FOREIGN_KEYS = [("tests", "patients"), ("medical_histories", "patients"), ("test_predictions", "tests")]
+
+_has_delete_cascades = None
+
+def has_delete_cascades() -> bool:
+    """
+    Whether the database itself deletes a patient's tests, medical history and
+    stored predictions. Tables created before their foreign keys declared ON
+    DELETE CASCADE keep the old constraints, since create_all does not alter
+    existing tables; patients are then deleted with explicit child deletes.
+    Checked once per process.
+    """
+    global _has_delete_cascades
+    if _has_delete_cascades is None:
+        inspector = inspect(engine)
+        tables = set(inspector.get_table_names())
+        missing = [
+            child for child, parent in CASCADED_FOREIGN_KEYS
+            if child in tables and not any(
+                fk["referred_table"] == parent and (fk.get("options") or {}).get("ondelete", "").upper() == "CASCADE"
+                for fk in inspector.get_foreign_keys(child)
+            )
+        ]
+        if missing:
+            logger.warning(f"Foreign keys of {', '.join(missing)} lack ON DELETE CASCADE; "
+                           f"deleting patients with explicit child deletes")
+        _has_delete_cascades = not missing
+    return _has_delete_cascades
+
+def delete_patients(db, patient_ids: Iterable[int]) -> int:
+    """
+    Deletes patients without loading their tests or medical history; the
+    database removes those, and the tests' stored predictions, through ON
+    DELETE CASCADE, or explicit set-based deletes on older schemas without
+    it (see has_delete_cascades). Image references held by the tests are released in the same
+    transaction, and the blobs themselves are removed later by
+    collect_released_blobs. Commits, and returns the number of patients deleted.
+    """
+    ids = sorted(set(patient_ids))
+    if not ids:
+        return 0
+    of_patients = Test.patient_id.in_(ids)
+
+    # Invalidate cached responses for the patients and every one of their tests
+    response_cache.bump(db, *(patient_key(patient_id) for patient_id in ids))
+    response_cache.bump_from(db, select(test_key_expression(Test.id)).where(of_patients))
+
+    # Drop one reference per test, counted per blob by the database
+    references = select(func.count(Test.id)).where(Test.image_path == StoredBlob.key, of_patients).scalar_subquery()
+    db.execute(
+        update(StoredBlob)
+        .where(StoredBlob.key.in_(select(Test.image_path).where(of_patients)))
+        .values(ref_count=StoredBlob.ref_count - references)
+        .execution_options(synchronize_session=False)
+    )
+
+    if not has_delete_cascades():
+        db.execute(
+            delete(PredictionRecord)
+            .where(PredictionRecord.test_id.in_(select(Test.id).where(of_patients)))
+            .execution_options(synchronize_session=False)
+        )
+        db.execute(delete(Test).where(of_patients).execution_options(synchronize_session=False))
+        db.execute(
+            delete(MedicalHistory).where(MedicalHistory.patient_id.in_(ids)).execution_options(synchronize_session=False)
+        )
+
+    deleted = db.execute(
+        delete(Patient).where(Patient.id.in_(ids)).execution_options(synchronize_session=False)
+    ).rowcount
+    db.commit()
+    return deleted
+
+# ----------------------------------------
+# Garbage Collection
+# ----------------------------------------
+
+def collect_released_blobs(batch_size: int = 500, dry_run: bool = False) -> int:
+    """
+    Deletes blobs without references, with their derivatives and cold-tier
+    index rows, in batches. Safe to run while uploads are happening: a blob
+    that gains a reference again before its row is deleted is kept.
+    """
+    db = SessionLocal()
+    collected = 0
+    try:
+        if dry_run:
+            return db.execute(select(func.count()).where(StoredBlob.ref_count <= 0)).scalar()
+        while True:
+            keys = db.execute(select(StoredBlob.key).where(StoredBlob.ref_count <= 0).limit(batch_size)).scalars().all()
+            if not keys:
+                break
+            # Re-check the count in the delete itself, then see which rows actually went
+            db.execute(delete(StoredBlob).where(StoredBlob.key.in_(keys), StoredBlob.ref_count <= 0))
+            kept = set(db.execute(select(StoredBlob.key).where(StoredBlob.key.in_(keys))).scalars())
+            released = [key for key in keys if key not in kept]
+            if released:
+                db.execute(delete(ArchivedBlob).where(ArchivedBlob.key.in_(released)))
+            db.commit()
+
+            blob_store.discard(db, released)
+            for key in released:
+                blob_store.cold.forget(key)
+                delete_derivatives(key)
+            collected += len(released)
+    finally:
+        db.close()
+    if collected:
+        logger.info(f"Collected {collected} released blobs")
+    return collected
+
+def collect_leaked_objects(db, cutoff: float, batch_size: int, dry_run: bool = False) -> int:
+    """Deletes stored objects older than `cutoff` that no stored_blobs row knows about."""
+    removed = 0
+    candidates = (
+        key for key, mtime in blob_store.backend.iter_objects()
+        if mtime < cutoff and not key.startswith(PACK_PREFIX)
+    )
+    for batch in _batches(candidates, batch_size):
+        known = set(db.execute(select(StoredBlob.key).where(StoredBlob.key.in_(batch))).scalars())
+        for key in batch:
+            if key in known:
+                continue
+            if not dry_run:
+                blob_store.backend.delete(key)
+                delete_derivatives(key)
+            removed += 1
+    return removed
+
+def collect_legacy_uploads(db, cutoff: float, batch_size: int, dry_run: bool = False) -> int:
+    """
+    Deletes files in the legacy ./uploads directory that no test or profile
+    picture refers to any more, and cold-tier index rows of legacy images
+    whose tests are gone.
+    """
+    removed = 0
+    if os.path.isdir(LEGACY_UPLOAD_DIR):
+        pictures = {
+            os.path.basename(picture.split("?", 1)[0])
+            for picture in db.execute(select(User.profile_picture).where(User.profile_picture.isnot(None))).scalars()
+        }
+        names = (
+            entry.name for entry in os.scandir(LEGACY_UPLOAD_DIR)
+            if entry.is_file() and entry.stat().st_mtime < cutoff
+        )
+        for batch in _batches(names, batch_size):
+            refs = {f"{prefix}{name}": name for name in batch for prefix in LEGACY_UPLOAD_PREFIXES}
+            used = {refs[ref] for ref in db.execute(select(Test.image_path).where(Test.image_path.in_(list(refs)))).scalars()}
+            for name in batch:
+                if name in used or name in pictures:
+                    continue
+                if not dry_run:
+                    os.remove(os.path.join(LEGACY_UPLOAD_DIR, name))
+                    for prefix in LEGACY_UPLOAD_PREFIXES:
+                        delete_derivatives(f"{prefix}{name}")
+                removed += 1
+
+    if not dry_run:
+        db.execute(
+            delete(ArchivedBlob)
+            .where(_is_legacy_column(ArchivedBlob.key), ~select(Test.id).where(Test.image_path == ArchivedBlob.key).exists())
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+    return removed
+
+def collect_orphaned_derivatives(db, cutoff: float, batch_size: int, dry_run: bool = False) -> int:
+    """Deletes derivative files older than `cutoff` whose image is no longer stored."""
+    root = settings.DERIVATIVES_ROOT
+    if not os.path.isdir(root):
+        return 0
+    live_legacy = {
+        derivative_stem(ref)
+        for ref in db.execute(select(Test.image_path).distinct().where(_is_legacy_column(Test.image_path))).scalars()
+    }
+
+    def files():
+        for directory, _, names in os.walk(root):
+            for name in names:
+                path = os.path.join(directory, name)
+                match = DERIVATIVE_NAME.match(os.path.relpath(path, root).replace(os.sep, "/"))
+                if match and os.path.getmtime(path) < cutoff:
+                    yield match.group("stem"), path
+
+    removed = 0
+    for batch in _batches(files(), batch_size):
+        stems = {stem for stem, _ in batch if not stem.startswith("legacy/")}
+        live = set()
+        if stems:
+            # Blob keys are the stem plus the original extension
+            keys = db.execute(
+                select(StoredBlob.key).where(or_(*[StoredBlob.key.startswith(f"{stem}.") for stem in stems], StoredBlob.key.in_(stems)))
+            ).scalars()
+            live = {os.path.splitext(key)[0] for key in keys}
+        for stem, path in batch:
+            if stem in live or stem in live_legacy:
+                continue
+            if not dry_run:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            removed += 1
+    return removed
+
+def reconcile_storage(grace_seconds: float, batch_size: int = 500, dry_run: bool = False) -> Dict[str, int]:
+    """
+    Full reconciliation of storage against the database. Files newer than
+    `grace_seconds` are left alone, since they may belong to an upload whose
+    transaction has not committed yet. Expired resumable uploads are only
+    counted in a dry run.
+    """
+    cutoff = time.time() - grace_seconds
+    report = {"released_blobs": collect_released_blobs(batch_size, dry_run)}
+    db = SessionLocal()
+    try:
+        report["leaked_objects"] = collect_leaked_objects(db, cutoff, batch_size, dry_run)
+        report["legacy_uploads"] = collect_legacy_uploads(db, cutoff, batch_size, dry_run)
+        report["derivatives"] = collect_orphaned_derivatives(db, cutoff, batch_size, dry_run)
+        report["expired_uploads"] = (
+            db.execute(select(func.count()).where(ResumableUpload.expires_at < datetime.utcnow())).scalar()
+            if dry_run else collect_expired_uploads(batch_size)
+        )
+    finally:
+        db.close()
+    return report
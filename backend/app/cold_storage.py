@@ -0,0 +1,174 @@
+import hashlib
+import logging
+import lzma
+import os
+import tempfile
+import threading
+import zlib
+from io import BytesIO
+from typing import List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from backend.app.extensions import SessionLocal
+from backend.app.models import ArchivedBlob
+
+# Set up logging
+logger = logging.getLogger("cold_storage")
+
+PACK_PREFIX = "cold/"
+
+# WebP cannot encode larger images
+WEBP_MAX_DIMENSION = 16383
+
+# Image modes WebP stores without loss; others (e.g. 16-bit) use a byte codec
+WEBP_LOSSLESS_MODES = {"L", "RGB", "RGBA"}
+
+# Codecs that restore the original bytes; "webp" restores only the pixels and is opt-in
+BYTE_EXACT_CODECS = ("lzma", "zlib")
+
+# ----------------------------------------
+# Lossless Codecs
+# ----------------------------------------
+
+def _webp_to_png(payload: bytes, mode: str) -> bytes:
+    with Image.open(BytesIO(payload)) as img:
+        buffer = BytesIO()
+        img.convert(mode).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+def _webp_lossless(data: bytes) -> Optional[Tuple[str, bytes]]:
+    """
+    Re-encodes a PNG as lossless WebP, or returns None if that is not possible.
+    The result is decoded again and compared pixel by pixel before it is used.
+    The PNG it restores to is a different file than the original (metadata
+    chunks are dropped), so the codec records that file's SHA-256 as
+    "webp:<mode>:<digest>".
+    """
+    try:
+        with Image.open(BytesIO(data)) as img:
+            if img.format != "PNG" or img.mode not in WEBP_LOSSLESS_MODES or max(img.size) > WEBP_MAX_DIMENSION:
+                return None
+            mode = img.mode
+            pixels = np.asarray(img)
+            buffer = BytesIO()
+            img.save(buffer, format="WEBP", lossless=True, quality=100, method=6)
+        with Image.open(BytesIO(buffer.getvalue())) as decoded:
+            if not np.array_equal(np.asarray(decoded.convert(mode)), pixels):
+                return None
+        restored = hashlib.sha256(_webp_to_png(buffer.getvalue(), mode)).hexdigest()
+    except Exception as e:
+        logger.warning(f"WebP recompression skipped: {e}")
+        return None
+    return f"webp:{mode}:{restored}", buffer.getvalue()
+
+def restored_digest(codec: str) -> Optional[str]:
+    """SHA-256 of what a WebP entry restores to; None for codecs that restore the original bytes."""
+    parts = codec.split(":")
+    return parts[2] if parts[0] == "webp" and len(parts) > 2 else None
+
+def compress(data: bytes, extension: str, codecs: List[str]) -> Tuple[str, bytes]:
+    """
+    Returns the smallest (codec, payload) among the allowed codecs, falling
+    back to storing the bytes as they are. `zlib` and `lzma` restore the
+    original bytes exactly; `webp` restores the same pixels as a different
+    PNG file (see restored_digest).
+    """
+    candidates = [("store", data)]
+    if "webp" in codecs and extension == ".png":
+        webp = _webp_lossless(data)
+        if webp is not None:
+            candidates.append(webp)
+    if "zlib" in codecs:
+        candidates.append(("zlib", zlib.compress(data, 9)))
+    if "lzma" in codecs:
+        candidates.append(("lzma", lzma.compress(data, preset=6)))
+    return min(candidates, key=lambda candidate: len(candidate[1]))
+
+def decompress(codec: str, payload: bytes) -> bytes:
+    if codec == "store":
+        return payload
+    if codec == "zlib":
+        return zlib.decompress(payload)
+    if codec == "lzma":
+        return lzma.decompress(payload)
+    if codec.startswith("webp:"):
+        return _webp_to_png(payload, codec.split(":")[1])
+    raise ValueError(f"Unknown codec: {codec}")
+
+# ----------------------------------------
+# Pack Files
+# ----------------------------------------
+
+class PackWriter:
+    """
+    Appends recompressed blobs to a local temp file that becomes one pack
+    object in the storage backend. Returns (key, offset, length, codec,
+    original size) entries for the offset index.
+    """
+
+    def __init__(self, temp_dir: str, name: str):
+        self.key = f"{PACK_PREFIX}{name}.pack"
+        fd, self.temp_path = tempfile.mkstemp(dir=temp_dir, suffix=".pack")
+        self.file = os.fdopen(fd, "wb")
+        self.entries = []
+        self.size = 0
+
+    def add(self, key: str, codec: str, payload: bytes, original_size: int) -> None:
+        self.file.write(payload)
+        self.entries.append((key, self.size, len(payload), codec, original_size))
+        self.size += len(payload)
+
+    def close(self) -> str:
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        return self.temp_path
+
+    def abort(self) -> None:
+        self.file.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+# ----------------------------------------
+# Read Path
+# ----------------------------------------
+
+class ColdTier:
+    """
+    Reads blobs that the archive job moved into pack files. Index entries never
+    change once written, so each process caches the ones it has looked up.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def entry(self, key: str) -> Optional[ArchivedBlob]:
+        with self._lock:
+            if key in self._entries:
+                return self._entries[key]
+        db = SessionLocal()
+        try:
+            entry = db.get(ArchivedBlob, key)
+            if entry is not None:
+                db.expunge(entry)
+        finally:
+            db.close()
+        if entry is not None:
+            with self._lock:
+                self._entries[key] = entry
+        return entry
+
+    def forget(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def read(self, key: str) -> Optional[bytes]:
+        entry = self.entry(key)
+        if entry is None:
+            return None
+        payload = self.backend.read_range(entry.pack, entry.offset, entry.length)
+        return decompress(entry.codec, payload)
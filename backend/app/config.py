@@ -6,6 +6,80 @@ class Settings(BaseSettings):
     JWT_SECRET_KEY: str = Field(..., env="JWT_SECRET_KEY")
     ALLOWED_ORIGINS: str = Field(..., env="ALLOWED_ORIGINS")
 
+    # Audit log writer
+    AUDIT_FLUSH_INTERVAL_MS: int = Field(500, env="AUDIT_FLUSH_INTERVAL_MS")
+    AUDIT_BATCH_SIZE: int = Field(200, env="AUDIT_BATCH_SIZE")
+    AUDIT_BUFFER_SIZE: int = Field(10000, env="AUDIT_BUFFER_SIZE")
+    AUDIT_SPILL_PATH: str = Field("audit_spill.jsonl", env="AUDIT_SPILL_PATH")
+
+    # Blob storage: "filesystem", "s3", or "local-s3" (a directory standing in for an object store)
+    STORAGE_BACKEND: str = Field("filesystem", env="STORAGE_BACKEND")
+    STORAGE_ROOT: str = Field("uploads/blobs", env="STORAGE_ROOT")
+    S3_BUCKET: str = Field("ldcs", env="S3_BUCKET")
+    S3_PREFIX: str = Field("", env="S3_PREFIX")
+    S3_ENDPOINT_URL: str = Field("", env="S3_ENDPOINT_URL")
+
+    # Upload limits
+    MAX_TEST_IMAGE_BYTES: int = Field(200 * 1024 * 1024, env="MAX_TEST_IMAGE_BYTES")
+    MAX_PROFILE_PICTURE_BYTES: int = Field(5 * 1024 * 1024, env="MAX_PROFILE_PICTURE_BYTES")
+    MAX_IMAGE_PIXELS: int = Field(89478485, env="MAX_IMAGE_PIXELS")  # Pillow's decompression-bomb threshold
+
+    # Opt-in request profiling and span export
+    PROFILING_SAMPLE_RATE: float = Field(0.0, env="PROFILING_SAMPLE_RATE")
+    PROFILES_DIR: str = Field("profiles", env="PROFILES_DIR")
+    TRACE_EXPORT_PATH: str = Field("profiles/spans.jsonl", env="TRACE_EXPORT_PATH")
+
+    # Local cache of per-image derivatives (preprocessed tensors and thumbnails)
+    DERIVATIVES_ROOT: str = Field("uploads/derivatives", env="DERIVATIVES_ROOT")
+
+    # Admission control for new tests (per worker process)
+    INFERENCE_MAX_CONCURRENCY: int = Field(2, env="INFERENCE_MAX_CONCURRENCY")
+    INFERENCE_MAX_QUEUE: int = Field(32, env="INFERENCE_MAX_QUEUE")
+    INFERENCE_SLO_SECONDS: float = Field(10.0, env="INFERENCE_SLO_SECONDS")
+
+    # CPU inference profile (0 threads = TensorFlow default); oneDNN itself is
+    # toggled with TensorFlow's TF_ENABLE_ONEDNN_OPTS environment variable
+    INFERENCE_INTRA_OP_THREADS: int = Field(0, env="INFERENCE_INTRA_OP_THREADS")
+    INFERENCE_INTER_OP_THREADS: int = Field(0, env="INFERENCE_INTER_OP_THREADS")
+    INFERENCE_COMPILED_PREDICT: bool = Field(True, env="INFERENCE_COMPILED_PREDICT")
+    INFERENCE_XLA: bool = Field(False, env="INFERENCE_XLA")
+    INFERENCE_BF16: bool = Field(False, env="INFERENCE_BF16")
+
+    # Optional sustained per-user rate limit on new tests (needs redis)
+    REDIS_URL: str = Field("", env="REDIS_URL")
+    INFERENCE_RATE_LIMIT_PER_MINUTE: int = Field(0, env="INFERENCE_RATE_LIMIT_PER_MINUTE")
+
+    # Similar-case search: embedding matrix location, and when/how the IVF index is used
+    EMBEDDINGS_DIR: str = Field("uploads/embeddings", env="EMBEDDINGS_DIR")
+    EMBEDDING_LAYER: str = Field("", env="EMBEDDING_LAYER")
+    SIMILARITY_INDEX_MIN_ROWS: int = Field(50000, env="SIMILARITY_INDEX_MIN_ROWS")
+    SIMILARITY_NPROBE: int = Field(32, env="SIMILARITY_NPROBE")
+
+    # Read-through response cache; RESPONSE_CACHE_SHARED is "", "redis" (uses REDIS_URL) or "local"
+    RESPONSE_CACHE_MAX_ENTRIES: int = Field(10000, env="RESPONSE_CACHE_MAX_ENTRIES")
+    RESPONSE_CACHE_MAX_BYTES: int = Field(64 * 1024 * 1024, env="RESPONSE_CACHE_MAX_BYTES")
+    RESPONSE_CACHE_TTL_SECONDS: int = Field(300, env="RESPONSE_CACHE_TTL_SECONDS")
+    RESPONSE_CACHE_SHARED: str = Field("", env="RESPONSE_CACHE_SHARED")
+
+    # Pre-fork production server (python -m backend.serve)
+    WEB_WORKERS: int = Field(2, env="WEB_WORKERS")
+    WORKER_MAX_REQUESTS: int = Field(5000, env="WORKER_MAX_REQUESTS")
+    WORKER_MAX_REQUESTS_JITTER: int = Field(500, env="WORKER_MAX_REQUESTS_JITTER")
+    WORKER_MAX_RSS_MB: int = Field(0, env="WORKER_MAX_RSS_MB")
+    WORKER_GRACEFUL_TIMEOUT: int = Field(30, env="WORKER_GRACEFUL_TIMEOUT")
+
+    # Cold tier for images of old tests (python -m backend.archive_images)
+    COLD_STORAGE_AGE_DAYS: int = Field(365, env="COLD_STORAGE_AGE_DAYS")
+    COLD_PACK_BYTES: int = Field(256 * 1024 * 1024, env="COLD_PACK_BYTES")
+
+    # Push events over /ws/events; EVENTS_BROKER is "local" (one process), "redis" (uses REDIS_URL),
+    # or "" for redis when REDIS_URL is set and local otherwise
+    EVENTS_BROKER: str = Field("", env="EVENTS_BROKER")
+    EVENTS_BUFFER_SIZE: int = Field(100, env="EVENTS_BUFFER_SIZE")
+
+    # Resumable uploads that see no new chunk for this long are deleted
+    RESUMABLE_UPLOAD_TTL_HOURS: int = Field(24, env="RESUMABLE_UPLOAD_TTL_HOURS")
+
     class Config:
         case_sensitive = True
 
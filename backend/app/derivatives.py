@@ -0,0 +1,167 @@
+import hashlib
+import logging
+import os
+import tempfile
+from typing import Dict, Optional
+
+import numpy as np
+from PIL import Image
+from tensorflow.keras.applications.efficientnet import preprocess_input
+
+from backend.app.config import settings
+from backend.app.dicom import is_dicom, read_frame, to_model_input
+from backend.app.metrics import record_cache, stage_timer
+from backend.app.storage import blob_store, is_legacy_path
+
+# Set up logging
+logger = logging.getLogger("derivatives")
+
+# Decode whatever upload validation accepted (see MAX_IMAGE_PIXELS), and nothing larger
+Image.MAX_IMAGE_PIXELS = settings.MAX_IMAGE_PIXELS
+
+MODEL_INPUT_SIZE = (224, 224)
+THUMBNAIL_SIZES = (128, 256, 512)
+THUMBNAIL_URL_PREFIX = "/thumbnails/"
+WEBP_QUALITY = 80
+
+# ----------------------------------------
+# Derivative Paths
+# ----------------------------------------
+
+def derivative_stem(image_ref: str) -> str:
+    """
+    Relative path prefix shared by all derivatives of an image. Blob keys are
+    content hashes, so identical uploads share derivatives; legacy ./uploads
+    paths are hashed into the same sharded layout.
+    """
+    if is_legacy_path(image_ref):
+        digest = hashlib.sha256(image_ref.encode("utf-8")).hexdigest()
+        return f"legacy/{digest[:2]}/{digest[2:4]}/{digest}"
+    return os.path.splitext(image_ref)[0]
+
+def _path(relative: str) -> str:
+    return os.path.join(settings.DERIVATIVES_ROOT, *relative.split("/"))
+
+def tensor_path(image_ref: str) -> str:
+    return _path(f"{derivative_stem(image_ref)}.npy")
+
+def thumbnail_name(image_ref: str, size: int) -> str:
+    return f"{derivative_stem(image_ref)}_{size}.webp"
+
+def thumbnail_path(image_ref: str, size: int) -> str:
+    return _path(thumbnail_name(image_ref, size))
+
+def thumbnail_file(name: str) -> Optional[str]:
+    """Resolves a thumbnail name from a URL to a file path, rejecting anything else."""
+    if ".." in name.split("/") or not name.endswith(".webp"):
+        return None
+    path = _path(name)
+    return path if os.path.isfile(path) else None
+
+def has_thumbnails(image_ref: str) -> bool:
+    return all(os.path.exists(thumbnail_path(image_ref, size)) for size in THUMBNAIL_SIZES)
+
+def thumbnail_urls(image_ref: str) -> Optional[Dict[int, str]]:
+    """
+    URLs of an image's thumbnails, or None until they have been generated, e.g.
+    for tests created before derivatives existed or inserted by seed_data.py.
+    """
+    if not has_thumbnails(image_ref):
+        return None
+    return {size: f"{THUMBNAIL_URL_PREFIX}{thumbnail_name(image_ref, size)}" for size in THUMBNAIL_SIZES}
+
+def _atomic_write(path: str, write) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=os.path.splitext(path)[1])
+    try:
+        with os.fdopen(fd, "wb") as dst:
+            write(dst)
+        os.replace(temp_path, path)
+    except Exception:
+        os.remove(temp_path)
+        raise
+
+# ----------------------------------------
+# Derivative Pipeline
+# ----------------------------------------
+
+def create_derivatives(image_ref: str, local_path: Optional[str] = None) -> np.ndarray:
+    """
+    Decodes an uploaded image once and writes its derivatives:
+      - the model input as a float16 224x224x3 .npy (EfficientNet's
+        preprocess_input passes 0-255 pixel values through, and float16 holds
+        those to within 0.125)
+      - WebP thumbnails for each size in THUMBNAIL_SIZES
+    DICOM files are windowed and decoded straight to arrays, without an
+    intermediate PNG. Returns the preprocessed tensor with a batch dimension.
+    """
+    if local_path is None:
+        with blob_store.local_path(image_ref) as path:
+            return create_derivatives(image_ref, path)
+
+    if is_dicom(local_path):
+        with stage_timer("derivatives", "decode"):
+            gray = read_frame(local_path)
+        with stage_timer("derivatives", "preprocess"):
+            model_input = to_model_input(gray, MODEL_INPUT_SIZE)[0]
+        img = Image.fromarray(gray)
+        _write_derivatives(image_ref, model_input, img)
+    else:
+        with Image.open(local_path) as img:
+            with stage_timer("derivatives", "decode"):
+                img = img.convert("RGB")
+            with stage_timer("derivatives", "preprocess"):
+                # Same resize as keras load_img(target_size=...), which defaults to nearest
+                model_input = np.asarray(img.resize(MODEL_INPUT_SIZE, Image.NEAREST), dtype=np.float32)
+                model_input = preprocess_input(model_input)
+            _write_derivatives(image_ref, model_input, img)
+
+    return np.expand_dims(model_input.astype(np.float16).astype(np.float32), axis=0)
+
+def _write_derivatives(image_ref: str, model_input: np.ndarray, img: Image.Image) -> None:
+    model_input = model_input.astype(np.float16)
+    _atomic_write(tensor_path(image_ref), lambda dst: np.save(dst, model_input))
+
+    # Shrink from the largest size down so each step resamples less data
+    with stage_timer("derivatives", "thumbnails"):
+        thumbnail = img
+        for size in sorted(THUMBNAIL_SIZES, reverse=True):
+            thumbnail = thumbnail.copy()
+            thumbnail.thumbnail((size, size), Image.LANCZOS)
+            _atomic_write(
+                thumbnail_path(image_ref, size),
+                lambda dst: thumbnail.save(dst, format="WEBP", quality=WEBP_QUALITY)
+            )
+
+def load_tensor(image_ref: str) -> Optional[np.ndarray]:
+    """
+    Memory-maps the cached model input and returns it as a float32 batch of one,
+    or None if the derivative has not been generated.
+    """
+    path = tensor_path(image_ref)
+    if not os.path.exists(path):
+        return None
+    return np.expand_dims(np.load(path, mmap_mode="r").astype(np.float32), axis=0)
+
+def ensure_derivatives(image_ref: str) -> np.ndarray:
+    """Returns the cached model input, generating all derivatives on first use."""
+    tensor = load_tensor(image_ref)
+    hit = tensor is not None and has_thumbnails(image_ref)
+    record_cache("derivatives", hit)
+    if not hit:
+        tensor = create_derivatives(image_ref)
+    return tensor
+
+def report_image_path(image_ref: str) -> str:
+    """Largest thumbnail, used instead of the full original when rendering reports."""
+    ensure_derivatives(image_ref)
+    return thumbnail_path(image_ref, max(THUMBNAIL_SIZES))
+
+def delete_derivatives(image_ref: Optional[str]) -> None:
+    if not image_ref:
+        return
+    for path in [tensor_path(image_ref)] + [thumbnail_path(image_ref, size) for size in THUMBNAIL_SIZES]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,131 @@
+import logging
+
+import numpy as np
+from PIL import Image
+from pydicom import dcmread
+from pydicom.pixels import apply_modality_lut, apply_voi_lut, pixel_array
+from tensorflow.keras.applications.efficientnet import preprocess_input
+
+# Set up logging
+logger = logging.getLogger("dicom")
+
+DICOM_EXTENSIONS = {'dcm', 'dicom'}
+PIXEL_DATA_TAG = 0x7FE00010
+
+# Decoded frames are decimated to at least this size on their short side before
+# any LUT work, which is enough for the 224px model input and the 512px thumbnail
+MIN_WORKING_SIZE = 512
+
+# ----------------------------------------
+# Detection
+# ----------------------------------------
+
+def is_dicom(path: str) -> bool:
+    """DICOM Part 10 files have a 128-byte preamble followed by 'DICM'."""
+    try:
+        with open(path, 'rb') as f:
+            f.seek(128)
+            return f.read(4) == b'DICM'
+    except OSError:
+        return False
+
+# ----------------------------------------
+# Lazy Pixel Access
+# ----------------------------------------
+
+def _read_header(path: str):
+    # Large values (including PixelData) are left on disk and only their offset is kept
+    return dcmread(path, defer_size="1 KB")
+
+def _memmap_frame(path: str, ds, frame: int):
+    """
+    Maps one frame of uncompressed, little-endian monochrome pixel data straight
+    from the file without reading the rest. The values are raw container words;
+    pass a copy through _stored_values before using them. Returns None when the
+    layout is not one that can be mapped directly.
+    """
+    transfer_syntax = ds.file_meta.TransferSyntaxUID
+    if transfer_syntax.is_compressed or not transfer_syntax.is_little_endian:
+        return None
+    if ds.get('SamplesPerPixel', 1) != 1 or ds.BitsAllocated not in (8, 16, 32):
+        return None
+    # Stored bits must sit at the bottom of each word, as pydicom assumes too
+    bits_stored = ds.get('BitsStored', ds.BitsAllocated)
+    if ds.get('HighBit', bits_stored - 1) != bits_stored - 1:
+        return None
+
+    pixel_element = ds.get_item(PIXEL_DATA_TAG, keep_deferred=True)
+    offset = getattr(pixel_element, 'value_tell', None)
+    if offset is None:
+        return None
+
+    frames = int(ds.get('NumberOfFrames', 1) or 1)
+    dtype = np.dtype(f"<{'i' if ds.PixelRepresentation else 'u'}{ds.BitsAllocated // 8}")
+    pixels = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(frames, ds.Rows, ds.Columns))
+    return pixels[frame]
+
+def _stored_values(pixels: np.ndarray, ds) -> np.ndarray:
+    """
+    Keeps only the BitsStored low bits of each word, like pydicom's pixel_array:
+    unused high bits (e.g. overlays) are cleared, and signed values are sign-extended.
+    """
+    bits_allocated = ds.BitsAllocated
+    bits_stored = ds.get('BitsStored', bits_allocated)
+    if bits_stored >= bits_allocated:
+        return pixels
+    words = pixels.view(f"<u{bits_allocated // 8}") & ((1 << bits_stored) - 1)
+    if not ds.PixelRepresentation:
+        return words
+    shift = bits_allocated - bits_stored
+    return (words << shift).view(pixels.dtype) >> shift
+
+def read_frame(path: str, frame: int = 0) -> np.ndarray:
+    """
+    Decodes one frame of a DICOM file into an 8-bit grayscale array with the
+    modality LUT, VOI LUT/windowing and MONOCHROME1 inversion applied.
+
+    Uncompressed pixel data is memory-mapped and decimated before it is copied,
+    so multi-frame studies are never loaded whole; compressed data is decoded
+    one frame at a time.
+    """
+    ds = _read_header(path)
+
+    mapped = _memmap_frame(path, ds, frame)
+    if mapped is not None:
+        pixels = mapped
+    else:
+        pixels = pixel_array(path, index=frame)
+        if pixels.ndim == 3:
+            # Colour data: fall back to luminance
+            pixels = np.asarray(Image.fromarray(pixels.astype(np.uint8)).convert('L'))
+
+    # Integer decimation down towards the working size; only these rows/columns are read
+    stride = max(1, min(pixels.shape[:2]) // MIN_WORKING_SIZE)
+    pixels = np.array(pixels[::stride, ::stride])
+    if mapped is not None:
+        pixels = _stored_values(pixels, ds)
+
+    pixels = apply_modality_lut(pixels, ds)
+    pixels = apply_voi_lut(pixels, ds, index=0)
+
+    pixels = pixels.astype(np.float32)
+    low, high = float(pixels.min()), float(pixels.max())
+    scaled = (pixels - low) * (255.0 / (high - low)) if high > low else np.zeros_like(pixels)
+
+    if ds.get('PhotometricInterpretation') == 'MONOCHROME1':
+        scaled = 255.0 - scaled
+
+    return scaled.astype(np.uint8)
+
+# ----------------------------------------
+# Model Input
+# ----------------------------------------
+
+def to_model_input(gray: np.ndarray, size=(224, 224)) -> np.ndarray:
+    """Resizes an 8-bit grayscale frame and returns the EfficientNet input batch of one."""
+    resized = np.asarray(Image.fromarray(gray).resize(size, Image.BILINEAR), dtype=np.float32)
+    rgb = np.repeat(resized[..., np.newaxis], 3, axis=-1)
+    return np.expand_dims(preprocess_input(rgb), axis=0)
+
+def dicom_to_model_input(path: str, frame: int = 0) -> np.ndarray:
+    return to_model_input(read_frame(path, frame))
@@ -0,0 +1,258 @@
+import fcntl
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from backend.app.config import settings
+
+# Set up logging
+logger = logging.getLogger("embeddings")
+
+VECTOR_DTYPE = np.dtype(np.float16)
+ID_DTYPE = np.dtype(np.int64)
+
+# Rows converted to float32 per step of an exact scan; bounds temporary memory
+SCAN_CHUNK_ROWS = 32768
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalizes rows, so cosine similarity becomes a dot product."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+def _size(path: str) -> int:
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Nearest centroid of every row, computed in chunks."""
+    assignment = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), SCAN_CHUNK_ROWS):
+        block = vectors[start:start + SCAN_CHUNK_ROWS].astype(np.float32)
+        assignment[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assignment
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first."""
+    if len(scores) <= k:
+        return np.argsort(-scores)
+    candidates = np.argpartition(-scores, k)[:k]
+    return candidates[np.argsort(-scores[candidates])]
+
+# ----------------------------------------
+# Inverted-File (IVF) Index
+# ----------------------------------------
+
+class IVFIndex:
+    """
+    Coarse partition of the embedding matrix into `nlist` clusters by spherical
+    k-means. A query scores only the rows in the `nprobe` clusters nearest to
+    it, so the work per search grows with about nprobe * N / nlist rows instead
+    of N. Rows appended after the index was built are scanned exhaustively
+    until the next rebuild.
+    """
+
+    def __init__(self, centroids: np.ndarray, offsets: np.ndarray, rows: np.ndarray, built_rows: int):
+        self.centroids = centroids  # (nlist, dim) float32, unit length
+        self.offsets = offsets      # (nlist + 1,) start of each cluster in `rows`
+        self.rows = rows            # matrix row numbers grouped by cluster
+        self.built_rows = built_rows
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, nlist: Optional[int] = None, sample_size: int = 64000,
+              iterations: int = 10, seed: int = 0) -> "IVFIndex":
+        n = len(vectors)
+        nlist = nlist or max(1, min(int(4 * np.sqrt(n)), n // 39))
+        rng = np.random.default_rng(seed)
+
+        # Train centroids on a sample
+        sample = normalize(vectors[np.sort(rng.choice(n, size=min(n, max(sample_size, nlist)), replace=False))])
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)]
+        for _ in range(iterations):
+            assignment = _assign(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            empty = np.bincount(assignment, minlength=nlist) == 0
+            # Re-seed empty clusters from random sample points
+            sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+            centroids = normalize(sums)
+
+        # Assign every row, then group row numbers by cluster
+        assignment = _assign(vectors, centroids)
+        rows = np.argsort(assignment, kind="stable").astype(np.int64)
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=nlist))]).astype(np.int64)
+        return cls(centroids.astype(np.float32), offsets, rows, n)
+
+    def save(self, path: str) -> None:
+        temp_path = f"{path}.tmp.npz"
+        np.savez(temp_path, centroids=self.centroids, offsets=self.offsets, rows=self.rows, built_rows=self.built_rows)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "IVFIndex":
+        with np.load(path) as data:
+            return cls(data["centroids"], data["offsets"], data["rows"], int(data["built_rows"]))
+
+    def candidates(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        """Row numbers in the `nprobe` clusters closest to the query."""
+        nearest = _top_k(self.centroids @ query, nprobe)
+        return np.concatenate([self.rows[self.offsets[c]:self.offsets[c + 1]] for c in nearest])
+
+# ----------------------------------------
+# Append-Only Embedding Store
+# ----------------------------------------
+
+class EmbeddingStore:
+    """
+    Unit-length float16 embeddings in an append-only matrix file, with a
+    parallel file of test IDs. Both are memory-mapped for search. Appends from
+    several worker processes are serialized with a file lock; vectors are
+    written before IDs, so readers only ever see complete rows. Rows of deleted
+    tests stay in the matrix and are dropped when results are joined to the
+    database.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.vectors_path = os.path.join(root, "vectors.f16")
+        self.ids_path = os.path.join(root, "ids.i64")
+        self.meta_path = os.path.join(root, "meta.json")
+        self.index_path = os.path.join(root, "ivf.npz")
+        self._snapshot = (0, None, None)
+        self._index = (None, None)
+        self._lock = threading.Lock()
+
+    @property
+    def dim(self) -> Optional[int]:
+        try:
+            with open(self.meta_path) as f:
+                return json.load(f)["dim"]
+        except FileNotFoundError:
+            return None
+
+    @contextmanager
+    def _file_lock(self):
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, ".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def append(self, test_ids: Sequence[int], vectors: np.ndarray) -> None:
+        vectors = normalize(np.atleast_2d(vectors)).astype(VECTOR_DTYPE)
+        with self._file_lock():
+            dim = self.dim
+            if dim is None:
+                dim = vectors.shape[1]
+                with open(self.meta_path, "w") as f:
+                    json.dump({"dim": dim}, f)
+            elif vectors.shape[1] != dim:
+                raise ValueError(f"Embedding has {vectors.shape[1]} dimensions, store has {dim}")
+
+            # Drop a partial row left by an interrupted append
+            rows = _size(self.ids_path) // ID_DTYPE.itemsize
+            with open(self.vectors_path, "ab") as f:
+                f.truncate(rows * dim * VECTOR_DTYPE.itemsize)
+                f.write(vectors.tobytes())
+            with open(self.ids_path, "ab") as f:
+                f.write(np.asarray(test_ids, dtype=ID_DTYPE).tobytes())
+
+    def snapshot(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Memory-mapped (ids, vectors) of every complete row; remapped only when rows were added."""
+        dim = self.dim
+        if dim is None:
+            return np.empty(0, dtype=ID_DTYPE), np.empty((0, 0), dtype=VECTOR_DTYPE)
+        rows = min(
+            _size(self.ids_path) // ID_DTYPE.itemsize,
+            _size(self.vectors_path) // (dim * VECTOR_DTYPE.itemsize),
+        )
+        with self._lock:
+            if self._snapshot[0] != rows:
+                ids = np.memmap(self.ids_path, dtype=ID_DTYPE, mode="r", shape=(rows,)) if rows else np.empty(0, ID_DTYPE)
+                vectors = (np.memmap(self.vectors_path, dtype=VECTOR_DTYPE, mode="r", shape=(rows, dim))
+                           if rows else np.empty((0, dim), VECTOR_DTYPE))
+                self._snapshot = (rows, ids, vectors)
+            return self._snapshot[1], self._snapshot[2]
+
+    def existing_ids(self) -> np.ndarray:
+        return np.unique(self.snapshot()[0])
+
+    def vector_for(self, test_id: int) -> Optional[np.ndarray]:
+        ids, vectors = self.snapshot()
+        rows = np.flatnonzero(ids == test_id)
+        return vectors[rows[-1]].astype(np.float32) if len(rows) else None
+
+    def index(self) -> Optional[IVFIndex]:
+        """The IVF index on disk, reloaded when it has been rebuilt."""
+        try:
+            mtime = os.path.getmtime(self.index_path)
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            if self._index[0] != mtime:
+                self._index = (mtime, IVFIndex.load(self.index_path))
+            return self._index[1]
+
+    def build_index(self, nlist: Optional[int] = None) -> IVFIndex:
+        _, vectors = self.snapshot()
+        index = IVFIndex.build(vectors, nlist)
+        index.save(self.index_path)
+        return index
+
+    def search(self, query: np.ndarray, k: int, allowed_ids: Optional[Iterable[int]] = None,
+               exclude_ids: Iterable[int] = ()) -> List[Tuple[int, float]]:
+        """
+        Top-k (test_id, cosine similarity) for a query embedding. With
+        `allowed_ids`, only those tests are scored, exactly. Otherwise the IVF
+        index is used once the matrix has SIMILARITY_INDEX_MIN_ROWS rows and an
+        index has been built, and every row is scanned before that.
+        """
+        ids, vectors = self.snapshot()
+        query = normalize(query)
+        exclude = np.fromiter(exclude_ids, dtype=ID_DTYPE)
+
+        if allowed_ids is not None:
+            rows = np.flatnonzero(np.isin(ids, np.fromiter(allowed_ids, dtype=ID_DTYPE)))
+        else:
+            index = self.index() if len(ids) >= settings.SIMILARITY_INDEX_MIN_ROWS else None
+            if index is not None:
+                tail = np.arange(min(index.built_rows, len(ids)), len(ids))
+                rows = np.concatenate([index.candidates(query, settings.SIMILARITY_NPROBE), tail])
+            else:
+                rows = None
+
+        if rows is None:
+            scores = np.empty(len(ids), dtype=np.float32)
+            for start in range(0, len(ids), SCAN_CHUNK_ROWS):
+                scores[start:start + SCAN_CHUNK_ROWS] = vectors[start:start + SCAN_CHUNK_ROWS].astype(np.float32) @ query
+            rows = np.arange(len(ids))
+        else:
+            # Sorted gathers read the memory map front to back
+            rows = np.sort(rows)
+            scores = np.concatenate([
+                vectors[rows[start:start + SCAN_CHUNK_ROWS]].astype(np.float32) @ query
+                for start in range(0, len(rows), SCAN_CHUNK_ROWS)
+            ] or [np.empty(0, dtype=np.float32)])
+
+        if len(exclude):
+            scores[np.isin(ids[rows], exclude)] = -np.inf
+
+        # Over-fetch a little so re-embedded tests (duplicate rows) can be collapsed
+        results, seen = [], set()
+        for position in _top_k(scores, k * 2):
+            test_id = int(ids[rows[position]])
+            if scores[position] == -np.inf or test_id in seen:
+                continue
+            seen.add(test_id)
+            results.append((test_id, float(scores[position])))
+            if len(results) == k:
+                break
+        return results
+
+embedding_store = EmbeddingStore(settings.EMBEDDINGS_DIR)
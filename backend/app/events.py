@@ -0,0 +1,264 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+import redis
+from prometheus_client import Counter, Gauge
+
+from backend.app.config import settings
+
+# Set up logging
+logger = logging.getLogger("events")
+
+EVENT_CONNECTIONS = Gauge(
+    "ldcs_event_connections",
+    "Open event stream connections",
+    multiprocess_mode="livesum",
+)
+EVENTS_PUBLISHED = Counter(
+    "ldcs_events_published_total",
+    "Events published to the broker",
+    ["type"],
+)
+EVENT_CONSUMERS_DROPPED = Counter(
+    "ldcs_event_consumers_dropped_total",
+    "Event stream connections closed because their buffer overflowed",
+)
+
+def user_channel(user_id: int) -> str:
+    """Channel carrying events for every patient a user owns."""
+    return f"user:{user_id}"
+
+def patient_channel(patient_id: int) -> str:
+    return f"patient:{patient_id}"
+
+# ----------------------------------------
+# In-Process Pub/Sub
+# ----------------------------------------
+
+class Subscription:
+    """
+    One connection's bounded event buffer, living on the event loop that serves
+    the connection. When the consumer falls `buffer_size` events behind it is
+    dropped: the buffer is discarded and `dropped` is set, so the connection is
+    closed instead of holding memory for a client that cannot keep up.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, buffer_size: int):
+        self.loop = loop
+        self.queue: "asyncio.Queue[str]" = asyncio.Queue(maxsize=buffer_size)
+        self.dropped = asyncio.Event()
+        self.channels: Set[str] = set()
+
+    def offer(self, message: str) -> None:
+        """Queues a message; must run on `self.loop`."""
+        if self.dropped.is_set():
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            EVENT_CONSUMERS_DROPPED.inc()
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.dropped.set()
+
+class EventHub:
+    """Routes messages to the subscriptions of this process's open connections."""
+
+    def __init__(self, buffer_size: int):
+        self.buffer_size = buffer_size
+        self._channels: Dict[str, Set[Subscription]] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, channels: Iterable[str]) -> Subscription:
+        """Creates a subscription on the running event loop."""
+        subscription = Subscription(asyncio.get_running_loop(), self.buffer_size)
+        for channel in channels:
+            self.add_channel(subscription, channel)
+        EVENT_CONNECTIONS.inc()
+        return subscription
+
+    def add_channel(self, subscription: Subscription, channel: str) -> None:
+        with self._lock:
+            self._channels.setdefault(channel, set()).add(subscription)
+            subscription.channels.add(channel)
+
+    def remove_channel(self, subscription: Subscription, channel: str) -> None:
+        with self._lock:
+            subscribers = self._channels.get(channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._channels[channel]
+            subscription.channels.discard(channel)
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        for channel in list(subscription.channels):
+            self.remove_channel(subscription, channel)
+        EVENT_CONNECTIONS.dec()
+
+    def dispatch(self, channels: Iterable[str], message: str) -> None:
+        """Delivers a serialized event once to each subscription on any of the channels. Thread-safe."""
+        with self._lock:
+            targets = set()
+            for channel in channels:
+                targets.update(self._channels.get(channel, ()))
+        for subscription in targets:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.offer, message)
+            except RuntimeError:
+                # The connection's event loop has already shut down
+                pass
+
+# ----------------------------------------
+# Brokers (between worker processes)
+# ----------------------------------------
+
+class EventBroker(ABC):
+    """Carries published events to every worker process, each of which hands them to its hub."""
+
+    @abstractmethod
+    def publish(self, message: str) -> None:
+        ...
+
+    @abstractmethod
+    def start(self, deliver: Callable[[str], None]) -> None:
+        ...
+
+    def stop(self) -> None:
+        pass
+
+class LocalEventBroker(EventBroker):
+    """
+    Stand-in for redis that delivers within the current process only, for
+    development, tests and single-worker deployments.
+    """
+
+    def __init__(self):
+        self._deliver: Optional[Callable[[str], None]] = None
+
+    def publish(self, message: str) -> None:
+        if self._deliver is not None:
+            self._deliver(message)
+
+    def start(self, deliver: Callable[[str], None]) -> None:
+        self._deliver = deliver
+
+class RedisEventBroker(EventBroker):
+    """
+    Redis pub/sub on one channel. Each worker listens from a background thread
+    and reconnects after errors; events published while a worker is
+    disconnected are not replayed, so clients should refetch on reconnect.
+    """
+
+    def __init__(self, client: redis.Redis, channel: str = "ldcs:events"):
+        self.client = client
+        self.channel = channel
+        self._stop = threading.Event()
+        self._thread = None
+
+    def publish(self, message: str) -> None:
+        self.client.publish(self.channel, message)
+
+    def start(self, deliver: Callable[[str], None]) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._listen, args=(deliver,), name="event-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(5.0)
+        self._thread = None
+
+    def _listen(self, deliver: Callable[[str], None]) -> None:
+        while not self._stop.is_set():
+            pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(self.channel)
+                while not self._stop.is_set():
+                    message = pubsub.get_message(timeout=1.0)
+                    if message is not None:
+                        deliver(message["data"].decode())
+            except Exception as e:
+                logger.warning(f"Event listener error, reconnecting: {e}")
+                time.sleep(1.0)
+            finally:
+                pubsub.close()
+
+def broker_name() -> str:
+    """EVENTS_BROKER, or when unset "redis" if REDIS_URL is configured and "local" otherwise."""
+    return settings.EVENTS_BROKER or ("redis" if settings.REDIS_URL else "local")
+
+def create_broker() -> EventBroker:
+    """Builds the broker selected by broker_name() ("local" or "redis", which uses REDIS_URL)."""
+    name = broker_name()
+    if name == "redis":
+        return RedisEventBroker(redis.Redis.from_url(settings.REDIS_URL))
+    if name == "local":
+        return LocalEventBroker()
+    raise RuntimeError(f"Unknown events broker: {name}")
+
+# ----------------------------------------
+# Event Bus
+# ----------------------------------------
+
+class EventBus:
+    """
+    Publishes compact JSON events after the change they describe has committed.
+    Publishing never fails the request: a broker error only costs clients a
+    push, and they still see the change on their next read.
+    """
+
+    def __init__(self, broker: EventBroker, buffer_size: int):
+        self.broker = broker
+        self.hub = EventHub(buffer_size)
+
+    def start(self) -> None:
+        self.broker.start(self._receive)
+
+    def stop(self) -> None:
+        self.broker.stop()
+
+    def publish(self, channels: List[str], event: dict) -> None:
+        try:
+            self.broker.publish(json.dumps({"channels": channels, "event": event}))
+            EVENTS_PUBLISHED.labels(event["type"]).inc()
+        except Exception as e:
+            logger.warning(f"Failed to publish {event['type']} event: {e}")
+
+    def _receive(self, message: str) -> None:
+        try:
+            data = json.loads(message)
+        except ValueError:
+            logger.warning("Ignoring malformed event message")
+            return
+        # Serialized once here, then shared by every connection
+        self.hub.dispatch(data["channels"], json.dumps(data["event"], separators=(",", ":")))
+
+event_bus = EventBus(create_broker(), settings.EVENTS_BUFFER_SIZE)
+
+def publish_test_created(test, owner_id: int) -> None:
+    event_bus.publish([user_channel(owner_id), patient_channel(test.patient_id)], {
+        "type": "test.created",
+        "patient_id": test.patient_id,
+        "test_id": test.id,
+        "result": test.result,
+        "confidence": test.confidence,
+        "date_conducted": test.date_conducted.strftime('%Y-%m-%d %H:%M:%S'),
+    })
+
+def publish_patient_updated(patient) -> None:
+    event_bus.publish([user_channel(patient.user_id), patient_channel(patient.id)], {
+        "type": "patient.updated",
+        "patient_id": patient.id,
+        "name": patient.name,
+        "updated_at": patient.updated_at.strftime('%Y-%m-%d %H:%M:%S') if patient.updated_at else None,
+    })
@@ -0,0 +1,233 @@
+import csv
+import io
+import json
+import logging
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import select
+
+from backend.app import helpers
+from backend.app.models import Patient, Test
+
+# Set up logging
+logger = logging.getLogger("export")
+
+# Rows fetched per round trip from the server-side cursor
+DEFAULT_BATCH_SIZE = 1000
+
+PATIENT_COLUMNS = [
+    'id', 'user_id', 'name', 'date_of_birth', 'gender', 'address', 'phone',
+    'emergency_contact', 'insurance_details', 'blood_type', 'allergies', 'notes',
+    'created_at', 'updated_at',
+]
+
+TEST_COLUMNS = [
+    'id', 'patient_id', 'user_id', 'date_conducted', 'result', 'confidence',
+    'image_path', 'report_path', 'comments', 'created_at', 'updated_at',
+]
+
+PATIENT_SCHEMA = pa.schema([
+    ('id', pa.int64()), ('user_id', pa.int64()), ('name', pa.string()),
+    ('date_of_birth', pa.date32()), ('gender', pa.string()), ('address', pa.string()),
+    ('phone', pa.string()), ('emergency_contact', pa.string()), ('insurance_details', pa.string()),
+    ('blood_type', pa.string()), ('allergies', pa.string()), ('notes', pa.string()),
+    ('created_at', pa.timestamp('us')), ('updated_at', pa.timestamp('us')),
+])
+
+TEST_SCHEMA = pa.schema([
+    ('id', pa.int64()), ('patient_id', pa.int64()), ('user_id', pa.int64()),
+    ('date_conducted', pa.timestamp('us')), ('result', pa.string()), ('confidence', pa.float64()),
+    ('image_path', pa.string()), ('report_path', pa.string()), ('comments', pa.string()),
+    ('created_at', pa.timestamp('us')), ('updated_at', pa.timestamp('us')),
+])
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+# ----------------------------------------
+# Column-Oriented Batch Readers
+# ----------------------------------------
+
+def get_class_names() -> List[str]:
+    """
+    Returns class names ordered by class index, using the loaded class dictionary
+    when the model is up and reading the CSV otherwise.
+    """
+    class_indices = helpers.class_indices or helpers.load_class_dict()
+    return [class_indices[i] for i in sorted(class_indices)]
+
+def prediction_column(class_name: str) -> str:
+    return f"pred_{class_name.strip().lower().replace(' ', '_').replace('-', '_')}"
+
+def test_schema(class_names: List[str]) -> pa.Schema:
+    """Tests schema with one float column per class appended."""
+    return pa.schema(list(TEST_SCHEMA) + [(prediction_column(name), pa.float64()) for name in class_names])
+
+def _stream(db, statement, batch_size: int) -> Iterator[list]:
+    """Runs a statement on a server-side cursor and yields lists of rows."""
+    result = db.execute(statement.execution_options(stream_results=True, yield_per=batch_size))
+    for partition in result.partitions(batch_size):
+        yield partition
+
+def _apply_filters(statement, model, date_column, user_id=None, date_from=None, date_to=None):
+    if user_id is not None:
+        statement = statement.where(model.user_id == user_id)
+    if date_from is not None:
+        statement = statement.where(date_column >= date_from)
+    if date_to is not None:
+        statement = statement.where(date_column < date_to)
+    return statement.order_by(model.id)
+
+def iter_patient_batches(
+    db,
+    user_id: Optional[int] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> Iterator[Dict[str, list]]:
+    """
+    Yields the patients table as column-oriented batches ({column: [values]}).
+    Dates filter on the patient's creation time.
+    """
+    statement = select(*[getattr(Patient, name) for name in PATIENT_COLUMNS])
+    statement = _apply_filters(statement, Patient, Patient.created_at, user_id, date_from, date_to)
+
+    for rows in _stream(db, statement, batch_size):
+        yield {name: [row[i] for row in rows] for i, name in enumerate(PATIENT_COLUMNS)}
+
+def iter_test_batches(
+    db,
+    user_id: Optional[int] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    class_names: Optional[List[str]] = None,
+) -> Iterator[Dict[str, list]]:
+    """
+    Yields the tests table as column-oriented batches, with the stored predictions
+    expanded into one float column per class. Dates filter on date_conducted.
+    """
+    class_names = class_names or get_class_names()
+    pred_columns = [prediction_column(name) for name in class_names]
+    position = {name: i for i, name in enumerate(class_names)}
+
+    statement = select(*[getattr(Test, name) for name in TEST_COLUMNS], Test.predictions)
+    statement = _apply_filters(statement, Test, Test.date_conducted, user_id, date_from, date_to)
+
+    for rows in _stream(db, statement, batch_size):
+        batch = {name: [row[i] for row in rows] for i, name in enumerate(TEST_COLUMNS)}
+        scores = [[None] * len(rows) for _ in class_names]
+
+        for r, row in enumerate(rows):
+            try:
+                predictions = json.loads(row[-1]) if row[-1] else []
+            except (json.JSONDecodeError, TypeError):
+                predictions = []
+            for label, confidence in predictions:
+                if label in position:
+                    scores[position[label]][r] = float(confidence)
+
+        batch.update(zip(pred_columns, scores))
+        yield batch
+
+# ----------------------------------------
+# CSV and Parquet Writers
+# ----------------------------------------
+
+def iter_csv(batches: Iterator[Dict[str, list]], columns: List[str]) -> Iterator[bytes]:
+    """Encodes batches as CSV, yielding the header and then one chunk of bytes per batch."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue().encode('utf-8')
+    buffer.seek(0)
+    buffer.truncate()
+
+    for batch in batches:
+        writer.writerows(zip(*(batch[name] for name in columns)))
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+
+class _DrainableSink:
+    """
+    Write-only file object for ParquetWriter whose contents can be taken out
+    after every row group, so the full file is never held in memory.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+def iter_parquet(batches: Iterator[Dict[str, list]], schema: pa.Schema) -> Iterator[bytes]:
+    """Encodes batches as Parquet, writing one row group per batch."""
+    sink = _DrainableSink()
+    writer = pq.ParquetWriter(sink, schema)
+
+    try:
+        for batch in batches:
+            writer.write_batch(pa.RecordBatch.from_pydict(batch, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+def export_patients(
+    db,
+    fmt: str,
+    user_id: Optional[int] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> Iterator[bytes]:
+    """Streams the patients table encoded as CSV or Parquet."""
+    batches = iter_patient_batches(db, user_id, date_from, date_to, batch_size)
+    if fmt == 'csv':
+        return iter_csv(batches, PATIENT_COLUMNS)
+    if fmt == 'parquet':
+        return iter_parquet(batches, PATIENT_SCHEMA)
+    raise ValueError(f"Unsupported export format: {fmt}")
+
+def export_tests(
+    db,
+    fmt: str,
+    user_id: Optional[int] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> Iterator[bytes]:
+    """Streams the tests table, with per-class prediction columns, as CSV or Parquet."""
+    class_names = get_class_names()
+    schema = test_schema(class_names)
+    batches = iter_test_batches(db, user_id, date_from, date_to, batch_size, class_names)
+    if fmt == 'csv':
+        return iter_csv(batches, schema.names)
+    if fmt == 'parquet':
+        return iter_parquet(batches, schema)
+    raise ValueError(f"Unsupported export format: {fmt}")
@@ -20,6 +20,12 @@ from reportlab.lib.enums import TA_CENTER
 from passlib.context import CryptContext
 
 from backend.app.models import Test
+from backend.app.derivatives import ensure_derivatives
+from backend.app.metrics import INFERENCE_QUEUE_DEPTH, record_model_memory
+from backend.app.profiling import span
+from backend.app.dicom import DICOM_EXTENSIONS, dicom_to_model_input, is_dicom
+from backend.app.inference import InferenceProfile, compile_predict, configure_runtime, with_embedding_output
+from backend.app.config import settings
 
 # Set up logging
 logger = logging.getLogger("helpers")
@@ -27,8 +33,9 @@ logger = logging.getLogger("helpers")
 # Password hashing context using bcrypt
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-# Initialize model and class indices as global variables
+# Initialize model, its predict function and class indices as global variables
 model = None
+predict_fn = None
 class_indices = {}
 
 # ----------------------------------------
@@ -82,32 +89,47 @@ def cbam_block(input_tensor, ratio=8):
 # ----------------------------------------
 
 def allowed_file(filename: str) -> bool:
-    ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
+    ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'} | DICOM_EXTENSIONS
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+MODEL_DIR = os.path.join(os.path.dirname(__file__), 'model')
+MODEL_PATH = os.path.join(MODEL_DIR, 'XRayClassifier-CBAM-EfficientNetB0-99.61.h5')
+CLASS_DICT_PATH = os.path.join(MODEL_DIR, 'XRayClassifier-CBAM-EfficientNetB0-class_dict.csv')
+
+def load_class_dict(class_dict_path: str = CLASS_DICT_PATH) -> dict:
+    """
+    Reads the class dictionary CSV and returns a mapping of class index to class name.
+    Does not touch the model, so it is safe to call from CLI tools.
+    """
+    try:
+        class_dict = pd.read_csv(class_dict_path)
+        return dict(zip(class_dict['class_index'], class_dict['class']))
+    except Exception as e:
+        logger.error(f"Error loading class dictionary: {e}")
+        raise RuntimeError(f"Error loading class dictionary: {e}")
+
 def load_model_and_class_dict():
-    global model, class_indices
-    base_path = os.path.dirname(__file__)
-    model_path = os.path.join(base_path, 'model', 'XRayClassifier-CBAM-EfficientNetB0-99.61.h5')
-    class_dict_path = os.path.join(base_path, 'model', 'XRayClassifier-CBAM-EfficientNetB0-class_dict.csv')
+    global model, predict_fn, class_indices
 
     try:
-        model = load_model(model_path, custom_objects={'cbam_block': cbam_block})
+        profile = InferenceProfile.from_settings()
+        configure_runtime(profile)
+        model = load_model(MODEL_PATH, custom_objects={'cbam_block': cbam_block})
+        # One forward pass yields both the class scores and the embedding for similar-case search
+        predict_fn = compile_predict(with_embedding_output(model, settings.EMBEDDING_LAYER or None), profile)
+        record_model_memory(model)
         logger.info("Model loaded successfully.")
     except Exception as e:
         logger.error(f"Error loading model: {e}")
         raise RuntimeError(f"Error loading model: {e}")
 
-    try:
-        class_dict = pd.read_csv(class_dict_path)
-        class_indices = dict(zip(class_dict['class_index'], class_dict['class']))
-        logger.info("Class dictionary loaded successfully.")
-    except Exception as e:
-        logger.error(f"Error loading class dictionary: {e}")
-        raise RuntimeError(f"Error loading class dictionary: {e}")
+    class_indices = load_class_dict()
+    logger.info("Class dictionary loaded successfully.")
 
 def preprocess_image(img_path: str) -> np.ndarray:
     try:
+        if is_dicom(img_path):
+            return dicom_to_model_input(img_path)
         img = keras_image.load_img(img_path, target_size=(224, 224))
         img_array = keras_image.img_to_array(img)
         img_array = np.expand_dims(img_array, axis=0)
@@ -117,17 +139,21 @@ def preprocess_image(img_path: str) -> np.ndarray:
         logger.error(f"Error processing image {img_path}: {e}")
         raise RuntimeError(f"Error processing image {img_path}")
 
-def make_prediction(processed_image: np.ndarray):
-    global model
+def predict_with_embedding(processed_image: np.ndarray):
+    """Returns the class predictions and the pooled feature vector of the first image."""
     try:
-        prediction = model.predict(processed_image)
+        with INFERENCE_QUEUE_DEPTH.track_inprogress(), span("model.predict", batch_size=len(processed_image)):
+            prediction, embeddings = predict_fn(processed_image)
         all_predictions = [(class_indices[i], prediction[0][i]) for i in range(len(class_indices))]
         logger.info(f"All predictions: {all_predictions}")
-        return all_predictions
+        return all_predictions, embeddings[0]
     except Exception as e:
         logger.error(f"Prediction failed: {e}")
         raise RuntimeError("Prediction failed")
 
+def make_prediction(processed_image: np.ndarray):
+    return predict_with_embedding(processed_image)[0]
+
 # ----------------------------------------
 # Store New Test Function
 # ----------------------------------------
@@ -138,8 +164,8 @@ def store_new_test(db, user, patient, image, image_path):
     preprocessing, prediction, and saving to the database.
     """
     try:
-        # Preprocess image for prediction
-        processed_image = preprocess_image(image_path)
+        # Load the cached model input, decoding the image only if it was never cached
+        processed_image = ensure_derivatives(image_path)
 
         # Make predictions
         predictions = make_prediction(processed_image)
@@ -212,7 +238,8 @@ def visualize_prediction(img_path, predictions):
                      fontsize=12, color='white', bbox=dict(facecolor='blue', alpha=0.7))
 
         # Save the plot to a BytesIO buffer
-        plt.savefig(buffer, format='png')
+        with span("matplotlib.savefig"):
+            plt.savefig(buffer, format='png')
         plt.close()
         buffer.seek(0)  # Rewind the buffer for reading
         return buffer
@@ -291,6 +318,7 @@ def generate_pdf_report(test, prediction_image):
         canvas.drawString(inch, 0.75 * inch, footer_text)
         canvas.restoreState()
 
-    doc.build(story, onFirstPage=footer, onLaterPages=footer)
+    with span("reportlab.build", test_id=test.id):
+        doc.build(story, onFirstPage=footer, onLaterPages=footer)
     buffer.seek(0)
     return buffer
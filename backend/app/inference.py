@@ -0,0 +1,141 @@
+import logging
+import os
+from dataclasses import asdict, dataclass
+from typing import Callable, Optional
+
+import numpy as np
+import tensorflow as tf
+
+from backend.app.config import settings
+
+# Set up logging
+logger = logging.getLogger("inference")
+
+INPUT_SHAPE = (224, 224, 3)
+
+# Layers making up a classifier head on top of the pooled features
+HEAD_LAYERS = (
+    tf.keras.layers.Dense,
+    tf.keras.layers.Dropout,
+    tf.keras.layers.BatchNormalization,
+    tf.keras.layers.Activation,
+)
+
+# ----------------------------------------
+# CPU Execution Profile
+# ----------------------------------------
+
+@dataclass(frozen=True)
+class InferenceProfile:
+    """
+    How TensorFlow executes the model on CPU. Thread counts of 0 keep TensorFlow's
+    default of one thread per core, which oversubscribes the host when several
+    workers (and the FastAPI threadpool) share it.
+    """
+    intra_op_threads: int = 0
+    inter_op_threads: int = 0
+    compiled: bool = True
+    xla: bool = False
+    bf16: bool = False
+
+    @classmethod
+    def from_settings(cls) -> "InferenceProfile":
+        return cls(
+            intra_op_threads=settings.INFERENCE_INTRA_OP_THREADS,
+            inter_op_threads=settings.INFERENCE_INTER_OP_THREADS,
+            compiled=settings.INFERENCE_COMPILED_PREDICT,
+            xla=settings.INFERENCE_XLA,
+            bf16=settings.INFERENCE_BF16,
+        )
+
+def cpu_supports_bf16() -> bool:
+    """True when the CPU has native bfloat16 instructions (AVX512-BF16 or AMX)."""
+    try:
+        with open("/proc/cpuinfo") as f:
+            flags = next((line for line in f if line.startswith("flags")), "").split()
+    except OSError:
+        return False
+    return "avx512_bf16" in flags or "amx_bf16" in flags
+
+def onednn_enabled() -> bool:
+    # Read by TensorFlow when it is imported; on by default on x86 Linux since 2.9
+    return os.getenv("TF_ENABLE_ONEDNN_OPTS", "1") != "0"
+
+def configure_runtime(profile: InferenceProfile) -> None:
+    """
+    Applies the thread topology and graph rewrites. Must run before TensorFlow
+    executes its first op; later calls keep the existing runtime and log a warning.
+    """
+    try:
+        if profile.intra_op_threads:
+            tf.config.threading.set_intra_op_parallelism_threads(profile.intra_op_threads)
+        if profile.inter_op_threads:
+            tf.config.threading.set_inter_op_parallelism_threads(profile.inter_op_threads)
+    except RuntimeError as e:
+        logger.warning(f"TensorFlow runtime already initialized, thread settings ignored: {e}")
+
+    if profile.bf16:
+        if onednn_enabled() and cpu_supports_bf16():
+            # oneDNN's grappler pass rewrites eligible ops in compiled graphs to bfloat16
+            tf.config.optimizer.set_experimental_options({"auto_mixed_precision_onednn_bfloat16": True})
+        else:
+            logger.warning("bfloat16 requested but oneDNN is disabled or the CPU lacks bf16 support; using float32")
+
+    logger.info(f"Inference profile: {asdict(profile)}, oneDNN {'on' if onednn_enabled() else 'off'}")
+
+# ----------------------------------------
+# Embedding Output
+# ----------------------------------------
+
+def embedding_layer(model, name: Optional[str] = None):
+    """
+    The layer producing the pooled feature vector: the named layer, or else the
+    last layer with a flat (batch, features) output that is not part of the
+    classifier head.
+    """
+    if name:
+        return model.get_layer(name)
+    for layer in reversed(model.layers):
+        if isinstance(layer, tf.keras.layers.InputLayer):
+            break
+        if not isinstance(layer, HEAD_LAYERS) and len(layer.output.shape) == 2:
+            return layer
+    raise ValueError("Model has no pooled feature layer; set EMBEDDING_LAYER")
+
+def with_embedding_output(model, layer_name: Optional[str] = None):
+    """Same weights, two outputs: class scores and the pooled features, from one forward pass."""
+    layer = embedding_layer(model, layer_name)
+    logger.info(f"Embeddings from layer '{layer.name}' ({layer.output.shape[-1]} dimensions)")
+    return tf.keras.Model(inputs=model.inputs, outputs=[model.output, layer.output])
+
+# ----------------------------------------
+# Predict Path
+# ----------------------------------------
+
+def compile_predict(model, profile: InferenceProfile) -> Callable[[np.ndarray], np.ndarray]:
+    """
+    Returns a function mapping a (batch, 224, 224, 3) float32 array to the
+    model's output (a tuple of arrays for multi-output models). The compiled path traces the model once as a tf.function with a
+    fixed input signature, optionally XLA-compiled, which avoids the per-call
+    setup of `model.predict`. The function is warmed up here so the first
+    request does not pay for tracing.
+    """
+    if not profile.compiled:
+        return lambda batch: model.predict(batch, verbose=0)
+
+    @tf.function(
+        input_signature=[tf.TensorSpec(shape=(None,) + INPUT_SHAPE, dtype=tf.float32)],
+        jit_compile=profile.xla,
+        reduce_retracing=True,
+    )
+    def serve(batch):
+        return model(batch, training=False)
+
+    def predict(batch: np.ndarray) -> np.ndarray:
+        outputs = serve(tf.convert_to_tensor(np.asarray(batch, dtype=np.float32)))
+        if isinstance(outputs, (list, tuple)):
+            return tuple(output.numpy() for output in outputs)
+        return outputs.numpy()
+
+    predict(np.zeros((1,) + INPUT_SHAPE, dtype=np.float32))
+    return predict
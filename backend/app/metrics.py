@@ -0,0 +1,140 @@
+import logging
+import os
+import time
+
+from anyio.to_thread import current_default_thread_limiter
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, multiprocess
+
+# Set up logging
+logger = logging.getLogger("metrics")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+REQUEST_LATENCY = Histogram(
+    "ldcs_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+STAGE_LATENCY = Histogram(
+    "ldcs_stage_duration_seconds",
+    "Latency of individual stages inside a request pipeline",
+    ["pipeline", "stage"],
+    buckets=LATENCY_BUCKETS,
+)
+INFERENCE_QUEUE_DEPTH = Gauge(
+    "ldcs_inference_queue_depth",
+    "Inference calls waiting for or running on the model",
+    multiprocess_mode="livesum",
+)
+MODEL_MEMORY_BYTES = Gauge(
+    "ldcs_model_memory_bytes",
+    "Bytes held by the loaded model's weights",
+    multiprocess_mode="liveall",
+)
+THREADPOOL_IN_USE = Gauge(
+    "ldcs_threadpool_in_use",
+    "Worker threads currently running sync endpoints and dependencies",
+)
+THREADPOOL_CAPACITY = Gauge(
+    "ldcs_threadpool_capacity",
+    "Size of the threadpool that runs sync endpoints",
+)
+CACHE_EVENTS = Counter(
+    "ldcs_cache_events_total",
+    "Cache lookups by cache and outcome (hit or miss)",
+    ["cache", "result"],
+)
+
+def metrics_registry():
+    """
+    Registry served at /metrics. Under the multi-worker server each process writes
+    its samples to PROMETHEUS_MULTIPROC_DIR and they are aggregated at scrape time.
+    """
+    if not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+# ----------------------------------------
+# Stage Timers
+# ----------------------------------------
+
+class stage_timer:
+    """
+    Context manager recording how long a pipeline stage took:
+
+        with stage_timer("new_test", "inference"):
+            predictions = make_prediction(processed_image)
+
+    Label children are cached per (pipeline, stage), so recording costs one
+    perf_counter pair and a bucket increment.
+    """
+
+    _children = {}
+
+    def __init__(self, pipeline: str, stage: str):
+        key = (pipeline, stage)
+        child = self._children.get(key)
+        if child is None:
+            child = self._children[key] = STAGE_LATENCY.labels(pipeline, stage)
+        self.child = child
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.child.observe(time.perf_counter() - self.started)
+        return False
+
+def record_cache(cache: str, hit: bool) -> None:
+    CACHE_EVENTS.labels(cache, "hit" if hit else "miss").inc()
+
+def record_model_memory(model) -> None:
+    MODEL_MEMORY_BYTES.set(sum(int(weight.shape.num_elements()) * weight.dtype.size for weight in model.weights))
+
+async def bind_threadpool_metrics() -> None:
+    """Reads threadpool usage from anyio's limiter at scrape time; must run on the event loop."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        # Callback gauges are not aggregated across worker processes
+        return
+    limiter = current_default_thread_limiter()
+    THREADPOOL_IN_USE.set_function(lambda: limiter.borrowed_tokens)
+    THREADPOOL_CAPACITY.set_function(lambda: limiter.total_tokens)
+
+# ----------------------------------------
+# Request Latency Middleware
+# ----------------------------------------
+
+class RequestMetricsMiddleware:
+    """
+    ASGI middleware timing every HTTP request, labelled by the matched route
+    template (e.g. /api/tests/{test_id}) so label cardinality stays bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] == "/metrics":
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        response_status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response_status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            REQUEST_LATENCY.labels(
+                scope["method"],
+                route.path if route is not None else "unmatched",
+                str(response_status[0]),
+            ).observe(time.perf_counter() - started)
@@ -1,5 +1,5 @@
 import json
-from sqlalchemy import Column, Date, Integer, String, Boolean, Float, ForeignKey, DateTime, Text, Enum
+from sqlalchemy import Column, Date, Integer, String, Boolean, Float, ForeignKey, DateTime, Text, Enum, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from .database import Base
 from datetime import datetime
@@ -65,12 +65,13 @@ class Patient(Base):
     insurance_details = Column(Text, nullable=True)
     blood_type = Column(Enum('A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-', name='blood_type_enum'))
     allergies = Column(Text, nullable=True)
-    medical_history = relationship('MedicalHistory', back_populates='patient', cascade="all, delete-orphan")
+    # Children are removed by ON DELETE CASCADE in the database (see cleanup.delete_patients)
+    medical_history = relationship('MedicalHistory', back_populates='patient', cascade="all, delete-orphan", passive_deletes=True)
     notes = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     user = relationship('User', back_populates='patients')
-    tests = relationship('Test', back_populates='patient', cascade="all, delete-orphan")
+    tests = relationship('Test', back_populates='patient', cascade="all, delete-orphan", passive_deletes=True)
 
     def to_dict(self) -> Dict[str, Optional[str]]:
         """Return a dictionary representation of the patient."""
@@ -96,7 +97,7 @@ class MedicalHistory(Base):
     __tablename__ = 'medical_histories'
 
     id = Column(Integer, primary_key=True, index=True)
-    patient_id = Column(Integer, ForeignKey('patients.id'), nullable=False)
+    patient_id = Column(Integer, ForeignKey('patients.id', ondelete='CASCADE'), nullable=False, index=True)
     condition = Column(String, nullable=False)  
     description = Column(Text, nullable=True) 
     date_diagnosed = Column(Date, nullable=True)
@@ -117,14 +118,16 @@ class MedicalHistory(Base):
 
 class Test(Base):
     __tablename__ = 'tests'
+    # Serves the latest test per patient (see get_patients)
+    __table_args__ = (Index('ix_tests_patient_date', 'patient_id', 'date_conducted'),)
 
     id = Column(Integer, primary_key=True, index=True)
-    patient_id = Column(Integer, ForeignKey('patients.id'), nullable=False)
+    patient_id = Column(Integer, ForeignKey('patients.id', ondelete='CASCADE'), nullable=False)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     date_conducted = Column(DateTime, default=datetime.utcnow)
     result = Column(String, nullable=False)
     confidence = Column(Float, nullable=False)
-    image_path = Column(String, nullable=False)
+    image_path = Column(String, nullable=False, index=True)
     report_path = Column(String, nullable=True)
     predictions = Column(Text, nullable=True)  # New column for storing all predictions as JSON
     comments = Column(Text, nullable=True)
@@ -174,3 +177,122 @@ class UserActivity(Base):
             'timestamp': self.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
             'details': self.details,
         }
+
+
+class StoredBlob(Base):
+    __tablename__ = 'stored_blobs'
+
+    key = Column(String, primary_key=True)  # Content-addressed key, e.g. "ab/cd/<sha256>.png"
+    size = Column(Integer, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=1, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    def to_dict(self) -> Dict[str, Optional[str]]:
+        """Return a dictionary representation of the stored blob."""
+        return {
+            'key': self.key,
+            'size': self.size,
+            'ref_count': self.ref_count,
+            'created_at': self.created_at,
+        }
+
+
+class PredictionRecord(Base):
+    __tablename__ = 'test_predictions'
+    __table_args__ = (UniqueConstraint('test_id', 'model_version', name='uq_test_predictions_test_version'),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    test_id = Column(Integer, ForeignKey('tests.id', ondelete='CASCADE'), nullable=False, index=True)
+    model_version = Column(String, nullable=False, index=True)
+    result = Column(String, nullable=False)
+    confidence = Column(Float, nullable=False)
+    predictions = Column(Text, nullable=False)  # All class predictions as JSON, like Test.predictions
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    def to_dict(self) -> Dict[str, Optional[str]]:
+        """Return a dictionary representation of the prediction record."""
+        try:
+            predictions = json.loads(self.predictions) if self.predictions else None
+        except (json.JSONDecodeError, TypeError):
+            predictions = None
+        return {
+            'id': self.id,
+            'test_id': self.test_id,
+            'model_version': self.model_version,
+            'result': self.result,
+            'confidence': self.confidence,
+            'predictions': predictions,
+            'created_at': self.created_at,
+        }
+
+
+class BackfillCheckpoint(Base):
+    __tablename__ = 'backfill_checkpoints'
+
+    model_version = Column(String, primary_key=True)
+    last_test_id = Column(Integer, nullable=False, default=0)
+    processed = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class CacheVersion(Base):
+    __tablename__ = 'cache_versions'
+
+    key = Column(String, primary_key=True)  # Cached resource, e.g. "patient:42" or "test:7"
+    version = Column(Integer, nullable=False, default=0)
+
+    def to_dict(self) -> Dict[str, Optional[str]]:
+        """Return a dictionary representation of the cache version."""
+        return {
+            'key': self.key,
+            'version': self.version,
+        }
+
+
+class ArchivedBlob(Base):
+    __tablename__ = 'archived_blobs'
+
+    key = Column(String, primary_key=True)  # Blob key, or a legacy ./uploads path
+    pack = Column(String, nullable=False, index=True)  # Storage key of the pack file holding it
+    offset = Column(Integer, nullable=False)
+    length = Column(Integer, nullable=False)
+    codec = Column(String, nullable=False)  # How the bytes were recompressed, e.g. "lzma" or "webp:L:<sha256 of the restored PNG>"
+    original_size = Column(Integer, nullable=False)
+    hot_deleted = Column(Boolean, nullable=False, default=False)  # Hot copy removed after archiving
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
+    def to_dict(self) -> Dict[str, Optional[str]]:
+        """Return a dictionary representation of the archived blob."""
+        return {
+            'key': self.key,
+            'pack': self.pack,
+            'offset': self.offset,
+            'length': self.length,
+            'codec': self.codec,
+            'original_size': self.original_size,
+            'hot_deleted': self.hot_deleted,
+            'archived_at': self.archived_at,
+        }
+
+
+class ResumableUpload(Base):
+    __tablename__ = 'resumable_uploads'
+
+    id = Column(String, primary_key=True)  # Random hex ID, also the name of the partial file
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    patient_id = Column(Integer, ForeignKey('patients.id', ondelete='CASCADE'), nullable=False)
+    length = Column(Integer, nullable=False)  # Total size announced when the upload was created
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+    def to_dict(self) -> Dict[str, Optional[str]]:
+        """Return a dictionary representation of the resumable upload."""
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'patient_id': self.patient_id,
+            'length': self.length,
+            'created_at': self.created_at,
+            'expires_at': self.expires_at,
+        }
@@ -0,0 +1,236 @@
+import cProfile
+import fcntl
+import functools
+import inspect
+import io
+import json
+import logging
+import os
+import pstats
+import random
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Optional
+
+from fastapi.concurrency import run_in_threadpool
+from fastapi.routing import APIRoute
+from fastapi_jwt_auth import AuthJWT
+from sqlalchemy import event
+from starlette.requests import Request
+
+from backend.app.config import settings
+from backend.app.extensions import SessionLocal, engine
+from backend.app.models import User
+
+# Set up logging
+logger = logging.getLogger("profiling")
+
+PROFILE_HEADER = "x-profile"
+PROFILE_ID_HEADER = "X-Profile-Id"
+
+# ----------------------------------------
+# Request-Scoped Trace State
+# ----------------------------------------
+
+class RequestTrace:
+    """Spans and the profiler for one opted-in request."""
+
+    def __init__(self, method: str, path: str):
+        self.trace_id = uuid.uuid4().hex
+        self.method = method
+        self.path = path
+        self.spans = []
+        self.profiler = cProfile.Profile()
+        self._lock = threading.Lock()
+
+    def add(self, span: dict):
+        with self._lock:
+            self.spans.append(span)
+
+# Set only while an opted-in request is running; None costs one lookup per check
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[Optional[str]] = ContextVar("current_span", default=None)
+
+class span:
+    """
+    Records an OpenTelemetry-style span for the current request when it is
+    being traced, and does nothing otherwise:
+
+        with span("reportlab.build", pages=2):
+            doc.build(story)
+    """
+
+    __slots__ = ("name", "attributes", "trace", "span_id", "parent_id", "started", "token")
+
+    def __init__(self, name: str, **attributes):
+        self.name = name
+        self.attributes = attributes
+        self.trace = _current_trace.get()
+
+    def __enter__(self):
+        if self.trace is not None:
+            self.span_id = uuid.uuid4().hex[:16]
+            self.parent_id = _current_span.get()
+            self.token = _current_span.set(self.span_id)
+            self.started = time.time_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.trace is not None:
+            _current_span.reset(self.token)
+            attributes = dict(self.attributes)
+            if exc_type is not None:
+                attributes["error"] = repr(exc)
+            self.trace.add({
+                "traceId": self.trace.trace_id,
+                "spanId": self.span_id,
+                "parentSpanId": self.parent_id,
+                "name": self.name,
+                "startTimeUnixNano": self.started,
+                "endTimeUnixNano": time.time_ns(),
+                "attributes": attributes,
+            })
+        return False
+
+# ----------------------------------------
+# Database Query Spans
+# ----------------------------------------
+
+@event.listens_for(engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_trace.get() is not None:
+        db_span = span("db.query", statement=statement[:500], executemany=executemany)
+        db_span.__enter__()
+        conn.info.setdefault("profiling_spans", []).append(db_span)
+
+@event.listens_for(engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    spans = conn.info.get("profiling_spans")
+    if spans:
+        spans.pop().__exit__(None, None, None)
+
+# ----------------------------------------
+# Profiled Endpoint Execution
+# ----------------------------------------
+
+def profiled(endpoint):
+    """
+    Wraps a sync endpoint so that, for opted-in requests, cProfile runs in the
+    threadpool thread that executes it. Other requests pay a single ContextVar
+    lookup. The signature is preserved for FastAPI's dependency injection.
+    """
+    # include_router re-creates routes with the same route class, so endpoints arrive wrapped
+    if inspect.iscoroutinefunction(endpoint) or getattr(endpoint, "__profiled__", False):
+        return endpoint
+
+    @functools.wraps(endpoint)
+    def wrapper(*args, **kwargs):
+        trace = _current_trace.get()
+        if trace is None:
+            return endpoint(*args, **kwargs)
+        with span(f"endpoint.{endpoint.__name__}"):
+            trace.profiler.enable()
+            try:
+                return endpoint(*args, **kwargs)
+            finally:
+                trace.profiler.disable()
+
+    wrapper.__profiled__ = True
+    return wrapper
+
+class ProfiledRoute(APIRoute):
+    """Route class that makes every endpoint on a router profileable."""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, profiled(endpoint), **kwargs)
+
+# ----------------------------------------
+# Profiling Middleware and Local Exporters
+# ----------------------------------------
+
+def _is_admin(scope) -> bool:
+    try:
+        username = AuthJWT(req=Request(scope)).get_jwt_subject()
+    except Exception:
+        return False
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.username == username).first()
+        return bool(user and user.is_admin)
+    finally:
+        db.close()
+
+def _write_profile(trace: RequestTrace, duration: float) -> str:
+    os.makedirs(settings.PROFILES_DIR, exist_ok=True)
+    route = trace.path.strip("/").replace("/", "_") or "root"
+    name = f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}_{trace.method}_{route}_{trace.trace_id[:8]}"
+    base = os.path.join(settings.PROFILES_DIR, name)
+
+    # Binary stats for snakeviz/pstats, plus a readable summary
+    trace.profiler.dump_stats(f"{base}.prof")
+    summary = io.StringIO()
+    summary.write(f"{trace.method} {trace.path} took {duration * 1000:.1f} ms (trace {trace.trace_id})\n\n")
+    pstats.Stats(trace.profiler, stream=summary).sort_stats("cumulative").print_stats(40)
+    with open(f"{base}.txt", "w") as f:
+        f.write(summary.getvalue())
+    return name
+
+def _export_spans(trace: RequestTrace) -> None:
+    directory = os.path.dirname(settings.TRACE_EXPORT_PATH)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    lines = "".join(json.dumps(record, default=str) + "\n" for record in trace.spans)
+    with open(settings.TRACE_EXPORT_PATH, "a") as f:
+        # Worker processes share the file; the lock keeps each trace's lines together
+        fcntl.flock(f, fcntl.LOCK_EX)
+        f.write(lines)
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware that opts a request into profiling when an admin sends
+    `X-Profile: 1`, or when it is picked by PROFILING_SAMPLE_RATE. The cProfile
+    stats land in PROFILES_DIR and the request's spans (DB queries, model calls,
+    ReportLab builds) are appended to TRACE_EXPORT_PATH as JSON lines.
+    """
+
+    def __init__(self, app, sample_rate: float = settings.PROFILING_SAMPLE_RATE):
+        self.app = app
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not await self._wanted(scope):
+            return await self.app(scope, receive, send)
+
+        trace = RequestTrace(scope["method"], scope["path"])
+        token = _current_trace.set(trace)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(PROFILE_ID_HEADER.encode(), trace.trace_id.encode())]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            with span(f"{scope['method']} {scope['path']}"):
+                await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_trace.reset(token)
+            try:
+                name = await run_in_threadpool(_write_profile, trace, time.perf_counter() - started)
+                await run_in_threadpool(_export_spans, trace)
+                logger.info(f"Profiled {trace.method} {trace.path} -> {name}")
+            except Exception as e:
+                logger.error(f"Failed to write profile for {trace.path}: {e}")
+
+    async def _wanted(self, scope) -> bool:
+        if self.sample_rate and random.random() < self.sample_rate:
+            return True
+        for key, value in scope["headers"]:
+            if key == PROFILE_HEADER.encode() and value not in (b"", b"0"):
+                # The user lookup is a blocking query; keep it off the event loop
+                return await run_in_threadpool(_is_admin, scope)
+        return False
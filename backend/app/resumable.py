@@ -0,0 +1,197 @@
+import fcntl
+import hmac
+import logging
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import AsyncIterator
+
+from fastapi import HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from starlette.requests import ClientDisconnect
+
+from backend.app.config import settings
+from backend.app.extensions import SessionLocal
+from backend.app.models import ResumableUpload
+from backend.app.storage import blob_store
+from backend.app.uploads import CHUNK_SIZE, MAX_HEADER_SIZE, IngestedUpload, TEST_IMAGE_POLICY, UploadPolicy, check_head, head_complete, ingest_file, read_head
+
+# Set up logging
+logger = logging.getLogger("resumable")
+
+# Partial files live next to the blob store, so finished ones are moved into place without copying
+RESUMABLE_DIR = os.path.join(blob_store.temp_dir, "resumable")
+
+def data_path(upload_id: str) -> str:
+    return os.path.join(RESUMABLE_DIR, upload_id)
+
+def expiry() -> datetime:
+    return datetime.utcnow() + timedelta(hours=settings.RESUMABLE_UPLOAD_TTL_HOURS)
+
+def _open_locked(upload_id: str):
+    """
+    Opens the partial file under an exclusive lock, released when it is closed.
+    A second request for the same upload, e.g. a retry while the first PATCH is
+    still being read, gets 409 instead of interleaving its bytes.
+    """
+    try:
+        f = open(data_path(upload_id), "r+b")
+    except FileNotFoundError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload not found")
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        f.close()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Upload is busy")
+    return f
+
+@contextmanager
+def _locked(upload_id: str):
+    with _open_locked(upload_id) as f:
+        yield f
+
+# ----------------------------------------
+# Upload Lifecycle
+# ----------------------------------------
+
+def create_upload(db, user_id: int, patient_id: int, length: int, policy: UploadPolicy = TEST_IMAGE_POLICY) -> ResumableUpload:
+    if length <= 0:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Upload length must be positive")
+    if length > policy.max_bytes:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="File too large")
+
+    upload = ResumableUpload(id=uuid.uuid4().hex, user_id=user_id, patient_id=patient_id, length=length, expires_at=expiry())
+    os.makedirs(RESUMABLE_DIR, exist_ok=True)
+    open(data_path(upload.id), "xb").close()
+    db.add(upload)
+    db.commit()
+    return upload
+
+def current_offset(upload: ResumableUpload) -> int:
+    """Bytes received so far; the partial file's size is the only record of progress."""
+    try:
+        return os.path.getsize(data_path(upload.id))
+    except FileNotFoundError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload not found")
+
+async def append_chunk(upload: ResumableUpload, offset: int, chunks: AsyncIterator[bytes],
+                       policy: UploadPolicy = TEST_IMAGE_POLICY) -> int:
+    """
+    Appends a request body at `offset`, which must equal the bytes received so
+    far. If the client goes away mid-chunk, whatever arrived is kept and the
+    client resumes from the new offset. The format is checked as soon as the
+    image header is in. Returns the new offset.
+
+    The body is read on the event loop; file access runs in the threadpool,
+    in writes of up to CHUNK_SIZE.
+    """
+    f = await run_in_threadpool(_open_at, upload.id, offset)
+    try:
+        size = offset
+        pending = bytearray()
+        try:
+            async for chunk in chunks:
+                if size + len(pending) + len(chunk) > upload.length:
+                    raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Chunk exceeds Upload-Length")
+                pending += chunk
+                if len(pending) >= CHUNK_SIZE:
+                    await run_in_threadpool(f.write, pending)
+                    size += len(pending)
+                    pending = bytearray()
+        except ClientDisconnect:
+            logger.info(f"Upload {upload.id} interrupted at {size + len(pending)} of {upload.length} bytes")
+        finally:
+            # Keep everything that arrived, also when the next chunk overflowed
+            if pending:
+                await run_in_threadpool(f.write, pending)
+                size += len(pending)
+        await run_in_threadpool(_check_appended, f, upload, offset, size, policy)
+    finally:
+        await run_in_threadpool(f.close)
+    return size
+
+def _open_at(upload_id: str, offset: int):
+    f = _open_locked(upload_id)
+    size = os.fstat(f.fileno()).st_size
+    if offset != size:
+        f.close()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Upload-Offset must be {size}")
+    f.seek(size)
+    return f
+
+def _check_appended(f, upload: ResumableUpload, offset: int, size: int, policy: UploadPolicy) -> None:
+    f.flush()
+    if offset < MAX_HEADER_SIZE and size > offset:
+        f.seek(0)
+        head = read_head(f.read)
+        if head_complete(head) or size == upload.length:
+            check_head(head, policy)
+
+def assemble(upload: ResumableUpload, checksum: str, policy: UploadPolicy = TEST_IMAGE_POLICY) -> IngestedUpload:
+    """
+    Checks that every byte has arrived and that the file's SHA-256 matches the
+    checksum the client computed, then hands the file over like a regular
+    upload. The caller takes ownership of the returned temp file.
+    """
+    with _locked(upload.id) as f:
+        size = os.fstat(f.fileno()).st_size
+        if size != upload.length:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Upload is incomplete ({size} of {upload.length} bytes)")
+        ingested = ingest_file(data_path(upload.id), policy)
+    if not hmac.compare_digest(ingested.digest, checksum.strip().lower()):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Checksum mismatch")
+    return ingested
+
+def discard_upload(db, upload: ResumableUpload) -> None:
+    try:
+        os.remove(data_path(upload.id))
+    except FileNotFoundError:
+        pass
+    db.delete(upload)
+    db.commit()
+
+# ----------------------------------------
+# Expiry
+# ----------------------------------------
+
+def collect_expired_uploads(batch_size: int = 500) -> int:
+    """
+    Deletes uploads past their expiry, and partial files whose row is gone
+    (e.g. removed with its patient) once they are older than the upload TTL.
+    """
+    db = SessionLocal()
+    removed = 0
+    try:
+        while True:
+            expired = db.execute(
+                select(ResumableUpload).where(ResumableUpload.expires_at < datetime.utcnow()).limit(batch_size)
+            ).scalars().all()
+            for upload in expired:
+                try:
+                    os.remove(data_path(upload.id))
+                except FileNotFoundError:
+                    pass
+                db.delete(upload)
+            db.commit()
+            removed += len(expired)
+            if len(expired) < batch_size:
+                break
+
+        if os.path.isdir(RESUMABLE_DIR):
+            cutoff = time.time() - settings.RESUMABLE_UPLOAD_TTL_HOURS * 3600
+            stale = [entry.name for entry in os.scandir(RESUMABLE_DIR) if entry.stat().st_mtime < cutoff]
+            for start in range(0, len(stale), batch_size):
+                batch = stale[start:start + batch_size]
+                known = set(db.execute(select(ResumableUpload.id).where(ResumableUpload.id.in_(batch))).scalars())
+                for name in batch:
+                    if name not in known:
+                        os.remove(data_path(name))
+                        removed += 1
+    finally:
+        db.close()
+    if removed:
+        logger.info(f"Removed {removed} expired uploads")
+    return removed
@@ -1,21 +1,38 @@
-from datetime import datetime
+from datetime import datetime, timezone
+from email.utils import format_datetime
 import json
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
+from fastapi import APIRouter, BackgroundTasks, Depends, Header, HTTPException, Query, Request, WebSocket, WebSocketDisconnect, status, UploadFile, File, Form
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import and_, func
 from sqlalchemy.orm import Session
 from fastapi_jwt_auth import AuthJWT
+from fastapi_jwt_auth.exceptions import AuthJWTException
 from pydantic import BaseModel, Field
 from passlib.context import CryptContext
-from typing import Optional
+from typing import List, Optional
+import asyncio
 import os
-from backend.app.models import User, Patient, Test
-from backend.app.helpers import hash_password, preprocess_image, allowed_file, generate_pdf_report, verify_password,make_prediction, visualize_prediction
-from backend.app.extensions import AuthJWT, get_db
-from fastapi.responses import StreamingResponse, JSONResponse
+import mimetypes
+from backend.app.models import User, Patient, ResumableUpload, Test
+from backend.app.metrics import stage_timer
+from backend.app.admission import admitted, inference_admission, inference_rate_limit, inference_slot
+from backend.app.cache import patient_key, response_cache, test_key
+from backend.app.cleanup import collect_released_blobs, delete_patients
+from backend.app.profiling import ProfiledRoute
+from backend.app.resumable import append_chunk, assemble, collect_expired_uploads, create_upload, current_offset, data_path, discard_upload, expiry
+from backend.app.uploads import PROFILE_PICTURE_POLICY, TEST_IMAGE_POLICY, ingest_upload
+from backend.app.storage import blob_store, key_from_media_url, media_url
+from backend.app.derivatives import create_derivatives, ensure_derivatives, report_image_path, thumbnail_file, thumbnail_urls
+from backend.app.helpers import hash_password, preprocess_image, generate_pdf_report, verify_password, predict_with_embedding, visualize_prediction
+from backend.app.embeddings import embedding_store
+from backend.app.events import event_bus, patient_channel, publish_patient_updated, publish_test_created, user_channel
+from backend.app.extensions import AuthJWT, SessionLocal, get_db
+from backend.app.export import EXPORT_FORMATS, export_patients, export_tests
+from fastapi.responses import FileResponse, StreamingResponse, JSONResponse, Response
 import logging
-import uuid
 
-# Define the router for the API
-router = APIRouter()
+# Define the router for the API (endpoints can be profiled per request, see profiling.py)
+router = APIRouter(route_class=ProfiledRoute)
 
 # Setup logging
 logger = logging.getLogger("app")
@@ -59,22 +76,15 @@ def upload_profile_picture(
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
 
-    # Validate the uploaded file type (e.g., jpg or png)
-    if not allowed_file(file.filename):
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid file type")
+    # Stream the upload to disk, checking type, dimensions and size as it arrives
+    upload = ingest_upload(file, PROFILE_PICTURE_POLICY)
 
-    # Save the file in a dedicated profile picture directory
-    upload_folder = './uploads/profile_pictures'
-    os.makedirs(upload_folder, exist_ok=True)
-    unique_filename = f"{uuid.uuid4()}_{file.filename}"
-    file_path = os.path.join(upload_folder, unique_filename)
-
-    with open(file_path, 'wb') as buffer:
-        buffer.write(file.file.read())
-
-    # Update the user's profile picture path in the database
-    user.profile_picture = f"/uploads/profile_pictures/{unique_filename}"
+    # Store the picture in the blob store and swap the user's reference to it
+    key = blob_store.put_spooled(db, upload.temp_path, upload.digest, upload.size, upload.filename)
+    orphaned = blob_store.release(db, key_from_media_url(user.profile_picture))
+    user.profile_picture = media_url(key)
     db.commit()
+    blob_store.discard(db, [orphaned])
 
     return {"message": "Profile picture updated successfully.", "profile_picture": user.profile_picture}
 
@@ -112,10 +122,17 @@ def update_current_user(
         user.bio = user_data.bio
     if user_data.contact_number:
         user.contact_number = user_data.contact_number
-    if user_data.profile_picture:
+    orphaned = None
+    if user_data.profile_picture and user_data.profile_picture != user.profile_picture:
+        # Stored pictures are set only by the upload endpoint, which takes a reference to the blob
+        if key_from_media_url(user_data.profile_picture) is not None:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                detail="Upload profile pictures with POST /api/users/me/profile-picture")
+        orphaned = blob_store.release(db, key_from_media_url(user.profile_picture))
         user.profile_picture = user_data.profile_picture
 
     db.commit()
+    blob_store.discard(db, [orphaned])
     db.refresh(user)
 
     return {"message": "Profile updated successfully.", "user": user.to_dict()}
@@ -229,11 +246,14 @@ def register_patient(patient_data: RegisterPatientModel, db: Session = Depends(g
 def get_patients(
     limit: int = 10,
     offset: int = 0,
+    include_latest_test: bool = False,
     db: Session = Depends(get_db),
     Authorize: AuthJWT = Depends()
 ):
     """
-    Retrieves a paginated list of patients for the current user.
+    Retrieves a paginated list of patients for the current user. With
+    include_latest_test, each patient also carries its number of tests and a
+    summary of the most recent one, fetched in the same query.
     """
     # Ensure valid JWT is provided
     Authorize.jwt_required()
@@ -247,21 +267,66 @@ def get_patients(
     # Get total patient count for pagination
     total_count = db.query(Patient).filter(Patient.user_id == user.id).count()
 
-    # Fetch patients with pagination
-    patients = (
-        db.query(Patient)
+    if not include_latest_test:
+        # Fetch patients with pagination
+        patients = (
+            db.query(Patient)
+            .filter(Patient.user_id == user.id)
+            .order_by(Patient.id)
+            .offset(offset)
+            .limit(limit)
+            .all()
+        )
+        return {"patients": [patient.to_dict() for patient in patients], "total_count": total_count}
+
+    # Number the tests of the patients on this page newest first, and count them
+    page = (
+        db.query(Patient.id)
         .filter(Patient.user_id == user.id)
+        .order_by(Patient.id)
         .offset(offset)
         .limit(limit)
+        .cte("patient_page")
+    )
+    ranked = (
+        db.query(
+            Test.patient_id,
+            Test.result,
+            Test.confidence,
+            Test.date_conducted,
+            func.row_number().over(
+                partition_by=Test.patient_id, order_by=(Test.date_conducted.desc(), Test.id.desc())
+            ).label("position"),
+            func.count().over(partition_by=Test.patient_id).label("test_count"),
+        )
+        .join(page, page.c.id == Test.patient_id)
+        .subquery()
+    )
+    rows = (
+        db.query(Patient, ranked.c.result, ranked.c.confidence, ranked.c.date_conducted, ranked.c.test_count)
+        .join(page, page.c.id == Patient.id)
+        .outerjoin(ranked, and_(ranked.c.patient_id == Patient.id, ranked.c.position == 1))
+        .order_by(Patient.id)
         .all()
     )
 
+    patients = []
+    for patient, result, confidence, date_conducted, test_count in rows:
+        data = patient.to_dict()
+        data["test_count"] = test_count or 0
+        data["latest_test"] = {
+            "result": result,
+            "confidence": confidence,
+            "date_conducted": date_conducted.strftime('%Y-%m-%d %H:%M:%S') if date_conducted else None,
+        } if test_count else None
+        patients.append(data)
+
     # Return patients as a list with the total count for pagination
-    return {"patients": [patient.to_dict() for patient in patients], "total_count": total_count}
+    return {"patients": patients, "total_count": total_count}
 
 # Get a single patient's details by ID
 @router.get("/api/patients/{patient_id}", status_code=status.HTTP_200_OK)
-def get_patient(patient_id: int, db: Session = Depends(get_db), Authorize: AuthJWT = Depends()):
+def get_patient(patient_id: int, request: Request, db: Session = Depends(get_db), Authorize: AuthJWT = Depends()):
     """
     Fetch details of a specific patient by ID.
     """
@@ -269,12 +334,16 @@ def get_patient(patient_id: int, db: Session = Depends(get_db), Authorize: AuthJ
     current_user = Authorize.get_jwt_subject()
     user = db.query(User).filter(User.username == current_user).first()
 
-    # Find the patient and ensure the user is authorized to view the patient
-    patient = db.query(Patient).filter(Patient.id == patient_id).first()
-    if not patient or (not user.is_admin and patient.user_id != user.id):
+    def load():
+        patient = db.query(Patient).filter(Patient.id == patient_id).first()
+        return (patient.user_id, patient.to_dict()) if patient else None
+
+    # Find the patient (cached until it is next written) and ensure the user is authorized to view it
+    cached = response_cache.read_through(db, "patient", patient_key(patient_id), load)
+    if not cached or (not user.is_admin and cached.owner_id != user.id):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Patient not found")
 
-    return patient.to_dict()
+    return cached.to_response(request)
 
 # Update a patient's details by ID
 @router.put("/api/patients/{patient_id}", status_code=status.HTTP_200_OK)
@@ -295,13 +364,15 @@ def update_patient(patient_id: int, updated_data: RegisterPatientModel, db: Sess
     for key, value in updated_data.dict(exclude_unset=True).items():
         setattr(patient, key, value)
 
+    response_cache.bump(db, patient_key(patient_id))
     db.commit()
+    publish_patient_updated(patient)
 
     return {"message": "Patient updated successfully", "patient_id": patient_id}
 
 # Delete a patient by ID
 @router.delete("/api/patients/{patient_id}", status_code=status.HTTP_200_OK)
-def delete_patient(patient_id: int, db: Session = Depends(get_db), Authorize: AuthJWT = Depends()):
+def delete_patient(patient_id: int, background_tasks: BackgroundTasks, db: Session = Depends(get_db), Authorize: AuthJWT = Depends()):
     """
     Delete a specific patient by ID.
     """
@@ -310,23 +381,57 @@ def delete_patient(patient_id: int, db: Session = Depends(get_db), Authorize: Au
     user = db.query(User).filter(User.username == current_user).first()
 
     # Find the patient and ensure authorization
-    patient = db.query(Patient).filter(Patient.id == patient_id).first()
-    if not patient or (not user.is_admin and patient.user_id != user.id):
+    owner_id = db.query(Patient.user_id).filter(Patient.id == patient_id).scalar()
+    if owner_id is None or (not user.is_admin and owner_id != user.id):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Patient not found")
 
-    # Delete the patient
-    db.delete(patient)
-    db.commit()
+    # Delete the patient; tests and history go with it, image files are collected afterwards
+    delete_patients(db, [patient_id])
+    background_tasks.add_task(collect_released_blobs)
 
     return {"message": "Patient deleted successfully"}
 
+# Model for deleting several patients at once
+class BulkDeletePatientsModel(BaseModel):
+    patient_ids: List[int] = Field(..., min_items=1, max_items=1000)
+
+# Delete many patients (admin only)
+@router.post("/api/patients/bulk-delete", status_code=status.HTTP_200_OK)
+def bulk_delete_patients(
+    payload: BulkDeletePatientsModel,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    Authorize: AuthJWT = Depends()
+):
+    """
+    Delete up to 1000 patients, with their tests and medical history, in one
+    transaction. IDs that do not exist are ignored.
+    """
+    Authorize.jwt_required()
+    current_user = Authorize.get_jwt_subject()
+    user = db.query(User).filter(User.username == current_user).first()
+
+    if not user or not user.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+
+    deleted = delete_patients(db, payload.patient_ids)
+    background_tasks.add_task(collect_released_blobs)
+
+    return {"message": "Patients deleted successfully", "deleted": deleted}
+
 # ----------------------
 # Test Management
 # ----------------------
 
+def test_response(test: Test) -> dict:
+    """Test dictionary plus URLs of its preview thumbnails, or null where none were generated yet."""
+    data = test.to_dict()
+    data["thumbnails"] = thumbnail_urls(test.image_path)
+    return data
+
 # Get all tests for a specific patient
 @router.get("/api/tests/patient/{patient_id}", status_code=status.HTTP_200_OK)
-def get_tests_for_patient(patient_id: int, db: Session = Depends(get_db), Authorize: AuthJWT = Depends()):
+def get_tests_for_patient(patient_id: int, request: Request, db: Session = Depends(get_db), Authorize: AuthJWT = Depends()):
     """
     Fetch all tests for a specific patient.
     """
@@ -334,18 +439,23 @@ def get_tests_for_patient(patient_id: int, db: Session = Depends(get_db), Author
     current_user = Authorize.get_jwt_subject()
     user = db.query(User).filter(User.username == current_user).first()
 
-    patient = db.query(Patient).filter(Patient.id == patient_id, Patient.user_id == user.id).first()
+    def load():
+        patient = db.query(Patient).filter(Patient.id == patient_id).first()
+        if not patient:
+            return None
+        # Get all tests for the patient
+        tests = db.query(Test).filter(Test.patient_id == patient_id).all()
+        return patient.user_id, [test_response(test) for test in tests]
 
-    if not patient:
+    cached = response_cache.read_through(db, "patient_tests", patient_key(patient_id), load)
+    if not cached or cached.owner_id != user.id:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Patient not found")
 
-    # Get all tests for the patient
-    tests = db.query(Test).filter(Test.patient_id == patient_id).all()
-    return [test.to_dict() for test in tests]
+    return cached.to_response(request)
 
 # Get a specific test by its ID
 @router.get("/api/tests/{test_id}", status_code=status.HTTP_200_OK)
-def get_test(test_id: int, db: Session = Depends(get_db), Authorize: AuthJWT = Depends()):
+def get_test(test_id: int, request: Request, db: Session = Depends(get_db), Authorize: AuthJWT = Depends()):
     """
     Fetch a specific test result by its ID.
     """
@@ -353,13 +463,73 @@ def get_test(test_id: int, db: Session = Depends(get_db), Authorize: AuthJWT = D
     current_user = Authorize.get_jwt_subject()
     user = db.query(User).filter(User.username == current_user).first()
 
+    def load():
+        test = db.query(Test).filter(Test.id == test_id).first()
+        return (test.user_id, test_response(test)) if test else None
+
     # Find the test
-    test = db.query(Test).filter(Test.id == test_id).first()
+    cached = response_cache.read_through(db, "test", test_key(test_id), load)
+
+    if not cached or (not user.is_admin and cached.owner_id != user.id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Test not found")
+
+    return cached.to_response(request)
+
+# Find prior tests whose images look like this one
+@router.get("/api/tests/{test_id}/similar", status_code=status.HTTP_200_OK)
+async def get_similar_tests(
+    test_id: int,
+    request: Request,
+    response: Response,
+    k: int = 10,
+    db: Session = Depends(get_db),
+    Authorize: AuthJWT = Depends()
+):
+    """
+    Returns up to `k` tests ranked by cosine similarity of their image embeddings.
+    Non-admin users only see matches among their own tests.
+    """
+    Authorize.jwt_required()
+    current_user = Authorize.get_jwt_subject()
+    user, test = await run_in_threadpool(_similar_source, db, current_user, test_id)
+    k = max(1, min(k, 50))
 
+    query = await run_in_threadpool(embedding_store.vector_for, test_id)
+    if query is None:
+        # Tests created before embeddings existed are embedded on first use. That is a
+        # full forward pass, so it is rate limited and admitted like a new test
+        await inference_rate_limit(request, response)
+        async with admitted(inference_admission, current_user):
+            query = await run_in_threadpool(_embed_test, test)
+
+    return await run_in_threadpool(_similar_tests, db, user, test_id, query, k)
+
+def _similar_source(db: Session, username: str, test_id: int):
+    user = db.query(User).filter(User.username == username).first()
+    test = db.query(Test).filter(Test.id == test_id).first()
     if not test or (not user.is_admin and test.user_id != user.id):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Test not found")
+    return user, test
 
-    return test.to_dict()
+def _embed_test(test: Test):
+    try:
+        _, query = predict_with_embedding(ensure_derivatives(test.image_path))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Could not embed test image: {str(e)}")
+    embedding_store.append([test.id], query)
+    return query
+
+def _similar_tests(db: Session, user: User, test_id: int, query, k: int) -> dict:
+    allowed_ids = None if user.is_admin else [row.id for row in db.query(Test.id).filter(Test.user_id == user.id)]
+    # Ask for a few extra in case some matches were deleted since they were indexed
+    matches = embedding_store.search(query, k + 5, allowed_ids=allowed_ids, exclude_ids=[test_id])
+    tests = {t.id: t for t in db.query(Test).filter(Test.id.in_([match_id for match_id, _ in matches]))}
+
+    similar = []
+    for match_id, similarity in matches:
+        if match_id in tests and len(similar) < k:
+            similar.append({**test_response(tests[match_id]), "similarity": similarity})
+    return {"test_id": test_id, "similar": similar}
 
 # ----------------------------------------
 # Create New Test Endpoint
@@ -367,7 +537,7 @@ def get_test(test_id: int, db: Session = Depends(get_db), Authorize: AuthJWT = D
 
 import json
 
-@router.post("/api/tests", status_code=201)
+@router.post("/api/tests", status_code=201, dependencies=[Depends(inference_rate_limit), Depends(inference_slot)])
 def new_test(
     patientId: int = Form(...),
     image: UploadFile = File(...),
@@ -384,48 +554,69 @@ def new_test(
     if not patient:
         raise HTTPException(status_code=404, detail="Patient not found")
 
-    # Validate the file type
-    if not allowed_file(image.filename):
-        raise HTTPException(status_code=400, detail="Invalid file type")
+    # Stream the upload to disk, checking type, dimensions and size as it arrives
+    return _create_test(db, user, patient, lambda: ingest_upload(image, TEST_IMAGE_POLICY))
 
-    # Save the uploaded image
-    upload_folder = './uploads'
-    os.makedirs(upload_folder, exist_ok=True)
-    image_path = os.path.join(upload_folder, f"{uuid.uuid4()}_{image.filename}")
+def _create_test(db: Session, user: User, patient: Patient, ingest) -> dict:
+    """
+    Stores an image, runs inference and records the test. Callers hold an
+    inference slot (the inference_slot dependency); `ingest` returns the
+    IngestedUpload.
+    """
+    with stage_timer("new_test", "upload"):
+        upload = ingest()
 
-    with open(image_path, 'wb') as buffer:
-        for chunk in image.file:
-            buffer.write(chunk)
+    # Save the uploaded image in the blob store
+    with stage_timer("new_test", "store"):
+        image_path = blob_store.put_spooled(db, upload.temp_path, upload.digest, upload.size, upload.filename)
 
-    # Preprocess image for the model
     try:
-        processed_image = preprocess_image(image_path)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Image preprocessing failed: {str(e)}")
-
-    # Make prediction for all classes
+        # Decode the image once into the cached model input and thumbnails
+        try:
+            with stage_timer("new_test", "derivatives"):
+                processed_image = create_derivatives(image_path)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Image preprocessing failed: {str(e)}")
+
+        # Make prediction for all classes
+        try:
+            with stage_timer("new_test", "make_prediction"):
+                predictions, embedding = predict_with_embedding(processed_image)
+            predictions = [(cls, float(conf)) for cls, conf in predictions]
+        except Exception as e:
+            raise HTTPException(status_code=500, detail="Model prediction failed.")
+
+        # Serialize predictions to JSON string
+        serialized_predictions = json.dumps(predictions)
+
+        # Store the new test in the database
+        top_prediction = max(predictions, key=lambda x: x[1])  # Get the prediction with the highest confidence
+        new_test = Test(
+            patient_id=patient.id,
+            user_id=user.id,
+            image_path=image_path,
+            result=top_prediction[0],  # Set result to the class with highest confidence
+            confidence=top_prediction[1],  # Confidence as a Python float
+            predictions=serialized_predictions,  # Store the serialized predictions
+            date_conducted=datetime.utcnow()
+        )
+        with stage_timer("new_test", "db_commit"):
+            db.add(new_test)
+            response_cache.bump(db, patient_key(patient.id))
+            db.commit()
+    except Exception:
+        # Drop the reference taken above, and the object unless another test already holds it
+        db.rollback()
+        blob_store.discard(db, [image_path])
+        raise
+
+    publish_test_created(new_test, patient.user_id)
+
+    # Index the image for similar-case search; a failure here only delays indexing
     try:
-        predictions = make_prediction(processed_image)
-        predictions = [(cls, float(conf)) for cls, conf in predictions]
+        embedding_store.append([new_test.id], embedding)
     except Exception as e:
-        raise HTTPException(status_code=500, detail="Model prediction failed.")
-
-    # Serialize predictions to JSON string
-    serialized_predictions = json.dumps(predictions)
-
-    # Store the new test in the database
-    top_prediction = max(predictions, key=lambda x: x[1])  # Get the prediction with the highest confidence
-    new_test = Test(
-        patient_id=patient.id,
-        user_id=user.id,
-        image_path=image_path,
-        result=top_prediction[0],  # Set result to the class with highest confidence
-        confidence=top_prediction[1],  # Confidence as a Python float
-        predictions=serialized_predictions,  # Store the serialized predictions
-        date_conducted=datetime.utcnow()
-    )
-    db.add(new_test)
-    db.commit()
+        logger.error(f"Failed to store embedding for test {new_test.id}: {e}")
 
     return {
         "message": "Test created successfully",
@@ -436,6 +627,163 @@ def new_test(
         "all_predictions": predictions
     }
 
+# ----------------------------------------
+# Resumable Upload Endpoints
+# ----------------------------------------
+
+# Model to start a resumable test upload
+class CreateUploadModel(BaseModel):
+    patientId: int
+    length: int  # Total size of the file in bytes
+
+# Model to finish a resumable upload
+class FinalizeUploadModel(BaseModel):
+    checksum: str = Field(regex=r"^[0-9a-fA-F]{64}$")  # SHA-256 of the whole file, hex encoded
+
+def upload_headers(upload: ResumableUpload, offset: int) -> dict:
+    return {
+        "Upload-Offset": str(offset),
+        "Upload-Length": str(upload.length),
+        "Upload-Expires": format_datetime(upload.expires_at.replace(tzinfo=timezone.utc), usegmt=True),
+        "Cache-Control": "no-store",
+    }
+
+def _owned_upload(db: Session, username: str, upload_id: str) -> ResumableUpload:
+    """The upload if it exists, has not expired and belongs to the user; 404 otherwise."""
+    upload = (
+        db.query(ResumableUpload)
+        .join(User, User.id == ResumableUpload.user_id)
+        .filter(ResumableUpload.id == upload_id, User.username == username)
+        .first()
+    )
+    if not upload or upload.expires_at < datetime.utcnow():
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload not found")
+    return upload
+
+@router.post("/api/uploads", status_code=status.HTTP_201_CREATED)
+def create_resumable_upload(
+    upload_data: CreateUploadModel,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    Authorize: AuthJWT = Depends()
+):
+    """
+    Start a resumable upload of a test image for a patient. The file is then
+    sent in any number of PATCH requests and turned into a test by finalize.
+    """
+    Authorize.jwt_required()
+    current_user = Authorize.get_jwt_subject()
+    user = db.query(User).filter(User.username == current_user).first()
+
+    patient = db.query(Patient).filter(Patient.id == upload_data.patientId, Patient.user_id == user.id).first()
+    if not patient:
+        raise HTTPException(status_code=404, detail="Patient not found")
+
+    upload = create_upload(db, user.id, patient.id, upload_data.length)
+    # Expired uploads are cleaned up as new ones arrive
+    background_tasks.add_task(collect_expired_uploads)
+
+    location = f"/api/uploads/{upload.id}"
+    return JSONResponse(
+        status_code=status.HTTP_201_CREATED,
+        content={"upload_id": upload.id, "location": location, "offset": 0},
+        headers={"Location": location, **upload_headers(upload, 0)},
+    )
+
+@router.head("/api/uploads/{upload_id}")
+def get_upload_offset(upload_id: str, db: Session = Depends(get_db), Authorize: AuthJWT = Depends()):
+    """
+    Report how many bytes of an upload have arrived, in the Upload-Offset
+    header. Clients call this after an interruption to know where to resume.
+    """
+    Authorize.jwt_required()
+    upload = _owned_upload(db, Authorize.get_jwt_subject(), upload_id)
+    return Response(status_code=status.HTTP_200_OK, headers=upload_headers(upload, current_offset(upload)))
+
+@router.patch("/api/uploads/{upload_id}")
+async def append_upload_chunk(
+    upload_id: str,
+    request: Request,
+    upload_offset: int = Header(..., alias="Upload-Offset"),
+    db: Session = Depends(get_db),
+    Authorize: AuthJWT = Depends()
+):
+    """
+    Append the request body (Content-Type: application/offset+octet-stream) to
+    an upload. Upload-Offset must equal the bytes received so far, which keeps
+    a retried chunk from being written twice.
+    """
+    Authorize.jwt_required()
+    if request.headers.get("content-type") != "application/offset+octet-stream":
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="Expected application/offset+octet-stream")
+    upload = await run_in_threadpool(_owned_upload, db, Authorize.get_jwt_subject(), upload_id)
+
+    try:
+        offset = await append_chunk(upload, upload_offset, request.stream())
+    except HTTPException as e:
+        # The file is not an acceptable image, so there is no point in resuming
+        if e.status_code in (status.HTTP_400_BAD_REQUEST, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE):
+            await run_in_threadpool(discard_upload, db, upload)
+        raise
+
+    # Every chunk extends the upload's lifetime
+    upload.expires_at = expiry()
+    await run_in_threadpool(db.commit)
+    return Response(status_code=status.HTTP_204_NO_CONTENT, headers=upload_headers(upload, offset))
+
+@router.delete("/api/uploads/{upload_id}", status_code=status.HTTP_204_NO_CONTENT)
+def cancel_upload(upload_id: str, db: Session = Depends(get_db), Authorize: AuthJWT = Depends()):
+    """
+    Abandon an upload and delete what was received.
+    """
+    Authorize.jwt_required()
+    upload = _owned_upload(db, Authorize.get_jwt_subject(), upload_id)
+    discard_upload(db, upload)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+@router.post("/api/uploads/{upload_id}/finalize", status_code=201,
+             dependencies=[Depends(inference_rate_limit), Depends(inference_slot)])
+def finalize_upload(
+    upload_id: str,
+    finalize_data: FinalizeUploadModel,
+    db: Session = Depends(get_db),
+    Authorize: AuthJWT = Depends()
+) -> dict:
+    """
+    Verify a complete upload against its SHA-256 checksum and create the test
+    from it, exactly as POST /api/tests would. If the server is busy (503),
+    the upload is kept and finalize can simply be retried. If test creation
+    fails after the file was moved into the blob store, the upload is removed
+    and the file has to be sent again.
+    """
+    Authorize.jwt_required()
+    current_user = Authorize.get_jwt_subject()
+    user = db.query(User).filter(User.username == current_user).first()
+    upload = _owned_upload(db, current_user, upload_id)
+
+    patient = db.query(Patient).filter(Patient.id == upload.patient_id, Patient.user_id == user.id).first()
+    if not patient:
+        raise HTTPException(status_code=404, detail="Patient not found")
+
+    try:
+        ingested = assemble(upload, finalize_data.checksum)
+    except HTTPException as e:
+        # Corrupted or unacceptable data cannot be fixed by resuming
+        if e.status_code != status.HTTP_409_CONFLICT:
+            discard_upload(db, upload)
+        raise
+
+    # Removed in the same commit as the new test
+    db.delete(upload)
+    try:
+        return _create_test(db, user, patient, lambda: ingested)
+    except Exception:
+        db.rollback()
+        if not os.path.exists(data_path(upload.id)):
+            # The file was consumed by the blob store, so the upload cannot be finalized again
+            discard_upload(db, upload)
+        raise
+
 
 # ----------------------------------------
 # Download Test Report Endpoint
@@ -458,18 +806,22 @@ def download_report(test_id: int, db: Session = Depends(get_db), Authorize: Auth
         raise HTTPException(status_code=404, detail="Test not found or access denied")
 
     # Check if the image file exists
-    if not os.path.exists(test.image_path):
+    if not blob_store.exists(test.image_path):
         raise HTTPException(status_code=404, detail="Image file not found")
 
     try:
         # Retrieve all predictions from the database (stored in a string)
         predictions = eval(test.predictions)  # Convert the string back to list of tuples
 
-        # Generate prediction visualization for all classes
-        prediction_image = visualize_prediction(test.image_path, predictions)
+        # Generate prediction visualization from the cached thumbnail
+        with stage_timer("report", "derivatives"):
+            report_image = report_image_path(test.image_path)
+        with stage_timer("report", "visualize_prediction"):
+            prediction_image = visualize_prediction(report_image, predictions)
 
         # Generate PDF report with the visualization
-        pdf_buffer = generate_pdf_report(test, prediction_image)
+        with stage_timer("report", "generate_pdf_report"):
+            pdf_buffer = generate_pdf_report(test, prediction_image)
         pdf_buffer.seek(0)
 
         # Return the PDF as a downloadable file
@@ -478,4 +830,193 @@ def download_report(test_id: int, db: Session = Depends(get_db), Authorize: Auth
 
     except Exception as e:
         logger.error(f"Failed to generate report for test ID {test_id}: {e}")
-        raise HTTPException(status_code=500, detail="Failed to generate the report")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Failed to generate the report")
+
+# ----------------------------------------
+# Data Export Endpoints
+# ----------------------------------------
+
+def _stream_export(export_fn, fmt, user_id, date_from, date_to):
+    """
+    Runs an export on its own session, since the request-scoped session is
+    closed before a StreamingResponse finishes sending its body.
+    """
+    db = SessionLocal()
+    try:
+        yield from export_fn(db, fmt, user_id=user_id, date_from=date_from, date_to=date_to)
+    finally:
+        db.close()
+
+def _export_response(export_fn, table, fmt, user_id, date_from, date_to, db, Authorize):
+    Authorize.jwt_required()
+    current_user = Authorize.get_jwt_subject()
+    user = db.query(User).filter(User.username == current_user).first()
+
+    # Full-table exports are restricted to admins
+    if not user or not user.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Format must be 'csv' or 'parquet'")
+
+    media_type, extension = EXPORT_FORMATS[fmt]
+    headers = {"Content-Disposition": f"attachment; filename={table}.{extension}"}
+    return StreamingResponse(
+        _stream_export(export_fn, fmt, user_id, date_from, date_to),
+        media_type=media_type,
+        headers=headers
+    )
+
+@router.get("/api/export/patients", response_class=StreamingResponse)
+def export_patients_table(
+    format: str = "csv",
+    user_id: Optional[int] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    db: Session = Depends(get_db),
+    Authorize: AuthJWT = Depends()
+):
+    """
+    Stream the patients table as CSV or Parquet, optionally filtered by owning user
+    and creation date range (date_from inclusive, date_to exclusive).
+    """
+    return _export_response(export_patients, "patients", format, user_id, date_from, date_to, db, Authorize)
+
+@router.get("/api/export/tests", response_class=StreamingResponse)
+def export_tests_table(
+    format: str = "csv",
+    user_id: Optional[int] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    db: Session = Depends(get_db),
+    Authorize: AuthJWT = Depends()
+):
+    """
+    Stream the tests table as CSV or Parquet with one prediction column per class,
+    optionally filtered by user and date conducted.
+    """
+    return _export_response(export_tests, "tests", format, user_id, date_from, date_to, db, Authorize)
+
+
+# ----------------------------------------
+# Stored Media Endpoints
+# ----------------------------------------
+
+@router.get("/thumbnails/{name:path}")
+def get_thumbnail(name: str):
+    """
+    Serve a WebP thumbnail generated at upload time. Names derive from content
+    hashes, so responses can be cached indefinitely.
+    """
+    path = thumbnail_file(name)
+    if not path:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Thumbnail not found")
+
+    headers = {"Cache-Control": "public, max-age=31536000, immutable"}
+    return FileResponse(path, media_type="image/webp", headers=headers)
+
+@router.get("/media/{key:path}")
+def get_media(key: str):
+    """
+    Serve a blob from the storage layer. Keys are content hashes, so responses
+    never change and can be cached indefinitely.
+    """
+    if ".." in key.split("/") or not blob_store.exists(key):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
+
+    media_type = mimetypes.guess_type(key)[0] or "application/octet-stream"
+    headers = {"Cache-Control": "public, max-age=31536000, immutable"}
+    restored = blob_store.restored_digest(key)
+    if restored:
+        # Archived as WebP: same pixels, but not the bytes the key was hashed from
+        headers = {"Cache-Control": "public, max-age=86400", "ETag": f'"{restored}"'}
+    return StreamingResponse(blob_store.iter_bytes(key), media_type=media_type, headers=headers)
+
+# ----------------------------------------
+# Live Event Stream
+# ----------------------------------------
+
+def _event_channels(username: str, patient_ids: List[int]) -> Optional[List[str]]:
+    """
+    Channels a user may follow: their own, plus those of the requested patients
+    they are allowed to see. None if the user does not exist.
+    """
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.username == username).first()
+        if not user:
+            return None
+        channels = [user_channel(user.id)]
+        if patient_ids:
+            query = db.query(Patient.id).filter(Patient.id.in_(patient_ids))
+            if not user.is_admin:
+                query = query.filter(Patient.user_id == user.id)
+            channels += [patient_channel(row.id) for row in query]
+        return channels
+    finally:
+        db.close()
+
+@router.websocket("/ws/events")
+async def event_stream(
+    websocket: WebSocket,
+    token: str = Query(...),
+    patient_id: List[int] = Query([]),
+    Authorize: AuthJWT = Depends()
+):
+    """
+    Push an event whenever a test is created for, or an update is made to, one
+    of the user's patients. Browsers cannot set headers on a WebSocket, so the
+    access token is a query parameter. Other patients the user may see can be
+    followed with patient_id parameters or {"subscribe": id} messages.
+    """
+    await websocket.accept()
+    try:
+        Authorize.jwt_required("websocket", token=token)
+        username = Authorize.get_raw_jwt(token)["sub"]
+    except AuthJWTException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    channels = await run_in_threadpool(_event_channels, username, patient_id)
+    if channels is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    subscription = event_bus.hub.subscribe(channels)
+
+    async def send_events():
+        while True:
+            await websocket.send_text(await subscription.queue.get())
+
+    async def receive_commands():
+        while True:
+            try:
+                command = json.loads(await websocket.receive_text())
+                subscribe, unsubscribe = int(command.get("subscribe") or 0), int(command.get("unsubscribe") or 0)
+            except (ValueError, TypeError, AttributeError):
+                continue
+            if subscribe:
+                for channel in (await run_in_threadpool(_event_channels, username, [subscribe]) or [])[1:]:
+                    event_bus.hub.add_channel(subscription, channel)
+            if unsubscribe:
+                event_bus.hub.remove_channel(subscription, patient_channel(unsubscribe))
+
+    tasks = [
+        asyncio.ensure_future(send_events()),
+        asyncio.ensure_future(receive_commands()),
+        asyncio.ensure_future(subscription.dropped.wait()),
+    ]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        # Before awaiting anything: a cancelled handler would be cancelled again at the await
+        event_bus.hub.unsubscribe(subscription)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    if subscription.dropped.is_set():
+        # Too slow to keep up: close, and let the client reconnect and refetch
+        try:
+            await asyncio.wait_for(websocket.close(code=status.WS_1013_TRY_AGAIN_LATER), timeout=5)
+        except (asyncio.TimeoutError, RuntimeError, WebSocketDisconnect):
+            pass
@@ -0,0 +1,437 @@
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from io import BytesIO
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+
+from backend.app.cold_storage import ColdTier, restored_digest
+from backend.app.config import settings
+from backend.app.metrics import record_cache
+from backend.app.models import ArchivedBlob, StoredBlob
+
+# Set up logging
+logger = logging.getLogger("storage")
+
+# URL prefix under which blobs are served (see the /media route)
+MEDIA_URL_PREFIX = "/media/"
+
+# Paths written by the flat ./uploads layout before the blob store existed
+LEGACY_UPLOAD_PREFIXES = ("./uploads/", "uploads/", "/uploads/")
+
+CHUNK_SIZE = 1024 * 1024
+
+# ----------------------------------------
+# Storage Backends
+# ----------------------------------------
+
+class StorageBackend(ABC):
+    """Minimal interface the blob store needs from a place that keeps bytes."""
+
+    @abstractmethod
+    def put_file(self, key: str, temp_path: str) -> None:
+        """Moves a fully written temp file into place under `key`. Consumes temp_path."""
+
+    @abstractmethod
+    def open(self, key: str) -> BinaryIO:
+        """Opens a stored object for binary reading."""
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        pass
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        pass
+
+    @abstractmethod
+    def iter_objects(self) -> Iterator[Tuple[str, float]]:
+        """Yields (key, modification time as a Unix timestamp) of every stored object."""
+
+    def read_range(self, key: str, offset: int, length: int) -> bytes:
+        """Reads `length` bytes starting at `offset`, e.g. one member of a pack file."""
+        with self.open(key) as src:
+            src.seek(offset)
+            return src.read(length)
+
+    @contextmanager
+    def local_path(self, key: str) -> Iterator[str]:
+        """Yields a local file path with the object's contents (downloaded if needed)."""
+        suffix = os.path.splitext(key)[1]
+        with self.open(key) as src, tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as dst:
+            shutil.copyfileobj(src, dst, CHUNK_SIZE)
+        try:
+            yield dst.name
+        finally:
+            os.remove(dst.name)
+
+
+class FileSystemBackend(StorageBackend):
+    """Stores objects as files under a root directory, using the key as relative path."""
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    def put_file(self, key: str, temp_path: str) -> None:
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Rename is atomic within a filesystem, so readers never see a partial file
+        os.replace(temp_path, path)
+
+    def open(self, key: str) -> BinaryIO:
+        return open(self.path(key), "rb")
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self.path(key))
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def iter_objects(self) -> Iterator[Tuple[str, float]]:
+        for directory, subdirectories, files in os.walk(self.root):
+            # Skip the blob store's temp directory and other hidden entries
+            subdirectories[:] = sorted(d for d in subdirectories if not d.startswith("."))
+            for name in sorted(files):
+                path = os.path.join(directory, name)
+                try:
+                    mtime = os.path.getmtime(path)
+                except FileNotFoundError:
+                    continue
+                yield os.path.relpath(path, self.root).replace(os.sep, "/"), mtime
+
+    @contextmanager
+    def local_path(self, key: str) -> Iterator[str]:
+        yield self.path(key)
+
+
+class ObjectStoreBackend(StorageBackend):
+    """
+    Stores objects in an S3-compatible bucket. `client` must provide the boto3
+    S3 client methods put_object, get_object, head_object and delete_object.
+    """
+
+    def __init__(self, client, bucket: str, prefix: str = ""):
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+
+    def _object_key(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def put_file(self, key: str, temp_path: str) -> None:
+        try:
+            with open(temp_path, "rb") as body:
+                self.client.put_object(Bucket=self.bucket, Key=self._object_key(key), Body=body)
+        finally:
+            os.remove(temp_path)
+
+    def open(self, key: str) -> BinaryIO:
+        return self.client.get_object(Bucket=self.bucket, Key=self._object_key(key))["Body"]
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+            return True
+        except Exception:
+            return False
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+
+    def read_range(self, key: str, offset: int, length: int) -> bytes:
+        # Fetch only the requested bytes instead of the whole object
+        response = self.client.get_object(
+            Bucket=self.bucket, Key=self._object_key(key), Range=f"bytes={offset}-{offset + length - 1}"
+        )
+        return response["Body"].read()
+
+    def iter_objects(self) -> Iterator[Tuple[str, float]]:
+        prefix = f"{self.prefix}/" if self.prefix else ""
+        token = None
+        while True:
+            kwargs = {"Bucket": self.bucket, "Prefix": prefix}
+            if token:
+                kwargs["ContinuationToken"] = token
+            page = self.client.list_objects_v2(**kwargs)
+            for item in page.get("Contents", []):
+                yield item["Key"][len(prefix):], item["LastModified"].timestamp()
+            if not page.get("IsTruncated"):
+                return
+            token = page["NextContinuationToken"]
+
+
+class LocalObjectStoreClient:
+    """
+    Directory-backed stand-in for an S3 client, implementing the subset of the
+    boto3 API used by ObjectStoreBackend. Lets the object store code path run
+    without any external service.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, bucket: str, key: str) -> str:
+        return os.path.join(self.root, bucket, *key.split("/"))
+
+    def put_object(self, Bucket: str, Key: str, Body) -> dict:
+        path = self._path(Bucket, Key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as dst:
+            if isinstance(Body, (bytes, bytearray)):
+                dst.write(Body)
+            else:
+                shutil.copyfileobj(Body, dst, CHUNK_SIZE)
+        os.replace(temp_path, path)
+        return {}
+
+    def get_object(self, Bucket: str, Key: str, Range: Optional[str] = None) -> dict:
+        path = self._path(Bucket, Key)
+        if not os.path.exists(path):
+            raise KeyError(f"NoSuchKey: {Key}")
+        if Range is None:
+            return {"Body": open(path, "rb"), "ContentLength": os.path.getsize(path)}
+        # Only the single "bytes=start-end" form is supported
+        start, end = (int(n) for n in Range.removeprefix("bytes=").split("-"))
+        with open(path, "rb") as f:
+            f.seek(start)
+            data = f.read(end - start + 1)
+        return {"Body": BytesIO(data), "ContentLength": len(data)}
+
+    def head_object(self, Bucket: str, Key: str) -> dict:
+        path = self._path(Bucket, Key)
+        if not os.path.exists(path):
+            raise KeyError(f"NoSuchKey: {Key}")
+        return {"ContentLength": os.path.getsize(path)}
+
+    def list_objects_v2(self, Bucket: str, Prefix: str = "", ContinuationToken: Optional[str] = None,
+                        MaxKeys: int = 1000) -> dict:
+        root = os.path.join(self.root, Bucket)
+        keys = sorted(
+            os.path.relpath(os.path.join(directory, name), root).replace(os.sep, "/")
+            for directory, _, files in os.walk(root) for name in files
+        )
+        keys = [key for key in keys if key.startswith(Prefix) and (ContinuationToken is None or key > ContinuationToken)]
+        page = keys[:MaxKeys]
+        contents = [
+            {"Key": key, "LastModified": datetime.fromtimestamp(os.path.getmtime(self._path(Bucket, key)), timezone.utc)}
+            for key in page
+        ]
+        truncated = len(keys) > MaxKeys
+        return {"Contents": contents, "IsTruncated": truncated, "NextContinuationToken": page[-1] if truncated else None}
+
+    def delete_object(self, Bucket: str, Key: str) -> dict:
+        try:
+            os.remove(self._path(Bucket, Key))
+        except FileNotFoundError:
+            pass
+        return {}
+
+
+def create_backend() -> StorageBackend:
+    """Builds the storage backend selected by STORAGE_BACKEND."""
+    if settings.STORAGE_BACKEND == "filesystem":
+        return FileSystemBackend(settings.STORAGE_ROOT)
+    if settings.STORAGE_BACKEND == "local-s3":
+        return ObjectStoreBackend(LocalObjectStoreClient(settings.STORAGE_ROOT), settings.S3_BUCKET, settings.S3_PREFIX)
+    if settings.STORAGE_BACKEND == "s3":
+        import boto3  # Only needed when an object store is actually configured
+        client = boto3.client("s3", endpoint_url=settings.S3_ENDPOINT_URL or None)
+        return ObjectStoreBackend(client, settings.S3_BUCKET, settings.S3_PREFIX)
+    raise RuntimeError(f"Unknown storage backend: {settings.STORAGE_BACKEND}")
+
+# ----------------------------------------
+# Content-Addressed Blob Store
+# ----------------------------------------
+
+def blob_key(digest: str, extension: str) -> str:
+    """Two levels of 256 shards keep each directory small even with millions of blobs."""
+    return f"{digest[:2]}/{digest[2:4]}/{digest}{extension}"
+
+
+class BlobStore:
+    """
+    Content-addressed store on top of a StorageBackend. Identical uploads share
+    one object; the stored_blobs table counts references so the object is only
+    removed when the last Test or User pointing at it lets go.
+
+    Reference changes happen in the caller's session and become durable with the
+    caller's commit, together with the row that holds the key.
+
+    Reads fall back to the cold tier for images the archive job has moved into
+    pack files (see backend/archive_images.py).
+    """
+
+    def __init__(self, backend: StorageBackend, temp_dir: Optional[str] = None):
+        self.backend = backend
+        self.cold = ColdTier(backend)
+        self.temp_dir = temp_dir or os.path.join(settings.STORAGE_ROOT, ".tmp")
+        os.makedirs(self.temp_dir, exist_ok=True)
+
+    def spool(self, fileobj: BinaryIO) -> tuple:
+        """
+        Copies a stream to a temp file while hashing it.
+        Returns (temp_path, sha256 hex digest, size).
+        """
+        digest = hashlib.sha256()
+        size = 0
+        fd, temp_path = tempfile.mkstemp(dir=self.temp_dir)
+        try:
+            with os.fdopen(fd, "wb") as dst:
+                for chunk in iter(lambda: fileobj.read(CHUNK_SIZE), b""):
+                    digest.update(chunk)
+                    dst.write(chunk)
+                    size += len(chunk)
+        except Exception:
+            os.remove(temp_path)
+            raise
+        return temp_path, digest.hexdigest(), size
+
+    def put(self, db, fileobj: BinaryIO, filename: str) -> str:
+        """Stores a stream and returns its key, adding a reference if it already exists."""
+        temp_path, digest, size = self.spool(fileobj)
+        return self.put_spooled(db, temp_path, digest, size, filename)
+
+    def put_spooled(self, db, temp_path: str, digest: str, size: int, filename: str) -> str:
+        """Stores an already hashed temp file (consumed) and returns its key."""
+        extension = os.path.splitext(filename)[1].lower()
+        key = blob_key(digest, extension)
+
+        if self._add_reference(db, key):
+            # Already stored: this upload is a duplicate
+            record_cache("blob_dedup", True)
+            os.remove(temp_path)
+            return key
+        record_cache("blob_dedup", False)
+
+        self.backend.put_file(key, temp_path)
+        try:
+            with db.begin_nested():
+                db.add(StoredBlob(key=key, size=size, ref_count=1))
+        except IntegrityError:
+            # Another request stored the same content first
+            self._add_reference(db, key)
+        return key
+
+    def _add_reference(self, db, key: str) -> bool:
+        result = db.execute(
+            update(StoredBlob).where(StoredBlob.key == key).values(ref_count=StoredBlob.ref_count + 1)
+        )
+        return result.rowcount > 0
+
+    def release(self, db, key: Optional[str]) -> Optional[str]:
+        """
+        Drops one reference. Returns the key when that was the last reference, so
+        the caller can discard the object once its transaction has committed.
+        """
+        if not key or is_legacy_path(key):
+            return None
+        db.execute(
+            update(StoredBlob).where(StoredBlob.key == key).values(ref_count=StoredBlob.ref_count - 1)
+        )
+        blob = db.get(StoredBlob, key)
+        if blob is not None and blob.ref_count <= 0:
+            db.delete(blob)
+            # The archived copy stays in its pack file, but is no longer indexed
+            db.query(ArchivedBlob).filter(ArchivedBlob.key == key).delete(synchronize_session=False)
+            self.cold.forget(key)
+            return key
+        return None
+
+    def discard(self, db, keys) -> None:
+        """Deletes objects whose last reference was released and committed."""
+        for key in keys:
+            # Skip keys that were stored again since they were released
+            if key and db.get(StoredBlob, key) is None:
+                self.backend.delete(key)
+
+    def open(self, ref: str) -> BinaryIO:
+        """Opens a blob key, or a legacy ./uploads path from before the blob store."""
+        try:
+            if is_legacy_path(ref):
+                return open(ref, "rb")
+            return self.backend.open(ref)
+        except Exception:
+            data = self.cold.read(ref)
+            if data is None:
+                raise
+            return BytesIO(data)
+
+    def iter_bytes(self, ref: str) -> Iterator[bytes]:
+        """Streams a blob in fixed-size chunks, e.g. for a StreamingResponse."""
+        with self.open(ref) as src:
+            for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+                yield chunk
+
+    def exists(self, ref: str) -> bool:
+        return self._hot_exists(ref) or self.cold.entry(ref) is not None
+
+    def restored_digest(self, ref: str) -> Optional[str]:
+        """
+        SHA-256 of the bytes open() returns when they differ from the file
+        the key was hashed from, i.e. for images archived with the webp codec.
+        """
+        if self._hot_exists(ref):
+            return None
+        entry = self.cold.entry(ref)
+        return restored_digest(entry.codec) if entry is not None else None
+
+    def _hot_exists(self, ref: str) -> bool:
+        if is_legacy_path(ref):
+            return os.path.exists(ref)
+        return self.backend.exists(ref)
+
+    @contextmanager
+    def local_path(self, ref: str) -> Iterator[str]:
+        if not self._hot_exists(ref) and self.cold.entry(ref) is not None:
+            # Restore archived images to a temp file for readers that need a path
+            with tempfile.NamedTemporaryFile(suffix=os.path.splitext(ref)[1], dir=self.temp_dir, delete=False) as dst:
+                dst.write(self.cold.read(ref))
+            try:
+                yield dst.name
+            finally:
+                os.remove(dst.name)
+        elif is_legacy_path(ref):
+            yield ref
+        else:
+            with self.backend.local_path(ref) as path:
+                yield path
+
+    def delete_hot(self, ref: str) -> None:
+        """Removes the hot copy of an image that is now served from the cold tier."""
+        if is_legacy_path(ref):
+            try:
+                os.remove(ref)
+            except FileNotFoundError:
+                pass
+        else:
+            self.backend.delete(ref)
+
+
+def is_legacy_path(ref: str) -> bool:
+    return ref.startswith(LEGACY_UPLOAD_PREFIXES)
+
+def media_url(key: str) -> str:
+    return f"{MEDIA_URL_PREFIX}{key}"
+
+def key_from_media_url(url: Optional[str]) -> Optional[str]:
+    if url and url.split("?", 1)[0].startswith(MEDIA_URL_PREFIX):
+        return url.split("?", 1)[0][len(MEDIA_URL_PREFIX):]
+    return None
+
+
+blob_store = BlobStore(create_backend())
@@ -0,0 +1,311 @@
+import hashlib
+import logging
+import os
+import struct
+import tempfile
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Callable, Dict, Optional, Tuple
+
+from fastapi import HTTPException, UploadFile, status
+from prometheus_client import Counter, Histogram
+from pydicom import dcmread
+
+from backend.app.config import settings
+from backend.app.storage import blob_store
+
+# Set up logging
+logger = logging.getLogger("uploads")
+
+# The first chunk must hold the format signature and the image header
+FIRST_CHUNK_SIZE = 64 * 1024
+# JPEG metadata segments (EXIF, ICC profiles) may push the frame header further; read up to this much for it
+MAX_HEADER_SIZE = 1024 * 1024
+CHUNK_SIZE = 1024 * 1024
+MIN_IMAGE_SIDE = 32
+
+# Allowance for multipart boundaries and form fields around the file itself
+MULTIPART_OVERHEAD = 64 * 1024
+
+KIND_EXTENSIONS = {"png": ".png", "jpeg": ".jpg", "dicom": ".dcm"}
+
+UPLOAD_BYTES = Histogram(
+    "ldcs_upload_size_bytes",
+    "Size of accepted uploads in bytes",
+    ["endpoint"],
+    buckets=[64 * 1024, 256 * 1024, 1024 ** 2, 4 * 1024 ** 2, 16 * 1024 ** 2, 64 * 1024 ** 2, 256 * 1024 ** 2],
+)
+UPLOAD_REJECTIONS = Counter(
+    "ldcs_upload_rejections_total",
+    "Uploads rejected during ingest",
+    ["endpoint", "reason"],
+)
+
+@dataclass
+class UploadPolicy:
+    endpoint: str
+    max_bytes: int
+    kinds: Tuple[str, ...]
+
+TEST_IMAGE_POLICY = UploadPolicy("test_image", settings.MAX_TEST_IMAGE_BYTES, ("png", "jpeg", "dicom"))
+PROFILE_PICTURE_POLICY = UploadPolicy("profile_picture", settings.MAX_PROFILE_PICTURE_BYTES, ("png", "jpeg"))
+
+# Request bodies for these routes are capped before the multipart parser spools them
+UPLOAD_ROUTES: Dict[Tuple[str, str], UploadPolicy] = {
+    ("POST", "/api/tests"): TEST_IMAGE_POLICY,
+    ("POST", "/api/users/me/profile-picture"): PROFILE_PICTURE_POLICY,
+}
+
+@dataclass
+class IngestedUpload:
+    temp_path: str
+    digest: str
+    size: int
+    kind: str
+    width: int
+    height: int
+
+    @property
+    def filename(self) -> str:
+        """Canonical name for the blob store, with the extension of the sniffed format."""
+        return f"{self.digest}{KIND_EXTENSIONS[self.kind]}"
+
+# ----------------------------------------
+# Format Sniffing
+# ----------------------------------------
+
+def sniff_kind(head: bytes) -> Optional[str]:
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if head[128:132] == b"DICM":
+        return "dicom"
+    return None
+
+def _png_size(head: bytes) -> Optional[Tuple[int, int]]:
+    if len(head) < 24 or head[12:16] != b"IHDR":
+        return None
+    width, height = struct.unpack(">II", head[16:24])
+    return width, height
+
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+def _jpeg_frame(head: bytes) -> Tuple[Optional[Tuple[int, int]], int]:
+    """
+    Walks the JPEG segments up to the frame header. Returns ((width, height), 0)
+    once found, (None, n) if the first n bytes are needed to go on, and
+    (None, 0) if the data is not a readable JPEG.
+    """
+    i = 2
+    while True:
+        if i + 4 > len(head):
+            return None, i + 4
+        if head[i] != 0xFF:
+            return None, 0
+        marker = head[i + 1]
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            i += 2
+            continue
+        if marker in JPEG_SOF_MARKERS:
+            if i + 9 > len(head):
+                return None, i + 9
+            height, width = struct.unpack(">HH", head[i + 5:i + 9])
+            return (width, height), 0
+        i += 2 + struct.unpack(">H", head[i + 2:i + 4])[0]
+
+def _jpeg_size(head: bytes) -> Optional[Tuple[int, int]]:
+    return _jpeg_frame(head)[0]
+
+def _dicom_size(head: bytes) -> Optional[Tuple[int, int]]:
+    try:
+        ds = dcmread(BytesIO(head), stop_before_pixels=True, specific_tags=["Rows", "Columns"])
+        return int(ds.Columns), int(ds.Rows)
+    except Exception:
+        return None
+
+SIZE_READERS = {"png": _png_size, "jpeg": _jpeg_size, "dicom": _dicom_size}
+
+def read_head(read: Callable[[int], bytes]) -> bytes:
+    """
+    Reads the first chunk of a file, and for a JPEG keeps reading segment by
+    segment until its frame header is in, up to MAX_HEADER_SIZE.
+    """
+    head = read(FIRST_CHUNK_SIZE)
+    if sniff_kind(head) != "jpeg":
+        return head
+    while True:
+        dimensions, needed = _jpeg_frame(head)
+        if dimensions is not None or not needed or needed > MAX_HEADER_SIZE:
+            return head
+        more = read(needed - len(head))
+        if not more:
+            return head
+        head += more
+
+def head_complete(head: bytes) -> bool:
+    """Whether check_head can decide on `head`, or more of the file is needed first."""
+    if sniff_kind(head) == "jpeg":
+        dimensions, needed = _jpeg_frame(head)
+        return dimensions is not None or not needed or needed > MAX_HEADER_SIZE
+    return len(head) >= FIRST_CHUNK_SIZE
+
+# ----------------------------------------
+# Streaming Ingest
+# ----------------------------------------
+
+def _reject(policy: UploadPolicy, reason: str, status_code: int, detail: str):
+    UPLOAD_REJECTIONS.labels(policy.endpoint, reason).inc()
+    logger.info(f"Rejected {policy.endpoint} upload: {detail}")
+    raise HTTPException(status_code=status_code, detail=detail)
+
+def check_head(head: bytes, policy: UploadPolicy) -> Tuple[str, int, int]:
+    """Checks the format and image dimensions from read_head's bytes; returns (kind, width, height)."""
+    if not head:
+        _reject(policy, "empty", status.HTTP_400_BAD_REQUEST, "Empty file")
+
+    kind = sniff_kind(head)
+    if kind not in policy.kinds:
+        _reject(policy, "type", status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, "Invalid file type")
+
+    dimensions = SIZE_READERS[kind](head)
+    if dimensions is None:
+        _reject(policy, "header", status.HTTP_400_BAD_REQUEST, "Could not read image dimensions")
+    width, height = dimensions
+    if min(width, height) < MIN_IMAGE_SIDE or width * height > settings.MAX_IMAGE_PIXELS:
+        _reject(policy, "dimensions", status.HTTP_400_BAD_REQUEST, f"Unsupported image dimensions {width}x{height}")
+    return kind, width, height
+
+def ingest_upload(upload: UploadFile, policy: UploadPolicy) -> IngestedUpload:
+    """
+    Streams an upload into a temp file in fixed-size chunks. The format and
+    image dimensions are checked from the first chunk before anything is
+    written, and the size limit is enforced while reading, so bad input is
+    rejected as early as possible. The returned temp file sits next to the
+    blob store so it can be moved into place without copying.
+    """
+    head = read_head(upload.file.read)
+    kind, width, height = check_head(head, policy)
+
+    digest = hashlib.sha256()
+    size = 0
+    fd, temp_path = tempfile.mkstemp(dir=blob_store.temp_dir)
+    try:
+        with os.fdopen(fd, "wb") as dst:
+            chunk = head
+            while chunk:
+                size += len(chunk)
+                if size > policy.max_bytes:
+                    _reject(policy, "size", status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, "File too large")
+                digest.update(chunk)
+                dst.write(chunk)
+                chunk = upload.file.read(CHUNK_SIZE)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+    UPLOAD_BYTES.labels(policy.endpoint).observe(size)
+    return IngestedUpload(temp_path, digest.hexdigest(), size, kind, width, height)
+
+def ingest_file(path: str, policy: UploadPolicy) -> IngestedUpload:
+    """
+    Applies the same checks to a file that was assembled on disk, e.g. by a
+    resumable upload, and hashes it. The file itself becomes the temp file, so
+    it must live in the blob store's temp directory.
+    """
+    size = os.path.getsize(path)
+    if size > policy.max_bytes:
+        _reject(policy, "size", status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, "File too large")
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as src:
+        head = read_head(src.read)
+        kind, width, height = check_head(head, policy)
+        digest.update(head)
+        for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+
+    UPLOAD_BYTES.labels(policy.endpoint).observe(size)
+    return IngestedUpload(path, digest.hexdigest(), size, kind, width, height)
+
+# ----------------------------------------
+# Request Body Size Limit Middleware
+# ----------------------------------------
+
+class UploadSizeLimitMiddleware:
+    """
+    ASGI middleware that refuses oversized upload bodies before the multipart
+    parser spools them to disk: on Content-Length up front, or as soon as the
+    streamed body passes the route's limit.
+    """
+
+    def __init__(self, app, routes: Dict[Tuple[str, str], UploadPolicy] = UPLOAD_ROUTES):
+        self.app = app
+        self.routes = routes
+
+    async def __call__(self, scope, receive, send):
+        policy = self.routes.get((scope.get("method"), scope.get("path"))) if scope["type"] == "http" else None
+        if policy is None:
+            return await self.app(scope, receive, send)
+        limit = policy.max_bytes + MULTIPART_OVERHEAD
+
+        headers = dict(scope["headers"])
+        content_length = headers.get(b"content-length")
+        if content_length is not None:
+            try:
+                declared = int(content_length)
+            except ValueError:
+                return await self._bad_length(send)
+            if declared > limit:
+                return await self._too_large(policy, send)
+
+        received = 0
+        exceeded = False
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    exceeded = True
+                    # Make the app stop reading as if the client went away
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def tracking_send(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except Exception:
+            if not exceeded:
+                raise
+        if exceeded and not response_started:
+            await self._too_large(policy, send)
+
+    @staticmethod
+    async def _too_large(policy: UploadPolicy, send):
+        UPLOAD_REJECTIONS.labels(policy.endpoint, "size").inc()
+        await send({
+            "type": "http.response.start",
+            "status": status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            "headers": [(b"content-type", b"application/json")],
+        })
+        await send({"type": "http.response.body", "body": b'{"detail":"File too large"}'})
+
+    @staticmethod
+    async def _bad_length(send):
+        await send({
+            "type": "http.response.start",
+            "status": status.HTTP_400_BAD_REQUEST,
+            "headers": [(b"content-type", b"application/json")],
+        })
+        await send({"type": "http.response.body", "body": b'{"detail":"Invalid Content-Length header"}'})
@@ -0,0 +1,153 @@
+import argparse
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, select
+
+from backend.app.batch import Throttle
+from backend.app.cold_storage import BYTE_EXACT_CODECS, PackWriter, compress
+from backend.app.config import settings
+from backend.app.extensions import SessionLocal
+from backend.app.models import ArchivedBlob, Test
+from backend.app.storage import blob_store
+
+logger = logging.getLogger("archive_images")
+
+MB = 1024 * 1024
+
+
+def iter_candidates(db, cutoff: datetime, page_size: int):
+    """
+    Keyset-paginates images whose most recent test is older than `cutoff` and
+    that are not archived yet. An image shared with a newer test stays hot.
+    """
+    after_key = ""
+    while True:
+        statement = (
+            select(Test.image_path)
+            .outerjoin(ArchivedBlob, ArchivedBlob.key == Test.image_path)
+            .where(ArchivedBlob.key.is_(None), Test.image_path > after_key)
+            .group_by(Test.image_path)
+            .having(func.max(Test.date_conducted) < cutoff)
+            .order_by(Test.image_path)
+            .limit(page_size)
+        )
+        keys = db.execute(statement).scalars().all()
+        if not keys:
+            return
+        yield keys
+        after_key = keys[-1]
+
+
+def finish_pending(db) -> int:
+    """
+    Deletes hot copies of images whose pack is committed. Also completes a run
+    that was interrupted between committing a pack and cleaning up after it.
+    """
+    pending = db.execute(select(ArchivedBlob).where(ArchivedBlob.hot_deleted.is_(False))).scalars().all()
+    for entry in pending:
+        blob_store.delete_hot(entry.key)
+        entry.hot_deleted = True
+    db.commit()
+    return len(pending)
+
+
+def flush_pack(db, writer: PackWriter) -> None:
+    """Uploads a finished pack, then indexes its members in one transaction."""
+    blob_store.backend.put_file(writer.key, writer.close())
+    now = datetime.utcnow()
+    db.execute(insert(ArchivedBlob), [
+        {"key": key, "pack": writer.key, "offset": offset, "length": length, "codec": codec,
+         "original_size": original_size, "hot_deleted": False, "archived_at": now}
+        for key, offset, length, codec, original_size in writer.entries
+    ])
+    db.commit()
+    finish_pending(db)
+    logger.info(f"Wrote {writer.key} with {len(writer.entries)} images ({writer.size / MB:.1f} MB)")
+
+
+def run_archive(args):
+    cutoff = datetime.utcnow() - timedelta(days=args.older_than_days)
+    codecs = [codec.strip() for codec in args.codecs.split(",")]
+    pack_bytes = int(args.pack_mb * MB)
+
+    db = SessionLocal()
+    resumed = finish_pending(db)
+    if resumed:
+        logger.info(f"Finished {resumed} images left over from an interrupted run")
+
+    # Throttle on original bytes read, so the job's I/O stays predictable
+    throttle = Throttle(args.max_mb_per_second * MB if args.max_mb_per_second else None)
+    started = time.monotonic()
+    archived = failed = original_bytes = archived_bytes = 0
+    writer = None
+
+    try:
+        for page in iter_candidates(db, cutoff, args.batch_size):
+            for image_ref in page:
+                try:
+                    with blob_store.open(image_ref) as src:
+                        data = src.read()
+                except Exception as e:
+                    logger.warning(f"Could not read {image_ref}: {e}")
+                    failed += 1
+                    continue
+
+                codec, payload = compress(data, os.path.splitext(image_ref)[1].lower(), codecs)
+                if writer is None:
+                    writer = PackWriter(blob_store.temp_dir, f"{datetime.utcnow():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}")
+                writer.add(image_ref, codec, payload, len(data))
+                archived += 1
+                original_bytes += len(data)
+                archived_bytes += len(payload)
+                throttle.wait(len(data))
+
+                if writer.size >= pack_bytes:
+                    flush_pack(db, writer)
+                    writer = None
+                if args.limit and archived >= args.limit:
+                    break
+            if args.limit and archived >= args.limit:
+                break
+        if writer is not None:
+            flush_pack(db, writer)
+            writer = None
+    finally:
+        if writer is not None:
+            # Images in an unfinished pack stay hot and are picked up by the next run
+            writer.abort()
+        total_original, total_archived, total_images = db.execute(
+            select(func.sum(ArchivedBlob.original_size), func.sum(ArchivedBlob.length), func.count())
+        ).one()
+        db.close()
+
+    elapsed = time.monotonic() - started
+    print(f"Archived {archived} images ({failed} unreadable) in {elapsed:.1f}s: "
+          f"{original_bytes / MB:.1f} MB -> {archived_bytes / MB:.1f} MB, saved {(original_bytes - archived_bytes) / MB:.1f} MB.")
+    if total_images:
+        print(f"Cold tier holds {total_images} images: {(total_original or 0) / MB:.1f} MB -> "
+              f"{(total_archived or 0) / MB:.1f} MB, saved {((total_original or 0) - (total_archived or 0)) / MB:.1f} MB.")
+
+
+# If running as a standalone script
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move images of old tests into compressed pack files in the cold tier.")
+    parser.add_argument("--older-than-days", type=int, default=settings.COLD_STORAGE_AGE_DAYS,
+                        help="Archive images whose latest test is older than this")
+    parser.add_argument("--codecs", default=",".join(BYTE_EXACT_CODECS),
+                        help="Lossless codecs to try, smallest wins: lzma, zlib (byte-exact), or opt in to "
+                             "webp (PNG only, pixel-exact but not byte-exact)")
+    parser.add_argument("--pack-mb", type=float, default=settings.COLD_PACK_BYTES / MB, help="Target size of each pack file")
+    parser.add_argument("--batch-size", type=int, default=500, help="Candidate images fetched per query")
+    parser.add_argument("--max-mb-per-second", type=float, default=None, help="Maximum original bytes read per second")
+    parser.add_argument("--nice", type=int, default=10, help="Process niceness increment")
+    parser.add_argument("--limit", type=int, default=None, help="Stop after this many images")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.nice:
+        os.nice(args.nice)
+    run_archive(args)
@@ -0,0 +1,148 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import List
+
+import numpy as np
+from sqlalchemy import insert
+
+from backend.app.batch import Throttle, iter_test_pages, load_input
+from backend.app.extensions import SessionLocal
+from backend.app.models import BackfillCheckpoint, PredictionRecord
+
+logger = logging.getLogger("backfill")
+
+
+# ----------------------------------------
+# Backfill Job
+# ----------------------------------------
+
+def load_checkpoint(db, model_version: str, restart: bool) -> BackfillCheckpoint:
+    checkpoint = db.get(BackfillCheckpoint, model_version)
+    if checkpoint is None:
+        checkpoint = BackfillCheckpoint(model_version=model_version, last_test_id=0, processed=0, failed=0)
+        db.add(checkpoint)
+        db.commit()
+    elif restart:
+        db.query(PredictionRecord).filter(PredictionRecord.model_version == model_version).delete()
+        checkpoint.last_test_id = checkpoint.processed = checkpoint.failed = 0
+        db.commit()
+    return checkpoint
+
+
+def write_results(db, checkpoint: BackfillCheckpoint, model_version: str, test_ids: List[int], scores, class_indices, failed: int):
+    """Bulk-inserts a batch of predictions and advances the checkpoint in the same transaction."""
+    rows = []
+    for test_id, row in zip(test_ids, scores):
+        predictions = [(class_indices[i], float(row[i])) for i in range(len(class_indices))]
+        top_class, top_confidence = max(predictions, key=lambda x: x[1])
+        rows.append({
+            "test_id": test_id,
+            "model_version": model_version,
+            "result": top_class,
+            "confidence": top_confidence,
+            "predictions": json.dumps(predictions),
+            "created_at": datetime.utcnow(),
+        })
+    if rows:
+        db.execute(insert(PredictionRecord), rows)
+    checkpoint.processed += len(rows)
+    checkpoint.failed += failed
+    db.commit()
+
+
+def run_backfill(args):
+    from tensorflow.keras.models import load_model
+    from backend.app.helpers import CLASS_DICT_PATH, MODEL_PATH, cbam_block, load_class_dict
+    from backend.app.inference import InferenceProfile, compile_predict, configure_runtime
+
+    profile = InferenceProfile.from_settings()
+    configure_runtime(profile)
+    model = load_model(args.model_path or MODEL_PATH, custom_objects={'cbam_block': cbam_block})
+    predict = compile_predict(model, profile)
+    class_indices = load_class_dict(args.class_dict or CLASS_DICT_PATH)
+
+    db = SessionLocal()
+    checkpoint = load_checkpoint(db, args.model_version, args.restart)
+    logger.info(f"Backfilling {args.model_version} from test ID {checkpoint.last_test_id}")
+
+    throttle = Throttle(args.max_rate)
+    started = time.monotonic()
+
+    try:
+        # Spawned rather than forked: the parent already runs TensorFlow threads
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=args.workers, mp_context=context) as pool:
+            pages = iter_test_pages(db, checkpoint.last_test_id, args.batch_size, args.date_from, args.date_to)
+
+            def submit(page):
+                # map() starts decoding the whole page right away
+                return page, pool.map(load_input, [image_path for _, image_path in page], chunksize=8)
+
+            # Keep `prefetch` pages decoding ahead of the one being inferred
+            pending = []
+            for page in pages:
+                pending.append(submit(page))
+                if len(pending) <= args.prefetch:
+                    continue
+                inferred = _infer_page(db, predict, checkpoint, class_indices, args, *pending.pop(0))
+                throttle.wait(inferred)
+                if args.limit and checkpoint.processed >= args.limit:
+                    break
+            else:
+                for page, inputs in pending:
+                    inferred = _infer_page(db, predict, checkpoint, class_indices, args, page, inputs)
+                    throttle.wait(inferred)
+    finally:
+        db.close()
+
+    elapsed = time.monotonic() - started
+    print(f"Processed {checkpoint.processed} tests ({checkpoint.failed} failed) in {elapsed:.1f}s.")
+
+
+def _infer_page(db, predict, checkpoint, class_indices, args, page, inputs) -> int:
+    """Runs inference on a decoded page and checkpoints it; returns how many images were inferred."""
+    test_ids, batch = [], []
+    for (test_id, _), tensor in zip(page, inputs):
+        if tensor is not None:
+            test_ids.append(test_id)
+            batch.append(tensor)
+    failed = len(page) - len(batch)
+
+    scores = predict(np.stack(batch)) if batch else []
+    checkpoint.last_test_id = page[-1][0]
+    write_results(db, checkpoint, args.model_version, test_ids, scores, class_indices, failed)
+    logger.info(f"Checkpoint at test ID {checkpoint.last_test_id} ({checkpoint.processed} done)")
+    return len(batch)
+
+
+def parse_date(value: str) -> datetime:
+    return datetime.strptime(value, "%Y-%m-%d")
+
+
+# If running as a standalone script
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-score existing tests with a model version and store the results.")
+    parser.add_argument("--model-version", required=True, help="Label stored with every prediction, e.g. 'cbam-b0-2024-10'")
+    parser.add_argument("--model-path", default=None, help="Defaults to the deployed model")
+    parser.add_argument("--class-dict", default=None, help="Defaults to the deployed class dictionary")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--prefetch", type=int, default=2, help="Batches decoded ahead of inference")
+    parser.add_argument("--max-rate", type=float, default=None, help="Maximum images per second")
+    parser.add_argument("--nice", type=int, default=10, help="Process niceness increment")
+    parser.add_argument("--date-from", type=parse_date, default=None)
+    parser.add_argument("--date-to", type=parse_date, default=None)
+    parser.add_argument("--limit", type=int, default=None, help="Stop after roughly this many tests")
+    parser.add_argument("--restart", action="store_true", help="Ignore the saved checkpoint")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.nice:
+        os.nice(args.nice)
+    run_backfill(args)
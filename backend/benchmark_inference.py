@@ -0,0 +1,143 @@
+import argparse
+import csv
+import itertools
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+# How the model is invoked: Keras' model.predict, a traced tf.function, or the same with XLA
+PATHS = {
+    "predict": {"compiled": False, "xla": False},
+    "compiled": {"compiled": True, "xla": False},
+    "xla": {"compiled": True, "xla": True},
+}
+
+
+def int_list(value: str):
+    return [int(v) for v in value.split(",")]
+
+
+def str_list(value: str):
+    return [v.strip() for v in value.split(",")]
+
+
+# ----------------------------------------
+# One Configuration (runs in its own process)
+# ----------------------------------------
+
+def run_single(config: dict, batch_sizes, iterations: int, warmup: int, model_path=None):
+    """
+    Loads the model under one profile and times it for each batch size.
+    TensorFlow's thread pools and oneDNN are fixed once the runtime starts,
+    which is why every configuration gets a fresh process.
+    """
+    from tensorflow.keras.models import load_model
+    from backend.app.helpers import MODEL_PATH, cbam_block
+    from backend.app.inference import INPUT_SHAPE, InferenceProfile, compile_predict, configure_runtime
+
+    profile = InferenceProfile(
+        intra_op_threads=config["intra"],
+        inter_op_threads=config["inter"],
+        bf16=config["bf16"],
+        **PATHS[config["path"]],
+    )
+    configure_runtime(profile)
+    model = load_model(model_path or MODEL_PATH, custom_objects={'cbam_block': cbam_block})
+
+    started = time.perf_counter()
+    predict = compile_predict(model, profile)
+    setup_seconds = time.perf_counter() - started
+
+    rng = np.random.default_rng(0)
+    for batch_size in batch_sizes:
+        batch = rng.uniform(0, 255, size=(batch_size,) + INPUT_SHAPE).astype(np.float32)
+        for _ in range(warmup):
+            predict(batch)
+        timings = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            predict(batch)
+            timings.append(time.perf_counter() - started)
+
+        timings = np.array(timings) * 1000
+        print(json.dumps({
+            **config,
+            "batch": batch_size,
+            "setup_s": round(setup_seconds, 2),
+            "p50_ms": round(float(np.percentile(timings, 50)), 2),
+            "p95_ms": round(float(np.percentile(timings, 95)), 2),
+            "images_per_s": round(batch_size * 1000 / float(np.mean(timings)), 1),
+            "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024,
+        }), flush=True)
+
+
+# ----------------------------------------
+# Benchmark Matrix
+# ----------------------------------------
+
+def run_matrix(args):
+    results = []
+    configs = itertools.product(args.intra, args.inter, args.paths, args.bf16, args.onednn)
+    for intra, inter, path, bf16, onednn in configs:
+        if bf16 == "on" and onednn == "off":
+            # bfloat16 rewrites are a oneDNN pass, so this would repeat the float32 run
+            continue
+        config = {"intra": intra, "inter": inter, "path": path, "bf16": bf16 == "on", "onednn": onednn == "on"}
+        env = dict(os.environ, TF_ENABLE_ONEDNN_OPTS="1" if config["onednn"] else "0", TF_CPP_MIN_LOG_LEVEL="2")
+        command = [
+            sys.executable, "-m", "backend.benchmark_inference", "--single", json.dumps(config),
+            "--batch-sizes", ",".join(map(str, args.batch_sizes)),
+            "--iterations", str(args.iterations), "--warmup", str(args.warmup),
+        ]
+        if args.model_path:
+            command += ["--model-path", args.model_path]
+
+        print(f"Running {config}", file=sys.stderr)
+        completed = subprocess.run(command, env=env, capture_output=True, text=True)
+        if completed.returncode != 0:
+            print(f"  failed: {completed.stderr.strip().splitlines()[-1:]}", file=sys.stderr)
+            continue
+        results.extend(json.loads(line) for line in completed.stdout.splitlines() if line.startswith("{"))
+
+    report(results)
+    if args.output:
+        with open(args.output, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(results[0]) if results else [])
+            writer.writeheader()
+            writer.writerows(results)
+        print(f"\nWrote {len(results)} rows to {args.output}")
+
+
+def report(results):
+    header = f"{'intra':>6}{'inter':>6} {'path':<9}{'bf16':<6}{'onednn':<7}{'batch':>6}{'setup s':>9}{'p50 ms':>9}{'p95 ms':>9}{'img/s':>9}{'rss MB':>8}"
+    print(header)
+    for r in sorted(results, key=lambda r: (r["batch"], r["p50_ms"])):
+        print(f"{r['intra']:>6}{r['inter']:>6} {r['path']:<9}{'on' if r['bf16'] else 'off':<6}{'on' if r['onednn'] else 'off':<7}"
+              f"{r['batch']:>6}{r['setup_s']:>9.2f}{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}{r['images_per_s']:>9.1f}{r['max_rss_mb']:>8}")
+
+
+# If running as a standalone script
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark CPU inference across thread, compilation and precision settings.")
+    parser.add_argument("--intra", type=int_list, default=[0, 1, 2, 4], help="Intra-op thread counts (0 = TensorFlow default)")
+    parser.add_argument("--inter", type=int_list, default=[0, 1, 2], help="Inter-op thread counts (0 = TensorFlow default)")
+    parser.add_argument("--paths", type=str_list, default=list(PATHS), help=f"Predict paths: {', '.join(PATHS)}")
+    parser.add_argument("--bf16", type=str_list, default=["off", "on"])
+    parser.add_argument("--onednn", type=str_list, default=["on", "off"])
+    parser.add_argument("--batch-sizes", type=int_list, default=[1, 8])
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--model-path", default=None, help="Defaults to the deployed model")
+    parser.add_argument("--output", default=None, help="Also write the results as CSV")
+    parser.add_argument("--single", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        run_single(json.loads(args.single), args.batch_sizes, args.iterations, args.warmup, args.model_path)
+    else:
+        run_matrix(args)
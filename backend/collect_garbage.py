@@ -0,0 +1,37 @@
+import argparse
+import logging
+import os
+import time
+
+from backend.app.cleanup import reconcile_storage
+
+
+def run(args):
+    while True:
+        started = time.monotonic()
+        report = reconcile_storage(args.grace_minutes * 60, args.batch_size, args.dry_run)
+        verb = "Would remove" if args.dry_run else "Removed"
+        print(f"{verb} {report['released_blobs']} released blobs, {report['leaked_objects']} untracked objects, "
+              f"{report['legacy_uploads']} legacy uploads, {report['derivatives']} derivative files "
+              f"and {report['expired_uploads']} expired resumable uploads "
+              f"in {time.monotonic() - started:.1f}s.", flush=True)
+        if not args.interval:
+            return
+        time.sleep(args.interval)
+
+
+# If running as a standalone script
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reconcile stored files against the database and delete orphans.")
+    parser.add_argument("--grace-minutes", type=float, default=60,
+                        help="Leave files younger than this alone (uploads still in flight)")
+    parser.add_argument("--batch-size", type=int, default=500, help="Keys checked against the database per query")
+    parser.add_argument("--interval", type=int, default=0, help="Run again every N seconds (0 = run once)")
+    parser.add_argument("--nice", type=int, default=10, help="Process niceness increment")
+    parser.add_argument("--dry-run", action="store_true", help="Only count what would be removed")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.nice:
+        os.nice(args.nice)
+    run(args)
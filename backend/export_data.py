@@ -0,0 +1,61 @@
+import argparse
+import sys
+from datetime import datetime
+
+from backend.app.extensions import SessionLocal
+from backend.app.export import DEFAULT_BATCH_SIZE, export_patients, export_tests
+
+EXPORTERS = {
+    "patients": export_patients,
+    "tests": export_tests,
+}
+
+
+def export_table(table: str, fmt: str, output: str, user_id=None, date_from=None, date_to=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Streams a table to a file (or stdout when output is '-') batch by batch.
+    Args:
+        table (str): 'patients' or 'tests'.
+        fmt (str): 'csv' or 'parquet'.
+        output (str): Output file path, or '-' for stdout.
+        user_id (int): Only export rows owned by this user.
+        date_from (datetime): Inclusive lower bound on the row date.
+        date_to (datetime): Exclusive upper bound on the row date.
+        batch_size (int): Rows fetched per cursor round trip.
+    """
+    db = SessionLocal()
+    try:
+        chunks = EXPORTERS[table](db, fmt, user_id=user_id, date_from=date_from, date_to=date_to, batch_size=batch_size)
+        stream = sys.stdout.buffer if output == "-" else open(output, "wb")
+        written = 0
+        try:
+            for chunk in chunks:
+                stream.write(chunk)
+                written += len(chunk)
+        finally:
+            if stream is not sys.stdout.buffer:
+                stream.close()
+        return written
+    finally:
+        db.close()
+
+
+def parse_date(value: str) -> datetime:
+    return datetime.strptime(value, "%Y-%m-%d")
+
+
+# If running as a standalone script
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the patients or tests table to CSV or Parquet.")
+    parser.add_argument("table", choices=sorted(EXPORTERS))
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv")
+    parser.add_argument("--output", default="-", help="Output file path ('-' for stdout)")
+    parser.add_argument("--user-id", type=int, default=None)
+    parser.add_argument("--date-from", type=parse_date, default=None, help="YYYY-MM-DD, inclusive")
+    parser.add_argument("--date-to", type=parse_date, default=None, help="YYYY-MM-DD, exclusive")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    written = export_table(args.table, args.format, args.output, args.user_id, args.date_from, args.date_to, args.batch_size)
+    if args.output != "-":
+        print(f"Exported {args.table} to {args.output} ({written} bytes).")
@@ -0,0 +1,142 @@
+import argparse
+import asyncio
+import random
+import time
+from collections import defaultdict
+
+import httpx
+import numpy as np
+
+from backend.synthetic import SEED_PASSWORD, synthetic_xray
+
+# Relative weights of what a clinician does during a session
+SCENARIO_MIX = {
+    "list_patients": 30,
+    "view_patient": 25,
+    "view_tests": 20,
+    "submit_test": 10,
+    "download_report": 10,
+    "login": 5,
+}
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, name: str, seconds: float, ok: bool):
+        self.latencies[name].append(seconds)
+        if not ok:
+            self.errors[name] += 1
+
+    def report(self, elapsed: float):
+        total = sum(len(v) for v in self.latencies.values())
+        print(f"\n{total} requests in {elapsed:.1f}s ({total / elapsed:.1f} req/s)\n")
+        print(f"{'endpoint':<18}{'count':>8}{'rps':>8}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for name in sorted(self.latencies):
+            samples = np.array(self.latencies[name]) * 1000
+            p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+            print(f"{name:<18}{len(samples):>8}{len(samples) / elapsed:>8.1f}{self.errors[name]:>8}"
+                  f"{p50:>10.1f}{p95:>10.1f}{p99:>10.1f}")
+
+
+class VirtualUser:
+    """One simulated clinician: logs in, then picks scenarios from SCENARIO_MIX."""
+
+    def __init__(self, client: httpx.AsyncClient, username: str, stats: Stats, images):
+        self.client = client
+        self.username = username
+        self.stats = stats
+        self.images = images
+        self.headers = {}
+        self.patient_ids = []
+        self.test_ids = []
+
+    async def timed(self, name: str, method: str, url: str, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+            ok = response.status_code < 400
+        except httpx.HTTPError:
+            response, ok = None, False
+        self.stats.record(name, time.perf_counter() - started, ok)
+        return response if ok else None
+
+    async def login(self):
+        response = await self.timed("login", "POST", "/api/login",
+                                    json={"username": self.username, "password": SEED_PASSWORD})
+        if response is not None:
+            self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    async def list_patients(self):
+        offset = random.randint(0, 5) * 10
+        response = await self.timed("list_patients", "GET", "/api/patients",
+                                    params={"limit": 10, "offset": offset}, headers=self.headers)
+        if response is not None:
+            self.patient_ids = [p["id"] for p in response.json()["patients"]] or self.patient_ids
+
+    async def view_patient(self):
+        if not self.patient_ids:
+            return await self.list_patients()
+        await self.timed("view_patient", "GET", f"/api/patients/{random.choice(self.patient_ids)}", headers=self.headers)
+
+    async def view_tests(self):
+        if not self.patient_ids:
+            return await self.list_patients()
+        response = await self.timed("view_tests", "GET", f"/api/tests/patient/{random.choice(self.patient_ids)}",
+                                    headers=self.headers)
+        if response is not None:
+            self.test_ids = [t["id"] for t in response.json()] or self.test_ids
+
+    async def submit_test(self):
+        if not self.patient_ids:
+            return await self.list_patients()
+        files = {"image": ("xray.png", random.choice(self.images), "image/png")}
+        data = {"patientId": str(random.choice(self.patient_ids))}
+        await self.timed("submit_test", "POST", "/api/tests", files=files, data=data, headers=self.headers)
+
+    async def download_report(self):
+        if not self.test_ids:
+            return await self.view_tests()
+        await self.timed("download_report", "GET", f"/api/report/download/{random.choice(self.test_ids)}",
+                         headers=self.headers)
+
+    async def run(self, deadline: float, think_time: float):
+        await self.login()
+        names, weights = zip(*SCENARIO_MIX.items())
+        while time.monotonic() < deadline:
+            await getattr(self, random.choices(names, weights)[0])()
+            if think_time:
+                await asyncio.sleep(random.expovariate(1 / think_time))
+
+
+async def run_load(base_url: str, users: int, seeded_users: int, prefix: str, duration: float, think_time: float):
+    stats = Stats()
+    images = [synthetic_xray(size=1024, seed=90000 + i) for i in range(8)]
+    limits = httpx.Limits(max_connections=users, max_keepalive_connections=users)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+        deadline = time.monotonic() + duration
+        started = time.monotonic()
+        virtual_users = [
+            VirtualUser(client, f"{prefix}{i % seeded_users}", stats, images)
+            for i in range(users)
+        ]
+        await asyncio.gather(*(vu.run(deadline, think_time) for vu in virtual_users))
+
+    stats.report(time.monotonic() - started)
+
+
+# If running as a standalone script
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Drive a local LDCS instance with a realistic request mix.")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--users", type=int, default=20, help="Concurrent virtual users")
+    parser.add_argument("--seeded-users", type=int, default=10, help="Number of accounts created by seed_data.py")
+    parser.add_argument("--prefix", default="loaduser")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds to run")
+    parser.add_argument("--think-time", type=float, default=0.5, help="Mean pause between actions in seconds")
+    args = parser.parse_args()
+
+    asyncio.run(run_load(args.base_url, args.users, args.seeded_users, args.prefix, args.duration, args.think_time))
@@ -3,8 +3,16 @@ from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
+from prometheus_client import make_asgi_app
 
-from backend.app.helpers import load_model_and_class_dict
+from backend.app.admission import AdmissionMiddleware, init_rate_limiter
+from backend.app.audit import AuditMiddleware, audit_writer
+from backend.app.cleanup import has_delete_cascades
+from backend.app import helpers
+from backend.app.events import event_bus
+from backend.app.metrics import RequestMetricsMiddleware, bind_threadpool_metrics, metrics_registry
+from backend.app.profiling import ProfilingMiddleware
+from backend.app.uploads import UploadSizeLimitMiddleware
 from backend.app.routes import router  # Import your app's routes
 from backend.app.database import engine, Base  # Import database and ORM setup
 
@@ -30,7 +38,29 @@ else:
 # Load the model when the application starts
 @app.on_event("startup")
 def startup_event():
-    load_model_and_class_dict()
+    # Under backend.serve the model was already loaded in the master and is shared
+    if helpers.model is None:
+        helpers.load_model_and_class_dict()
+    # Warn once if an older schema needs explicit deletes instead of cascades
+    has_delete_cascades()
+    audit_writer.start()
+    event_bus.start()
+
+# Threadpool gauges read anyio's limiter, which is only reachable from the event loop
+@app.on_event("startup")
+async def bind_metrics():
+    await bind_threadpool_metrics()
+
+# Per-user rate limits on new tests are kept in redis when REDIS_URL is set
+@app.on_event("startup")
+async def init_rate_limits():
+    await init_rate_limiter()
+
+# Flush pending audit events and stop listening for broker events before the process exits
+@app.on_event("shutdown")
+def shutdown_event():
+    audit_writer.stop()
+    event_bus.stop()
 
 
 # Configure CORS settings from environment variables
@@ -45,10 +75,28 @@ app.add_middleware(
     max_age=3600  # Cache the preflight response for 1 hour
 )
 
+# Record patient and test reads in the user activity log
+app.add_middleware(AuditMiddleware)
+
+# Refuse oversized upload bodies before they are spooled to disk
+app.add_middleware(UploadSizeLimitMiddleware)
+
+# Shed new tests with 503 + Retry-After while inference is saturated
+app.add_middleware(AdmissionMiddleware)
+
+# Profile requests that an admin opts in with X-Profile, or that are sampled
+app.add_middleware(ProfilingMiddleware)
+
+# Time every request by route template (added last so it wraps the other middleware)
+app.add_middleware(RequestMetricsMiddleware)
+
+# Expose Prometheus metrics
+app.mount("/metrics", make_asgi_app(registry=metrics_registry()))
+
 # Include the main router for your application's endpoints
 app.include_router(router)
 
-# Run the application if executed directly
+# Run a single development server if executed directly (production uses backend.serve)
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("PORT", 8000)), reload=True)
+    uvicorn.run("backend.main:app", host="0.0.0.0", port=int(os.getenv("PORT", 8000)), reload=os.getenv("RELOAD") == "1")
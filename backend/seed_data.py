@@ -0,0 +1,137 @@
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta
+from io import BytesIO
+
+import numpy as np
+from faker import Faker
+from sqlalchemy import insert, select, update
+
+from backend.app.extensions import SessionLocal
+from backend.app.helpers import hash_password, load_class_dict
+from backend.app.models import Patient, StoredBlob, Test, User
+from backend.app.storage import blob_store
+from backend.synthetic import SEED_PASSWORD, synthetic_xray
+
+GENDERS = ["Male", "Female", "Other"]
+BLOOD_TYPES = ['A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-']
+INSERT_BATCH = 1000
+
+
+def _insert_batches(db, model, rows):
+    for start in range(0, len(rows), INSERT_BATCH):
+        db.execute(insert(model), rows[start:start + INSERT_BATCH])
+
+
+def seed(n_users: int, n_patients: int, n_tests: int, n_images: int, prefix: str, seed_value: int):
+    """
+    Generates users, patients and tests with synthetic images directly in the
+    database and blob store. Tests reuse a pool of `n_images` distinct images,
+    which exercises blob deduplication the way repeated films do.
+    """
+    fake = Faker()
+    Faker.seed(seed_value)
+    random.seed(seed_value)
+    np.random.seed(seed_value)
+    class_names = list(load_class_dict().values())
+    db = SessionLocal()
+    started = time.monotonic()
+
+    try:
+        # Users: hashing is deliberately slow, so every seeded user shares one hash
+        password_hash = hash_password(SEED_PASSWORD)
+        now = datetime.utcnow()
+        _insert_batches(db, User, [
+            {
+                "username": f"{prefix}{i}",
+                "password_hash": password_hash,
+                "display_name": fake.name(),
+                "email": f"{prefix}{i}@example.com",
+                "is_admin": False,
+                "is_active": True,
+                "created_at": now,
+                "updated_at": now,
+            }
+            for i in range(n_users)
+        ])
+        user_ids = db.execute(select(User.id).where(User.username.like(f"{prefix}%"))).scalars().all()
+
+        # Patients, with unique phone numbers derived from the run seed
+        phone_base = 10 ** 9 + seed_value * 10 ** 7
+        _insert_batches(db, Patient, [
+            {
+                "user_id": random.choice(user_ids),
+                "name": fake.name(),
+                "date_of_birth": fake.date_of_birth(minimum_age=1, maximum_age=95),
+                "gender": random.choice(GENDERS),
+                "address": fake.address().replace("\n", ", "),
+                "phone": f"+1{phone_base + i}",
+                "blood_type": random.choice(BLOOD_TYPES),
+                "created_at": now,
+                "updated_at": now,
+            }
+            for i in range(n_patients)
+        ])
+        patients = db.execute(
+            select(Patient.id, Patient.user_id).where(Patient.user_id.in_(user_ids))
+        ).all()
+
+        # Image pool in the blob store
+        image_keys = [
+            blob_store.put(db, BytesIO(synthetic_xray(seed=seed_value * 100000 + i)), "synthetic.png")
+            for i in range(n_images)
+        ]
+
+        # Tests with random but well-formed predictions
+        references = {key: 0 for key in image_keys}
+        tests = []
+        for _ in range(n_tests):
+            patient_id, user_id = random.choice(patients)
+            key = random.choice(image_keys)
+            references[key] += 1
+            scores = np.random.dirichlet(np.ones(len(class_names)) * 0.5)
+            predictions = [(name, float(score)) for name, score in zip(class_names, scores)]
+            top_class, top_confidence = max(predictions, key=lambda x: x[1])
+            conducted = now - timedelta(days=random.randint(0, 3 * 365), seconds=random.randint(0, 86400))
+            tests.append({
+                "patient_id": patient_id,
+                "user_id": user_id,
+                "image_path": key,
+                "result": top_class,
+                "confidence": top_confidence,
+                "predictions": json.dumps(predictions),
+                "date_conducted": conducted,
+                "created_at": conducted,
+                "updated_at": conducted,
+            })
+        _insert_batches(db, Test, tests)
+
+        # put() counted one reference per pool image; account for the tests instead
+        for key, count in references.items():
+            db.execute(
+                update(StoredBlob).where(StoredBlob.key == key).values(ref_count=StoredBlob.ref_count + count - 1)
+            )
+
+        db.commit()
+    finally:
+        db.close()
+
+    elapsed = time.monotonic() - started
+    print(f"Seeded {n_users} users, {n_patients} patients, {n_tests} tests ({n_images} images) in {elapsed:.1f}s.")
+    print(f"Seeded users log in as '{prefix}<n>' with password '{SEED_PASSWORD}'.")
+
+
+# If running as a standalone script
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seed the database and blob store with synthetic data.")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--patients", type=int, default=1000)
+    parser.add_argument("--tests", type=int, default=5000)
+    parser.add_argument("--images", type=int, default=50, help="Distinct synthetic images shared by the tests")
+    parser.add_argument("--prefix", default="loaduser", help="Username prefix for seeded users")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    seed(args.users, args.patients, args.tests, args.images, args.prefix, args.seed)
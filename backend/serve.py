@@ -0,0 +1,333 @@
+import argparse
+import gc
+import logging
+import os
+import random
+import shutil
+import signal
+import socket
+import tempfile
+import time
+
+from backend.app.config import settings
+
+logger = logging.getLogger("serve")
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+MIB = 1024 * 1024
+
+
+# ----------------------------------------
+# Memory Accounting
+# ----------------------------------------
+
+def current_rss() -> int:
+    """Resident set size of this process in bytes, from /proc (cheap enough to poll)."""
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * PAGE_SIZE
+
+
+def process_memory(pid: int) -> dict:
+    """
+    RSS, PSS and shared bytes for a process. PSS divides each shared page between
+    the processes mapping it, so summing PSS gives the real footprint of the pool.
+    """
+    memory = {"rss": 0, "pss": 0, "shared": 0}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                field, value = line.split(":", 1)
+                kilobytes = int(value.split()[0]) if value.strip().endswith("kB") else 0
+                if field == "Rss":
+                    memory["rss"] = kilobytes * 1024
+                elif field == "Pss":
+                    memory["pss"] = kilobytes * 1024
+                elif field in ("Shared_Clean", "Shared_Dirty"):
+                    memory["shared"] += kilobytes * 1024
+    except (OSError, ValueError):
+        pass
+    return memory
+
+
+# ----------------------------------------
+# Worker Process
+# ----------------------------------------
+
+def run_worker(app, sock: socket.socket, max_requests: int, max_rss: int, graceful_timeout: int):
+    import uvicorn
+
+    class RecyclingServer(uvicorn.Server):
+        """Stops accepting work once the worker's RSS passes `max_rss`; the master replaces it."""
+
+        async def on_tick(self, counter: int) -> bool:
+            # Ticks are 0.1 s apart; check memory once a second
+            if max_rss and counter % 10 == 0 and not self.should_exit and current_rss() > max_rss:
+                logger.warning(f"Worker {os.getpid()} RSS above {max_rss // MIB} MiB, recycling")
+                self.should_exit = True
+            return await super().on_tick(counter)
+
+    config = uvicorn.Config(
+        app,
+        limit_max_requests=max_requests or None,
+        timeout_graceful_shutdown=graceful_timeout,
+        proxy_headers=True,
+        log_level="info",
+    )
+    RecyclingServer(config).run(sockets=[sock])
+
+
+# ----------------------------------------
+# Pre-fork Master
+# ----------------------------------------
+
+class Master:
+    """
+    Loads the application (and, with --preload model, the model and class
+    dictionary) once, then forks `workers` processes that serve from the same listening
+    socket. Read-only pages, chiefly the model weights, stay shared between
+    workers through copy-on-write. Workers that exit (request limit, RSS limit,
+    crash) are replaced; SIGTERM/SIGINT drain all workers, SIGHUP recycles them
+    one by one and SIGUSR1 logs a memory report.
+    """
+
+    def __init__(self, app, sock: socket.socket, args):
+        self.app = app
+        self.sock = sock
+        self.args = args
+        self.workers = {}
+        self.stopping = False
+        self.report_requested = False
+        self.recycle_queue = []
+        self.retiring = None
+
+    def spawn(self):
+        max_requests = self.args.max_requests
+        if max_requests and self.args.max_requests_jitter:
+            # Spread restarts so workers do not all recycle at the same moment
+            max_requests += random.randint(0, self.args.max_requests_jitter)
+
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = time.monotonic()
+            logger.info(f"Started worker {pid}")
+            return
+
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGUSR1):
+            signal.signal(signum, signal.SIG_DFL)
+        random.seed()
+        _after_fork()
+        exit_code = 0
+        try:
+            run_worker(self.app, self.sock, max_requests, self.args.max_rss_mb * MIB, self.args.graceful_timeout)
+        except Exception:
+            logger.exception(f"Worker {os.getpid()} crashed")
+            exit_code = 1
+        finally:
+            os._exit(exit_code)
+
+    def reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if not pid:
+                return
+            if self.workers.pop(pid, None) is not None:
+                logger.info(f"Worker {pid} exited with status {os.waitstatus_to_exitcode(status)}")
+                _mark_process_dead(pid)
+
+    def memory_report(self):
+        master = process_memory(os.getpid())
+        rows = [(os.getpid(), "master", master)] + [
+            (pid, "worker", process_memory(pid)) for pid in sorted(self.workers)
+        ]
+        lines = [f"{'pid':>8} {'role':<7}{'rss MiB':>10}{'pss MiB':>10}{'shared MiB':>12}"]
+        for pid, role, memory in rows:
+            lines.append(f"{pid:>8} {role:<7}{memory['rss'] / MIB:>10.1f}{memory['pss'] / MIB:>10.1f}{memory['shared'] / MIB:>12.1f}")
+
+        total_pss = sum(memory["pss"] for _, _, memory in rows)
+        worker_rss = [memory["rss"] for _, role, memory in rows if role == "worker"]
+        lines.append(f"Total PSS {total_pss / MIB:.1f} MiB for {len(worker_rss)} workers")
+        if worker_rss:
+            # Without preloading, every worker holds a private copy of what it now shares
+            unshared = sum(worker_rss)
+            lines.append(f"Same workers without sharing: ~{unshared / MIB:.1f} MiB (saves ~{(unshared - total_pss) / MIB:.1f} MiB)")
+        logger.info("Memory report\n" + "\n".join(lines))
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        signal.signal(signal.SIGHUP, self._recycle)
+        signal.signal(signal.SIGUSR1, self._request_report)
+
+        last_report = time.monotonic()
+        while not self.stopping:
+            self.reap()
+            if self.retiring not in self.workers:
+                self.retiring = None
+            if self.recycle_queue and self.retiring is None and len(self.workers) >= self.args.workers:
+                # Rolling restart: retire one worker at a time, the next once its replacement is up
+                pid = self.recycle_queue.pop(0)
+                if pid in self.workers:
+                    self.retiring = pid
+                    _signal_worker(pid, signal.SIGTERM)
+            while len(self.workers) < self.args.workers and not self.stopping:
+                self.spawn()
+
+            interval = self.args.memory_report_interval
+            if self.report_requested or (interval and time.monotonic() - last_report >= interval):
+                self.report_requested = False
+                last_report = time.monotonic()
+                self.memory_report()
+            time.sleep(0.5)
+
+        self.shutdown()
+
+    def shutdown(self):
+        logger.info(f"Stopping {len(self.workers)} workers")
+        for pid in list(self.workers):
+            _signal_worker(pid, signal.SIGTERM)
+
+        deadline = time.monotonic() + self.args.graceful_timeout + 5
+        while self.workers and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        for pid in list(self.workers):
+            logger.warning(f"Worker {pid} did not stop in time, killing it")
+            _signal_worker(pid, signal.SIGKILL)
+        self.reap()
+        self.sock.close()
+
+    def _stop(self, signum, frame):
+        self.stopping = True
+
+    def _recycle(self, signum, frame):
+        self.recycle_queue = list(self.workers)
+
+    def _request_report(self, signum, frame):
+        self.report_requested = True
+
+
+def _signal_worker(pid: int, signum: int):
+    try:
+        os.kill(pid, signum)
+    except ProcessLookupError:
+        pass
+
+
+def _after_fork():
+    """Drops database connections inherited from the master; each worker opens its own."""
+    from backend.app import database, extensions
+
+    extensions.engine.dispose(close=False)
+    database.engine.dispose(close=False)
+
+
+def _mark_process_dead(pid: int):
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(pid)
+
+
+def check_fork_safe(timeout: float) -> bool:
+    """
+    Runs one prediction in a forked child of the master, which has already
+    loaded the model. TensorFlow's thread pools do not survive a fork in every
+    build; when they do not, the child's first inference hangs or crashes.
+    """
+    import numpy as np
+    from backend.app import helpers
+
+    pid = os.fork()
+    if not pid:
+        exit_code = 1
+        try:
+            helpers.predict_fn(np.zeros((1,) + tuple(helpers.model.input_shape[1:]), dtype=np.float32))
+            exit_code = 0
+        finally:
+            os._exit(exit_code)
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        done, status = os.waitpid(pid, os.WNOHANG)
+        if done:
+            return os.waitstatus_to_exitcode(status) == 0
+        time.sleep(0.1)
+    _signal_worker(pid, signal.SIGKILL)
+    os.waitpid(pid, 0)
+    return False
+
+
+def bind_socket(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def serve(args):
+    # Metrics from every worker are written here and aggregated on scrape; must be
+    # set before prometheus_client is first imported
+    metrics_dir = None
+    if not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        metrics_dir = tempfile.mkdtemp(prefix="ldcs-metrics-")
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = metrics_dir
+
+    from backend.app import helpers
+    from backend.app.events import broker_name
+    from backend.main import app
+
+    if args.workers > 1 and broker_name() == "local":
+        # Events published in one worker would never reach sockets held by another
+        raise SystemExit("Live updates need a shared broker with more than one worker: "
+                         "set REDIS_URL (or EVENTS_BROKER=redis), or run with --workers 1")
+
+    if args.preload == "model":
+        helpers.load_model_and_class_dict()
+        if not check_fork_safe(args.fork_check_timeout):
+            raise SystemExit("Inference does not work in a process forked after loading the model; "
+                             "use --preload classes")
+    elif args.preload == "classes":
+        helpers.class_indices = helpers.load_class_dict()
+
+    # Move everything loaded so far out of the collector's reach, so that garbage
+    # collection in the workers does not write to (and un-share) those pages
+    gc.collect()
+    gc.freeze()
+
+    sock = bind_socket(args.host, args.port)
+    logger.info(f"Listening on {args.host}:{args.port} with {args.workers} workers (preload: {args.preload})")
+    try:
+        Master(app, sock, args).run()
+    finally:
+        if metrics_dir:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
+# If running as a standalone script
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the API with a pre-forked pool of workers sharing one loaded model.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", 8000)))
+    parser.add_argument("--workers", type=int, default=settings.WEB_WORKERS)
+    parser.add_argument("--preload", choices=["model", "classes", "none"], default="classes",
+                        help="What the master loads before forking; 'model' shares the weights between workers "
+                             "but is only used if inference is verified to work after a fork")
+    parser.add_argument("--fork-check-timeout", type=float, default=60,
+                        help="Seconds the forked test prediction gets with --preload model")
+    parser.add_argument("--max-requests", type=int, default=settings.WORKER_MAX_REQUESTS,
+                        help="Recycle a worker after this many requests (0 disables)")
+    parser.add_argument("--max-requests-jitter", type=int, default=settings.WORKER_MAX_REQUESTS_JITTER)
+    parser.add_argument("--max-rss-mb", type=int, default=settings.WORKER_MAX_RSS_MB,
+                        help="Recycle a worker whose resident memory exceeds this (0 disables)")
+    parser.add_argument("--graceful-timeout", type=int, default=settings.WORKER_GRACEFUL_TIMEOUT,
+                        help="Seconds a stopping worker gets to finish in-flight requests")
+    parser.add_argument("--memory-report-interval", type=float, default=0,
+                        help="Log per-worker memory every N seconds (0: only on SIGUSR1)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    serve(args)
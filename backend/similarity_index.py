@@ -0,0 +1,79 @@
+import argparse
+import logging
+import time
+
+import numpy as np
+
+from backend.app.batch import iter_test_pages, load_input
+from backend.app.embeddings import embedding_store
+from backend.app.extensions import SessionLocal
+
+logger = logging.getLogger("similarity_index")
+
+
+def embed_missing(batch_size: int, limit=None):
+    """Embeds stored tests that have no row in the embedding matrix yet, in keyset-paginated batches."""
+    from tensorflow.keras.models import load_model
+    from backend.app.helpers import MODEL_PATH, cbam_block
+    from backend.app.config import settings
+    from backend.app.inference import InferenceProfile, compile_predict, configure_runtime, with_embedding_output
+
+    profile = InferenceProfile.from_settings()
+    configure_runtime(profile)
+    model = load_model(MODEL_PATH, custom_objects={'cbam_block': cbam_block})
+    predict = compile_predict(with_embedding_output(model, settings.EMBEDDING_LAYER or None), profile)
+
+    existing = set(embedding_store.existing_ids().tolist())
+    db = SessionLocal()
+    started = time.monotonic()
+    added = failed = 0
+    try:
+        for page in iter_test_pages(db, 0, batch_size):
+            test_ids, batch = [], []
+            for test_id, image_path in page:
+                if test_id in existing:
+                    continue
+                tensor = load_input(image_path)
+                if tensor is None:
+                    failed += 1
+                    continue
+                test_ids.append(test_id)
+                batch.append(tensor)
+            if batch:
+                _, embeddings = predict(np.stack(batch))
+                embedding_store.append(test_ids, embeddings)
+                added += len(test_ids)
+                logger.info(f"Embedded up to test ID {page[-1][0]} ({added} added)")
+            if limit and added >= limit:
+                break
+    finally:
+        db.close()
+
+    print(f"Embedded {added} tests ({failed} unreadable) in {time.monotonic() - started:.1f}s.")
+
+
+def build_index(nlist=None):
+    started = time.monotonic()
+    index = embedding_store.build_index(nlist)
+    print(f"Built IVF index with {len(index.centroids)} lists over {index.built_rows} embeddings "
+          f"in {time.monotonic() - started:.1f}s.")
+
+
+# If running as a standalone script
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the embedding matrix and IVF index for similar-case search.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    embed_parser = subparsers.add_parser("embed", help="Embed tests that are not in the matrix yet")
+    embed_parser.add_argument("--batch-size", type=int, default=64)
+    embed_parser.add_argument("--limit", type=int, default=None, help="Stop after roughly this many tests")
+
+    build_parser = subparsers.add_parser("build", help="(Re)build the IVF index over all embeddings")
+    build_parser.add_argument("--nlist", type=int, default=None, help="Number of clusters (default about 4 * sqrt(N))")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "embed":
+        embed_missing(args.batch_size, args.limit)
+    else:
+        build_index(args.nlist)
@@ -0,0 +1,26 @@
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+# Password shared by every user created by seed_data.py, used by load_test.py to log in
+SEED_PASSWORD = "Loadtest123!"
+
+
+def synthetic_xray(size: int = 512, seed: int = 0) -> bytes:
+    """
+    Returns PNG bytes of a chest-X-ray-like grayscale image: two dark lung
+    fields on a bright body, with ribs and noise. Deterministic per seed.
+    """
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:size, 0:size] / size
+    body = 200 - 120 * ((x - 0.5) ** 2 + (y - 0.55) ** 2)
+    for cx in (0.32, 0.68):
+        lung = ((x - cx) / 0.16) ** 2 + ((y - 0.5) / 0.3) ** 2 < 1
+        body[lung] -= 110 + rng.normal(0, 10)
+    ribs = 15 * np.sin(y * size / 18 + rng.uniform(0, 6.28)) * (np.abs(x - 0.5) > 0.08)
+    pixels = np.clip(body + ribs + rng.normal(0, 8, (size, size)), 0, 255).astype(np.uint8)
+
+    buffer = BytesIO()
+    Image.fromarray(pixels, mode="L").convert("RGB").save(buffer, format="PNG")
+    return buffer.getvalue()
@@ -0,0 +1,91 @@
+import io
+import os
+import shutil
+import tempfile
+from datetime import date
+
+# Settings are read on import, so point them at a scratch directory first
+TEST_ROOT = tempfile.mkdtemp(prefix="ldcs-tests-")
+os.environ.update({
+    "SECRET_KEY": "test-secret",
+    "JWT_SECRET_KEY": "test-jwt-secret",
+    "ALLOWED_ORIGINS": "http://localhost",
+    "DATABASE_URL": f"sqlite:///{os.path.join(TEST_ROOT, 'test.db')}",
+    "STORAGE_BACKEND": "local-s3",
+    "STORAGE_ROOT": os.path.join(TEST_ROOT, "blobs"),
+    "DERIVATIVES_ROOT": os.path.join(TEST_ROOT, "derivatives"),
+    "EMBEDDINGS_DIR": os.path.join(TEST_ROOT, "embeddings"),
+    "AUDIT_SPILL_PATH": os.path.join(TEST_ROOT, "audit_spill.jsonl"),
+    "PROFILES_DIR": os.path.join(TEST_ROOT, "profiles"),
+    "TRACE_EXPORT_PATH": os.path.join(TEST_ROOT, "profiles", "spans.jsonl"),
+})
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from backend.app import cleanup, routes
+from backend.app.cache import response_cache
+from backend.app.database import Base
+from backend.app.extensions import AuthJWT, SessionLocal, engine
+from backend.app.models import Patient, User
+from backend.app.storage import blob_store
+
+
+@pytest.fixture
+def db():
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        Base.metadata.drop_all(bind=engine)
+        # Pooled connections may hold the dropped schema
+        engine.dispose()
+        cleanup._has_delete_cascades = None
+        # Start every test with an empty bucket
+        shutil.rmtree(os.path.join(blob_store.backend.client.root, blob_store.backend.bucket), ignore_errors=True)
+
+
+@pytest.fixture
+def user(db):
+    user = User(username="doctor", password_hash="x", display_name="Doctor")
+    db.add(user)
+    db.commit()
+    return user
+
+
+@pytest.fixture
+def make_patient(db, user):
+    def make_patient(phone: str) -> Patient:
+        patient = Patient(name=f"Patient {phone}", user_id=user.id, date_of_birth=date(1970, 1, 1), gender="Other", phone=phone)
+        db.add(patient)
+        db.commit()
+        return patient
+    return make_patient
+
+
+@pytest.fixture
+def api(db, user):
+    """A client for the API routes, signed in as `user`."""
+    # Cached responses are keyed by row IDs, which restart in every test's database
+    response_cache.local.clear()
+    app = FastAPI()
+    app.include_router(routes.router)
+    client = TestClient(app)
+    client.headers["Authorization"] = f"Bearer {AuthJWT().create_access_token(subject=user.username)}"
+    yield client
+    response_cache.local.clear()
+
+
+def png_bytes(shade: int = 0, size=(32, 32)) -> bytes:
+    """A small grayscale PNG; different shades give different blob keys."""
+    buffer = io.BytesIO()
+    Image.new("L", size, color=shade).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(TEST_ROOT, ignore_errors=True)
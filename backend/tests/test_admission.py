@@ -0,0 +1,131 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from backend.app import admission
+from backend.app.admission import AdmissionController, AdmissionMiddleware, Overloaded, admitted
+
+
+def controller(**overrides):
+    values = dict(max_concurrency=1, max_queue=10, slo_seconds=5, initial_service_time=0.01)
+    values.update(overrides)
+    return AdmissionController("test_pipeline", **values)
+
+
+def test_slots_are_shared_round_robin_across_users():
+    limiter = controller()
+    served = []
+
+    async def request(user, name):
+        await limiter.acquire(user)
+        served.append(name)
+        await asyncio.sleep(0.01)
+        limiter.release(0.01)
+
+    async def main():
+        await limiter.acquire("holder")
+        # One user queues a batch of films before another user submits one
+        tasks = [asyncio.create_task(request("a", f"a{i}")) for i in range(3)]
+        await asyncio.sleep(0)
+        tasks += [asyncio.create_task(request("b", f"b{i}")) for i in range(2)]
+        await asyncio.sleep(0)
+        assert limiter.queued == 5
+        limiter.release(0.01)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+    assert served == ["a0", "b0", "a1", "b1", "a2"]
+    assert (limiter.in_flight, limiter.queued) == (0, 0)
+
+
+def test_sheds_when_queue_is_full():
+    limiter = controller(max_queue=1, initial_service_time=2)
+
+    async def main():
+        await limiter.acquire("a")
+        waiting = asyncio.create_task(limiter.acquire("a"))
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as error:
+            await limiter.acquire("b")
+        waiting.cancel()
+        return error.value
+
+    error = asyncio.run(main())
+    assert error.reason == "queue_full"
+    # One running and one queued request at two seconds each
+    assert error.retry_after == 4
+    assert (limiter.in_flight, limiter.queued) == (1, 0)
+
+
+def test_sheds_when_predicted_wait_exceeds_slo():
+    limiter = controller(slo_seconds=2.5, initial_service_time=1)
+
+    async def main():
+        await limiter.acquire("a")
+        queued = [asyncio.create_task(limiter.acquire("a")) for _ in range(2)]
+        await asyncio.sleep(0)
+        # A third film from the same user waits behind both, another user's only behind one
+        with pytest.raises(Overloaded, match="slo"):
+            limiter.check("a")
+        limiter.check("b")
+        for task in queued:
+            task.cancel()
+
+    asyncio.run(main())
+
+
+def test_queued_request_times_out():
+    limiter = controller(slo_seconds=0.05)
+
+    async def main():
+        await limiter.acquire("a")
+        with pytest.raises(Overloaded, match="timeout"):
+            await limiter.acquire("b")
+
+    asyncio.run(main())
+    assert (limiter.in_flight, limiter.queued) == (1, 0)
+
+
+def test_admitted_raises_503_with_retry_after():
+    limiter = controller(max_queue=0, initial_service_time=3)
+
+    async def main():
+        async with admitted(limiter, "a"):
+            assert limiter.in_flight == 1
+            with pytest.raises(HTTPException) as error:
+                async with admitted(limiter, "b"):
+                    pass
+        return error.value
+
+    error = asyncio.run(main())
+    assert error.status_code == 503
+    assert error.headers == {"Retry-After": "3"}
+    assert limiter.in_flight == 0
+
+
+def call_middleware(limiter):
+    sent = []
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "POST", "path": "/api/tests", "headers": []}
+    middleware = AdmissionMiddleware(app, {("POST", "/api/tests"): limiter})
+    asyncio.run(middleware(scope, None, send))
+    return sent[0]["status"], dict(sent[0]["headers"])
+
+
+def test_middleware_sheds_before_the_body_is_read(monkeypatch):
+    limiter = controller(max_queue=0, initial_service_time=2)
+    limiter.in_flight = 1
+
+    monkeypatch.setattr(admission, "_jwt_subject", lambda scope: "doctor")
+    assert call_middleware(limiter) == (503, {b"content-type": b"application/json", b"retry-after": b"2"})
+
+    # Unauthenticated requests are left for the endpoint to refuse
+    monkeypatch.setattr(admission, "_jwt_subject", lambda scope: None)
+    assert call_middleware(limiter) == (200, {})
@@ -0,0 +1,139 @@
+import asyncio
+import json
+import os
+import time
+
+import pytest
+
+from backend.app.audit import AuditMiddleware, AuditWriter
+from backend.app.models import UserActivity
+
+
+@pytest.fixture
+def writer(db, user, tmp_path):
+    writer = AuditWriter(flush_interval_ms=20, batch_size=3, buffer_size=100, spill_path=str(tmp_path / "spill.jsonl"))
+    yield writer
+    writer.stop()
+
+
+def activities(db):
+    db.expire_all()
+    return [activity.activity for activity in db.query(UserActivity).order_by(UserActivity.id)]
+
+
+def spill_files(writer):
+    directory, name = os.path.split(writer.spill_path)
+    return sorted(entry for entry in os.listdir(directory) if entry.startswith(name) and not entry.endswith(".lock"))
+
+
+def test_flush_writes_in_batches(db, writer, monkeypatch):
+    batches = []
+    write = writer._write
+    monkeypatch.setattr(writer, "_write", lambda events: batches.append(len(events)) or write(events))
+
+    for i in range(7):
+        writer.record("doctor", f"event {i}", {"i": i})
+    writer.record("nobody", "dropped")
+    assert writer.flush()
+
+    assert batches == [3, 3, 2]
+    assert activities(db) == [f"event {i}" for i in range(7)]
+    assert json.loads(db.query(UserActivity).first().details) == {"i": 0}
+
+
+def test_full_buffer_spills_and_replays(db, user, tmp_path):
+    writer = AuditWriter(flush_interval_ms=20, batch_size=10, buffer_size=2, spill_path=str(tmp_path / "spill.jsonl"))
+    for i in range(5):
+        writer.record("doctor", f"event {i}")
+    assert spill_files(writer) == ["spill.jsonl"]
+
+    assert writer.flush()
+    assert sorted(activities(db)) == [f"event {i}" for i in range(5)]
+    assert spill_files(writer) == []
+
+
+def test_failed_write_spills_until_database_recovers(db, writer, monkeypatch):
+    write = writer._write
+    monkeypatch.setattr(writer, "_write", lambda events: False)
+    writer.record("doctor", "first")
+    writer.record("doctor", "second")
+    assert not writer.flush()
+    assert activities(db) == []
+    assert spill_files(writer) == ["spill.jsonl"]
+
+    monkeypatch.setattr(writer, "_write", write)
+    writer.record("doctor", "third")
+    assert writer.flush()
+    assert activities(db) == ["third", "first", "second"]
+    assert spill_files(writer) == []
+
+
+def test_replay_left_by_a_crashed_process(db, writer):
+    # A replay renamed by a process that died before finishing it
+    with open(f"{writer.spill_path}.replay-dead", "w") as f:
+        f.write(json.dumps({"username": "doctor", "activity": "recovered", "details": None,
+                            "timestamp": "2024-01-01T00:00:00"}) + "\n")
+        f.write("{not json\n\n")
+    assert writer.flush()
+    assert activities(db) == ["recovered"]
+    assert spill_files(writer) == []
+
+
+def test_writer_thread_survives_failed_flush(db, writer, monkeypatch):
+    flush = writer.flush
+    calls = []
+
+    def flaky_flush():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("database is locked")
+        return flush()
+
+    monkeypatch.setattr(writer, "flush", flaky_flush)
+    writer.start()
+    writer.record("doctor", "kept")
+    deadline = time.monotonic() + 5
+    while not activities(db) and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert len(calls) > 1
+    assert activities(db) == ["kept"]
+
+    writer.record("doctor", "on shutdown")
+    writer.stop()
+    assert activities(db) == ["kept", "on shutdown"]
+
+
+class RecordingWriter:
+    def __init__(self):
+        self.events = []
+
+    def record(self, username, activity, details=None):
+        self.events.append((username, activity, details))
+
+
+def call(writer, method, path, status_code):
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": status_code, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def send(message):
+        pass
+
+    scope = {"type": "http", "method": method, "path": path, "headers": []}
+    asyncio.run(AuditMiddleware(app, writer)(scope, None, send))
+
+
+def test_middleware_records_successful_reads(monkeypatch):
+    writer = RecordingWriter()
+    monkeypatch.setattr(AuditMiddleware, "_username", staticmethod(lambda scope: "doctor"))
+
+    call(writer, "GET", "/api/tests/7", 200)
+    call(writer, "GET", "/api/export/patients", 200)
+    call(writer, "GET", "/api/patients/3", 404)
+    call(writer, "POST", "/api/patients/3", 200)
+    call(writer, "GET", "/api/users/me", 200)
+
+    assert writer.events == [
+        ("doctor", "Viewed test", {"path": "/api/tests/7", "test_id": "7"}),
+        ("doctor", "Exported data", {"path": "/api/export/patients", "table": "patients"}),
+    ]
@@ -0,0 +1,87 @@
+import json
+import time
+from argparse import Namespace
+from datetime import datetime
+
+import numpy as np
+
+from backend.app.batch import Throttle, iter_test_pages
+from backend.app.models import BackfillCheckpoint, PredictionRecord, Test
+from backend.backfill_predictions import _infer_page, load_checkpoint
+
+CLASSES = {0: "COVID-19", 1: "Normal"}
+
+
+def add_tests(db, patient, count):
+    tests = [
+        Test(patient_id=patient.id, user_id=patient.user_id, result="Normal", confidence=0.5,
+             image_path=f"ab/cd/{i}.png", date_conducted=datetime(2024, 1, 1 + i))
+        for i in range(count)
+    ]
+    db.add_all(tests)
+    db.commit()
+    return [test.id for test in tests]
+
+
+def test_iter_test_pages(db, make_patient):
+    ids = add_tests(db, make_patient("555-0400"), 7)
+
+    pages = list(iter_test_pages(db, 0, 3))
+    assert [[row[0] for row in page] for page in pages] == [ids[0:3], ids[3:6], ids[6:7]]
+    assert pages[0][0][1] == "ab/cd/0.png"
+
+    # Resumes after a checkpoint, and filters by date
+    assert [row[0] for page in iter_test_pages(db, ids[4], 3) for row in page] == ids[5:]
+    pages = iter_test_pages(db, 0, 10, date_from=datetime(2024, 1, 2), date_to=datetime(2024, 1, 4))
+    assert [row[0] for page in pages for row in page] == ids[1:3]
+
+
+def test_checkpoint_restart_drops_results(db, make_patient):
+    test_id = add_tests(db, make_patient("555-0402"), 1)[0]
+    checkpoint = load_checkpoint(db, "v2", restart=False)
+    assert (checkpoint.last_test_id, checkpoint.processed, checkpoint.failed) == (0, 0, 0)
+    checkpoint.last_test_id, checkpoint.processed = 10, 5
+    db.add(PredictionRecord(test_id=test_id, model_version="v2", result="Normal", confidence=0.9, predictions="[]"))
+    db.commit()
+
+    assert load_checkpoint(db, "v2", restart=False).last_test_id == 10
+    checkpoint = load_checkpoint(db, "v2", restart=True)
+    assert (checkpoint.last_test_id, checkpoint.processed) == (0, 0)
+    assert db.query(PredictionRecord).count() == 0
+
+
+def test_infer_page_writes_results_and_skips_unreadable(db, make_patient):
+    ids = add_tests(db, make_patient("555-0401"), 3)
+    page = [(test_id, f"ab/cd/{i}.png") for i, test_id in enumerate(ids)]
+    inputs = [np.zeros((224, 224, 3)), None, np.ones((224, 224, 3))]
+    checkpoint = load_checkpoint(db, "v2", restart=False)
+
+    def predict(batch):
+        # Scores the second class by the mean pixel value
+        means = batch.reshape(len(batch), -1).mean(axis=1)
+        return np.stack([1 - means, means], axis=1)
+
+    inferred = _infer_page(db, predict, checkpoint, CLASSES, Namespace(model_version="v2"), page, inputs)
+    assert inferred == 2
+
+    db.expire_all()
+    checkpoint = db.get(BackfillCheckpoint, "v2")
+    assert (checkpoint.last_test_id, checkpoint.processed, checkpoint.failed) == (ids[-1], 2, 1)
+    records = {record.test_id: record for record in db.query(PredictionRecord)}
+    assert sorted(records) == [ids[0], ids[2]]
+    assert (records[ids[0]].result, records[ids[2]].result) == ("COVID-19", "Normal")
+    assert json.loads(records[ids[2]].predictions) == [["COVID-19", 0.0], ["Normal", 1.0]]
+
+
+def test_throttle_caps_rate():
+    throttle = Throttle(200)
+    started = time.monotonic()
+    for _ in range(5):
+        throttle.wait(10)
+    # 50 images at 200 per second
+    assert time.monotonic() - started >= 0.24
+
+    unthrottled = Throttle(None)
+    started = time.monotonic()
+    unthrottled.wait(10 ** 6)
+    assert time.monotonic() - started < 0.05
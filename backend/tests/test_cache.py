@@ -0,0 +1,127 @@
+import time
+
+import pytest
+from sqlalchemy import select
+from starlette.requests import Request
+
+from backend.app import cache
+from backend.app.cache import CachedResponse, LocalCacheBackend, LRUCache, ResponseCache
+from backend.app.models import Test
+
+
+def http_request(if_none_match=None):
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+def new_cache(shared=None):
+    return ResponseCache(LRUCache(max_entries=10, max_bytes=10000, ttl_seconds=60), shared)
+
+
+@pytest.fixture(params=["upsert", "update"])
+def dialect(request, monkeypatch):
+    # Dialects without ON CONFLICT fall back to UPDATE, then INSERT
+    if request.param == "update":
+        monkeypatch.setattr(cache, "UPSERT_INSERTS", {})
+    return request.param
+
+
+def test_bump_increments_versions(db, dialect):
+    responses = new_cache()
+    assert responses.version(db, "patient:1") == 0
+    responses.bump(db, "patient:1", "patient:2")
+    db.commit()
+    responses.bump(db, "patient:1")
+    db.commit()
+    assert (responses.version(db, "patient:1"), responses.version(db, "patient:2")) == (2, 1)
+
+
+def test_bump_from_select(db, dialect, make_patient):
+    patient = make_patient("555-0500")
+    tests = [Test(patient_id=patient.id, user_id=patient.user_id, result="Normal", confidence=0.5,
+                  image_path=f"ab/cd/{i}.png") for i in range(3)]
+    db.add_all(tests)
+    db.commit()
+    responses = new_cache()
+    responses.bump(db, cache.test_key(tests[0].id))
+
+    responses.bump_from(db, select(cache.test_key_expression(Test.id)).where(Test.patient_id == patient.id))
+    db.commit()
+    assert [responses.version(db, cache.test_key(test.id)) for test in tests] == [2, 1, 1]
+
+
+def test_read_through_until_version_bump(db):
+    responses = new_cache()
+    loads = []
+
+    def load():
+        loads.append(1)
+        return 7, {"name": f"version {len(loads)}"}
+
+    first = responses.read_through(db, "patient", "patient:1", load)
+    assert responses.read_through(db, "patient", "patient:1", load) is first
+    assert (len(loads), first.owner_id, first.body) == (1, 7, b'{"name":"version 1"}')
+
+    responses.bump(db, "patient:1")
+    db.commit()
+    second = responses.read_through(db, "patient", "patient:1", load)
+    assert len(loads) == 2
+    assert second.etag != first.etag
+
+    # Nothing found is not cached
+    assert responses.read_through(db, "patient", "patient:2", lambda: None) is None
+    assert responses.read_through(db, "patient", "patient:2", load).owner_id == 7
+
+
+def test_shared_backend_fills_other_workers(db):
+    shared = LocalCacheBackend()
+    built = new_cache(shared).read_through(db, "test", "test:1", lambda: (3, [1, 2]))
+    entry = new_cache(shared).read_through(db, "test", "test:1", lambda: pytest.fail("loaded twice"))
+    assert (entry.body, entry.etag, entry.owner_id) == (built.body, built.etag, 3)
+
+
+def test_etag_revalidation():
+    entry = CachedResponse.build(1, {"id": 1})
+    assert entry.to_response(http_request()).status_code == 200
+    for header in (entry.etag, f"W/{entry.etag}", f'"other", {entry.etag}', "*"):
+        response = entry.to_response(http_request(header))
+        assert (response.status_code, response.body) == (304, b"")
+        assert response.headers["etag"] == entry.etag
+    assert entry.to_response(http_request('"other"')).status_code == 200
+
+
+def test_lru_bounds_and_expiry(monkeypatch):
+    lru = LRUCache(max_entries=2, max_bytes=10, ttl_seconds=60)
+    lru.set("a", CachedResponse(b"1234", '"a"', 1))
+    lru.set("b", CachedResponse(b"1234", '"b"', 1))
+    lru.get("a")
+    lru.set("c", CachedResponse(b"1234", '"c"', 1))
+    # "b" was least recently used
+    assert (lru.get("a") is not None, lru.get("b"), lru.get("c") is not None) == (True, None, True)
+    lru.set("d", CachedResponse(b"123456789", '"d"', 1))
+    assert (lru.get("a"), lru.get("c"), lru.bytes) == (None, None, 9)
+    # Bodies larger than the whole cache are not stored
+    lru.set("e", CachedResponse(b"x" * 11, '"e"', 1))
+    assert lru.get("e") is None
+
+    later = time.monotonic() + 61
+    monkeypatch.setattr(cache.time, "monotonic", lambda: later)
+    assert lru.get("d") is None
+    assert lru.bytes == 0
+
+
+def test_patient_etag_and_invalidation(api, make_patient):
+    patient = make_patient("555-0501")
+    response = api.get(f"/api/patients/{patient.id}")
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+    assert response.headers["cache-control"] == "private, no-cache"
+
+    assert api.get(f"/api/patients/{patient.id}", headers={"If-None-Match": etag}).status_code == 304
+
+    update = {"name": "Renamed", "dateOfBirth": "1970-01-01", "gender": "Other"}
+    assert api.put(f"/api/patients/{patient.id}", json=update).status_code == 200
+    response = api.get(f"/api/patients/{patient.id}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert response.json()["name"] == "Renamed"
@@ -0,0 +1,99 @@
+import io
+
+import pytest
+from sqlalchemy import func, select
+
+from backend.app import cleanup
+from backend.app.cleanup import CASCADED_FOREIGN_KEYS, collect_released_blobs, delete_patients, has_delete_cascades
+from backend.app.database import Base
+from backend.app.extensions import engine
+from backend.app.models import MedicalHistory, Patient, PredictionRecord, StoredBlob, Test
+from backend.app.storage import blob_store
+from backend.tests.conftest import png_bytes
+
+
+@pytest.fixture(params=["cascade", "legacy"])
+def schema(request, db):
+    """Runs a test against the current schema and one created before ON DELETE CASCADE."""
+    if request.param == "legacy":
+        constraints = [
+            fk.constraint
+            for child, parent in CASCADED_FOREIGN_KEYS
+            for fk in Base.metadata.tables[child].foreign_keys
+            if fk.column.table.name == parent
+        ]
+        Base.metadata.drop_all(bind=engine)
+        for constraint in constraints:
+            constraint.ondelete = None
+        try:
+            Base.metadata.create_all(bind=engine)
+        finally:
+            for constraint in constraints:
+                constraint.ondelete = "CASCADE"
+    cleanup._has_delete_cascades = None
+    return request.param
+
+
+def add_test(db, patient, shade):
+    """Adds a test holding its own reference to the image, as the upload routes do."""
+    key = blob_store.put(db, io.BytesIO(png_bytes(shade)), "scan.png")
+    test = Test(patient_id=patient.id, user_id=patient.user_id, result="Normal", confidence=0.9, image_path=key)
+    db.add(test)
+    db.flush()
+    db.add(PredictionRecord(test_id=test.id, model_version="v1", result="Normal", confidence=0.9, predictions="{}"))
+    return key
+
+
+def count(db, model):
+    return db.execute(select(func.count()).select_from(model)).scalar()
+
+
+def test_detects_missing_cascades(db, schema):
+    assert has_delete_cascades() == (schema == "cascade")
+
+
+def test_delete_patients_releases_references(db, schema, make_patient):
+    removed, kept = make_patient("555-0001"), make_patient("555-0002")
+    shared = add_test(db, removed, 100)
+    own = add_test(db, removed, 110)
+    add_test(db, kept, 100)
+    db.add(MedicalHistory(patient_id=removed.id, condition="Asthma"))
+    db.commit()
+    removed_id = removed.id
+
+    assert delete_patients(db, [removed_id, removed_id]) == 1
+    db.expire_all()
+
+    assert db.get(Patient, removed_id) is None
+    assert count(db, Test) == 1
+    assert count(db, PredictionRecord) == 1
+    assert count(db, MedicalHistory) == 0
+    assert db.get(StoredBlob, shared).ref_count == 1
+    assert db.get(StoredBlob, own).ref_count == 0
+    # Objects stay until the collector runs
+    assert blob_store.exists(own)
+
+
+def test_collect_released_blobs(db, schema, make_patient):
+    removed, kept = make_patient("555-0003"), make_patient("555-0004")
+    shared = add_test(db, removed, 120)
+    own = add_test(db, removed, 130)
+    add_test(db, kept, 120)
+    db.commit()
+    delete_patients(db, [removed.id])
+
+    assert collect_released_blobs(dry_run=True) == 1
+    assert blob_store.exists(own)
+
+    assert collect_released_blobs(batch_size=1) == 1
+    db.expire_all()
+    assert db.get(StoredBlob, own) is None
+    assert not blob_store.exists(own)
+    assert db.get(StoredBlob, shared).ref_count == 1
+    assert blob_store.exists(shared)
+
+    assert collect_released_blobs() == 0
+
+
+def test_delete_patients_without_ids(db):
+    assert delete_patients(db, []) == 0
@@ -0,0 +1,148 @@
+import hashlib
+import io
+import os
+from argparse import Namespace
+from datetime import datetime
+
+import numpy as np
+import pytest
+from PIL import Image, PngImagePlugin
+
+from backend.app.cold_storage import PackWriter, compress, decompress, restored_digest
+from backend.app.models import ArchivedBlob, Test
+from backend.app.storage import blob_store
+from backend.archive_images import run_archive
+from backend.synthetic import synthetic_xray
+
+
+def png_with_metadata(mode="L", size=(48, 40)) -> bytes:
+    pixels = np.random.default_rng(0).integers(0, 255, size=(size[1], size[0]), dtype=np.uint8)
+    info = PngImagePlugin.PngInfo()
+    info.add_text("Comment", "acquired on a test device")
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).convert(mode).save(buffer, format="PNG", pnginfo=info)
+    return buffer.getvalue()
+
+
+def pixels(data: bytes) -> np.ndarray:
+    with Image.open(io.BytesIO(data)) as img:
+        return np.asarray(img)
+
+
+@pytest.mark.parametrize("codec", ["zlib", "lzma"])
+def test_byte_exact_codecs(codec):
+    data = synthetic_xray(size=64) + bytes(4096)
+    chosen, payload = compress(data, ".png", [codec])
+    assert chosen == codec
+    assert len(payload) < len(data)
+    assert decompress(codec, payload) == data
+    assert restored_digest(codec) is None
+
+
+def test_incompressible_data_is_stored():
+    data = os.urandom(2048)
+    assert compress(data, ".jpg", ["zlib", "lzma"]) == ("store", data)
+    assert decompress("store", data) == data
+
+
+@pytest.mark.parametrize("mode", ["L", "RGB"])
+def test_webp_restores_pixels_and_records_digest(mode):
+    data = png_with_metadata(mode)
+    codec, payload = compress(data, ".png", ["webp"])
+    assert codec.startswith(f"webp:{mode}:")
+
+    restored = decompress(codec, payload)
+    # A different file with the same pixels, whose hash the codec records
+    assert restored != data
+    np.testing.assert_array_equal(pixels(restored), pixels(data))
+    assert restored_digest(codec) == hashlib.sha256(restored).hexdigest()
+
+
+def test_webp_only_for_supported_pngs():
+    data = png_with_metadata()
+    assert compress(data, ".jpg", ["webp"])[0] == "store"
+
+    buffer = io.BytesIO()
+    Image.fromarray(np.arange(64 * 64, dtype=np.uint16).reshape(64, 64)).save(buffer, format="PNG")
+    sixteen_bit = buffer.getvalue()
+    assert not compress(sixteen_bit, ".png", ["webp"])[0].startswith("webp")
+
+    with pytest.raises(ValueError):
+        decompress("brotli", b"")
+
+
+def test_pack_writer_offsets(tmp_path):
+    writer = PackWriter(str(tmp_path), "pack-1")
+    writer.add("a.png", "store", b"aaaa", 4)
+    writer.add("b.png", "zlib", b"bb", 10)
+    path = writer.close()
+    assert writer.key == "cold/pack-1.pack"
+    assert writer.entries == [("a.png", 0, 4, "store", 4), ("b.png", 4, 2, "zlib", 10)]
+    with open(path, "rb") as f:
+        assert f.read() == b"aaaabb"
+
+    aborted = PackWriter(str(tmp_path), "pack-2")
+    aborted.add("c.png", "store", b"c", 1)
+    aborted.abort()
+    assert not os.path.exists(aborted.temp_path)
+
+
+@pytest.fixture(autouse=True)
+def cold_entries():
+    # Index entries are cached per process, and each test starts from an empty database
+    yield
+    blob_store.cold._entries.clear()
+
+
+def archive(codecs, pack_mb=64.0):
+    run_archive(Namespace(older_than_days=30, codecs=codecs, pack_mb=pack_mb, batch_size=2,
+                          max_mb_per_second=None, limit=None))
+
+
+def add_old_tests(db, patient, images, conducted=datetime(2020, 1, 1)):
+    keys = []
+    for data in images:
+        key = blob_store.put(db, io.BytesIO(data), "scan.png")
+        db.add(Test(patient_id=patient.id, user_id=patient.user_id, result="Normal", confidence=0.5,
+                    image_path=key, date_conducted=conducted))
+        keys.append(key)
+    db.commit()
+    return keys
+
+
+@pytest.mark.parametrize("codecs", ["lzma", "zlib", "lzma,zlib"])
+def test_archive_round_trip_byte_exact(db, make_patient, codecs):
+    images = [synthetic_xray(size=64, seed=i) for i in range(5)]
+    keys = add_old_tests(db, make_patient("555-0600"), images)
+    recent = add_old_tests(db, make_patient("555-0601"), [synthetic_xray(size=64, seed=99)], datetime.utcnow())
+
+    # Small packs, so the images are spread over several
+    archive(codecs, pack_mb=200 / 1024 / 1024)
+
+    entries = {entry.key: entry for entry in db.query(ArchivedBlob)}
+    assert sorted(entries) == sorted(keys)
+    assert len({entry.pack for entry in entries.values()}) > 1
+    assert all(entry.hot_deleted and entry.codec in codecs.split(",") for entry in entries.values())
+    for key, data in zip(keys, images):
+        assert not blob_store.backend.exists(key)
+        assert blob_store.exists(key)
+        with blob_store.open(key) as f:
+            assert f.read() == data
+        assert blob_store.restored_digest(key) is None
+        with blob_store.local_path(key) as path, open(path, "rb") as f:
+            assert f.read() == data
+
+    # Images of recent tests stay hot
+    assert blob_store.backend.exists(recent[0])
+
+
+def test_archive_round_trip_webp(db, make_patient):
+    data = png_with_metadata()
+    (key,) = add_old_tests(db, make_patient("555-0602"), [data])
+    archive("webp")
+
+    assert db.get(ArchivedBlob, key).codec.startswith("webp:L:")
+    with blob_store.open(key) as f:
+        restored = f.read()
+    np.testing.assert_array_equal(pixels(restored), pixels(data))
+    assert blob_store.restored_digest(key) == hashlib.sha256(restored).hexdigest()
@@ -0,0 +1,53 @@
+import io
+
+import pytest
+from fastapi import HTTPException
+
+from backend.app import routes
+from backend.app.derivatives import THUMBNAIL_SIZES, THUMBNAIL_URL_PREFIX, create_derivatives, ensure_derivatives, load_tensor
+from backend.app.models import Test
+from backend.app.storage import blob_store
+from backend.tests.conftest import png_bytes
+
+
+def make_test(db, patient, image_path):
+    test = Test(patient_id=patient.id, user_id=patient.user_id, result="Normal", confidence=0.9, image_path=image_path)
+    db.add(test)
+    db.commit()
+    return test
+
+
+def test_legacy_test_has_no_thumbnails(db, make_patient):
+    test = make_test(db, make_patient("555-0300"), "uploads/1234_scan.png")
+    assert routes.test_response(test)["thumbnails"] is None
+
+
+def test_seeded_test_gets_thumbnails_once_generated(db, make_patient):
+    # seed_data.py stores blobs without generating derivatives
+    key = blob_store.put(db, io.BytesIO(png_bytes(80, size=(600, 400))), "scan.png")
+    test = make_test(db, make_patient("555-0301"), key)
+    assert routes.test_response(test)["thumbnails"] is None
+
+    tensor = ensure_derivatives(key)
+    assert tensor.shape == (1, 224, 224, 3)
+    thumbnails = routes.test_response(test)["thumbnails"]
+    assert sorted(thumbnails) == sorted(THUMBNAIL_SIZES)
+    for url in thumbnails.values():
+        response = routes.get_thumbnail(url[len(THUMBNAIL_URL_PREFIX):])
+        assert response.media_type == "image/webp"
+
+
+def test_uploaded_test_lists_thumbnails(db, make_patient):
+    key = blob_store.put(db, io.BytesIO(png_bytes(90, size=(64, 64))), "scan.png")
+    tensor = create_derivatives(key)
+    test = make_test(db, make_patient("555-0302"), key)
+
+    assert routes.test_response(test)["thumbnails"][256].startswith(THUMBNAIL_URL_PREFIX)
+    assert (load_tensor(key) == tensor).all()
+
+
+@pytest.mark.parametrize("name", ["../secret.webp", "ab/cd/missing_256.webp", "ab/cd/file.png"])
+def test_unknown_thumbnail_is_not_found(name):
+    with pytest.raises(HTTPException) as error:
+        routes.get_thumbnail(name)
+    assert error.value.status_code == 404
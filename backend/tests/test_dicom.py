@@ -0,0 +1,128 @@
+import numpy as np
+import pytest
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.pixels import pixel_array
+from pydicom.uid import ExplicitVRLittleEndian, SecondaryCaptureImageStorage, generate_uid
+
+from backend.app import dicom
+from backend.app.dicom import _memmap_frame, _read_header, _stored_values, dicom_to_model_input, is_dicom, read_frame
+
+RNG = np.random.default_rng(0)
+
+
+def write_dicom(path, words, bits_stored, signed=False, photometric="MONOCHROME2", **elements):
+    """Writes uncompressed frames of raw container words (frames x rows x columns)."""
+    meta = FileMetaDataset()
+    meta.MediaStorageSOPClassUID = SecondaryCaptureImageStorage
+    meta.MediaStorageSOPInstanceUID = generate_uid()
+    meta.TransferSyntaxUID = ExplicitVRLittleEndian
+
+    ds = Dataset()
+    ds.file_meta = meta
+    ds.SOPClassUID = meta.MediaStorageSOPClassUID
+    ds.SOPInstanceUID = meta.MediaStorageSOPInstanceUID
+    ds.Modality = "CR"
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = photometric
+    ds.NumberOfFrames = words.shape[0]
+    ds.Rows, ds.Columns = words.shape[1:]
+    ds.BitsAllocated = words.dtype.itemsize * 8
+    ds.BitsStored = bits_stored
+    ds.HighBit = bits_stored - 1
+    ds.PixelRepresentation = int(signed)
+    for keyword, value in elements.items():
+        setattr(ds, keyword, value)
+    ds.PixelData = words.astype(words.dtype.newbyteorder("<")).tobytes()
+    ds.save_as(str(path), enforce_file_format=True)
+    return str(path)
+
+
+def read_decoded(path, monkeypatch):
+    """read_frame through pydicom's decoder instead of the memory map."""
+    with monkeypatch.context() as patch:
+        patch.setattr(dicom, "_memmap_frame", lambda *args: None)
+        return read_frame(path)
+
+
+def signed_12_bit(frames=1):
+    values = RNG.integers(-2048, 2048, size=(frames, 40, 48))
+    # Two's complement in the low 12 bits, with the unused high bits left clear
+    return (values & 0x0FFF).astype(np.uint16), values
+
+
+def overlay_12_bit(frames=1):
+    values = RNG.integers(0, 4096, size=(frames, 40, 48)).astype(np.uint16)
+    # Overlay data in the unused high bits
+    return values | (RNG.integers(0, 16, size=values.shape).astype(np.uint16) << 12), values
+
+
+@pytest.mark.parametrize("make, signed", [(signed_12_bit, True), (overlay_12_bit, False)])
+def test_mapped_values_match_pixel_array(tmp_path, make, signed):
+    words, values = make(frames=3)
+    path = write_dicom(tmp_path / "scan.dcm", words, bits_stored=12, signed=signed)
+    ds = _read_header(path)
+
+    for frame in range(3):
+        mapped = _stored_values(np.array(_memmap_frame(path, ds, frame)), ds)
+        decoded = pixel_array(path, index=frame)
+        np.testing.assert_array_equal(mapped, decoded)
+        np.testing.assert_array_equal(mapped, values[frame])
+
+
+@pytest.mark.parametrize("make, signed", [(signed_12_bit, True), (overlay_12_bit, False)])
+def test_read_frame_parity(tmp_path, monkeypatch, make, signed):
+    words, _ = make()
+    path = write_dicom(tmp_path / "scan.dcm", words, bits_stored=12, signed=signed)
+    np.testing.assert_array_equal(read_frame(path), read_decoded(path, monkeypatch))
+
+
+def test_unusual_high_bit_falls_back(tmp_path):
+    words, _ = overlay_12_bit()
+    path = write_dicom(tmp_path / "scan.dcm", words, bits_stored=12, HighBit=15)
+    assert _memmap_frame(path, _read_header(path), 0) is None
+
+
+def test_monochrome1_is_inverted(tmp_path, monkeypatch):
+    words = RNG.integers(0, 4096, size=(1, 40, 48)).astype(np.uint16)
+    normal = read_frame(write_dicom(tmp_path / "m2.dcm", words, bits_stored=12))
+    inverted_path = write_dicom(tmp_path / "m1.dcm", words, bits_stored=12, photometric="MONOCHROME1")
+
+    inverted = read_frame(inverted_path)
+    # Inverted before rounding down to 8 bits
+    assert np.abs(inverted.astype(int) + normal - 255).max() <= 1
+    assert np.corrcoef(inverted.ravel(), normal.ravel())[0, 1] < -0.99
+    np.testing.assert_array_equal(inverted, read_decoded(inverted_path, monkeypatch))
+
+
+def test_window_clips_values(tmp_path, monkeypatch):
+    words = np.tile(np.arange(0, 4096, 64, dtype=np.uint16), (1, 16, 1))
+    path = write_dicom(tmp_path / "scan.dcm", words, bits_stored=12, WindowCenter=2048, WindowWidth=1024)
+
+    gray = read_frame(path)
+    assert gray.dtype == np.uint8
+    # Everything below and above the window saturates
+    assert (gray[:, words[0, 0] < 1536] == 0).all()
+    assert (gray[:, words[0, 0] > 2560] == 255).all()
+    np.testing.assert_array_equal(gray, read_decoded(path, monkeypatch))
+
+
+def test_voi_lut_sequence_is_applied(tmp_path, monkeypatch):
+    words = np.tile(np.arange(0, 256, 4, dtype=np.uint16), (1, 16, 1))
+    lut = Dataset()
+    lut.LUTDescriptor = [256, 0, 16]
+    # A step function: the lower half maps to 0, the upper half to 1000
+    lut.LUTData = np.array([0] * 128 + [1000] * 128, dtype="<u2").tobytes()
+    path = write_dicom(tmp_path / "scan.dcm", words, bits_stored=8, VOILUTSequence=[lut])
+
+    gray = read_frame(path)
+    assert set(np.unique(gray)) == {0, 255}
+    assert (gray[:, words[0, 0] < 128] == 0).all()
+    np.testing.assert_array_equal(gray, read_decoded(path, monkeypatch))
+
+
+def test_model_input_from_dicom(tmp_path):
+    words, _ = overlay_12_bit()
+    path = write_dicom(tmp_path / "scan.dcm", words, bits_stored=12)
+    assert is_dicom(path)
+    assert not is_dicom(__file__)
+    assert dicom_to_model_input(path).shape == (1, 224, 224, 3)
@@ -0,0 +1,119 @@
+import numpy as np
+import pytest
+
+from backend.app.config import settings
+from backend.app.embeddings import VECTOR_DTYPE, EmbeddingStore, IVFIndex, normalize
+
+DIM = 16
+
+
+def clustered(clusters=8, per_cluster=50, seed=0):
+    """Unit vectors around `clusters` well-separated centres, with test IDs from 1."""
+    rng = np.random.default_rng(seed)
+    centres = normalize(rng.normal(size=(clusters, DIM)))
+    vectors = np.repeat(centres, per_cluster, axis=0) + rng.normal(scale=0.05, size=(clusters * per_cluster, DIM))
+    return np.arange(1, len(vectors) + 1), normalize(vectors), centres
+
+
+@pytest.fixture
+def store(tmp_path):
+    return EmbeddingStore(str(tmp_path / "embeddings"))
+
+
+def exact(store, query, k):
+    ids, vectors = store.snapshot()
+    scores = vectors.astype(np.float32) @ normalize(query)
+    return [int(ids[i]) for i in np.argsort(-scores)[:k]]
+
+
+def test_append_and_snapshot(store):
+    assert store.dim is None
+    assert store.search(np.ones(DIM), 3) == []
+
+    store.append([1, 2], np.eye(DIM)[:2] * 5)
+    ids, vectors = store.snapshot()
+    assert ids.tolist() == [1, 2]
+    assert vectors.dtype == VECTOR_DTYPE
+    np.testing.assert_allclose(store.vector_for(2), np.eye(DIM)[1])
+    assert store.vector_for(3) is None
+
+    with pytest.raises(ValueError, match="dimensions"):
+        store.append([3], np.ones(DIM + 1))
+
+    # A vector written without its ID is dropped by the next append
+    with open(store.vectors_path, "ab") as f:
+        f.write(np.ones(DIM, dtype=VECTOR_DTYPE).tobytes()[:10])
+    store.append([3], np.eye(DIM)[2])
+    assert store.snapshot()[0].tolist() == [1, 2, 3]
+    np.testing.assert_allclose(store.vector_for(3), np.eye(DIM)[2])
+
+
+def test_exact_search_with_allowed_and_excluded_ids(store):
+    ids, vectors, centres = clustered()
+    store.append(ids, vectors)
+    query = centres[2]
+    in_cluster = set(range(101, 151))
+
+    results = store.search(query, 5)
+    assert [test_id for test_id, _ in results] == exact(store, query, 5)
+    assert {test_id for test_id, _ in results} <= in_cluster
+    assert all(a[1] >= b[1] for a, b in zip(results, results[1:]))
+
+    # Only allowed tests are scored, even when they are far from the query
+    results = store.search(query, 3, allowed_ids=[1, 2, 103])
+    assert [test_id for test_id, _ in results][0] == 103
+    assert {test_id for test_id, _ in results} == {1, 2, 103}
+    assert store.search(query, 3, allowed_ids=[]) == []
+
+    best = exact(store, query, 2)
+    results = store.search(query, 2, exclude_ids=best)
+    assert not {test_id for test_id, _ in results} & set(best)
+    assert store.search(query, 2, allowed_ids=[best[0]], exclude_ids=[best[0]]) == []
+
+
+def test_re_embedded_tests_are_returned_once(store):
+    ids, vectors, centres = clustered()
+    store.append(ids, vectors)
+    best = exact(store, centres[0], 1)[0]
+    # The test is embedded again, e.g. by a backfill with a newer model
+    store.append([best], store.vector_for(best))
+
+    results = store.search(centres[0], 4)
+    assert [test_id for test_id, _ in results].count(best) == 1
+    assert len(results) == 4
+    np.testing.assert_allclose(store.vector_for(best), store.snapshot()[1][-1].astype(np.float32))
+
+
+def test_ivf_index_search(store, monkeypatch):
+    monkeypatch.setattr(settings, "SIMILARITY_INDEX_MIN_ROWS", 100)
+    monkeypatch.setattr(settings, "SIMILARITY_NPROBE", 2)
+    ids, vectors, centres = clustered()
+    store.append(ids, vectors)
+    index = store.build_index(nlist=8)
+    assert index.built_rows == len(ids)
+    assert sorted(index.rows.tolist()) == list(range(len(ids)))
+    assert store.index() is not None
+
+    # Two clusters of eight are scored, but well-separated neighbours are all found
+    for centre in centres:
+        query = centre + 0.01
+        assert [test_id for test_id, _ in store.search(query, 10)] == exact(store, query, 10)
+    # Only the probed clusters are scored, but allowed IDs are scored wherever they are
+    assert 0 < len(store.search(centres[0], len(ids))) < len(ids)
+    assert [test_id for test_id, _ in store.search(centres[0], 3, allowed_ids=[1, 399])] == [1, 399]
+
+    # Rows appended after the build are scanned exhaustively
+    store.append([9999], -centres[0])
+    assert store.search(-centres[0], 1)[0][0] == 9999
+
+
+def test_ivf_index_round_trip(tmp_path):
+    _, vectors, _ = clustered()
+    index = IVFIndex.build(vectors, nlist=4)
+    path = str(tmp_path / "ivf.npz")
+    index.save(path)
+    loaded = IVFIndex.load(path)
+    np.testing.assert_array_equal(loaded.rows, index.rows)
+    np.testing.assert_array_equal(loaded.offsets, index.offsets)
+    assert loaded.built_rows == len(vectors)
+    assert loaded.offsets[-1] == len(vectors)
@@ -0,0 +1,139 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+from backend.app import events, routes
+from backend.app.events import EventBus, EventHub, LocalEventBroker, patient_channel, user_channel
+
+
+def drain(subscription):
+    messages = []
+    while not subscription.queue.empty():
+        messages.append(subscription.queue.get_nowait())
+    return messages
+
+
+def test_slow_subscriber_is_dropped():
+    hub = EventHub(buffer_size=3)
+
+    async def main():
+        slow = hub.subscribe(["user:1"])
+        fast = hub.subscribe(["user:1"])
+        received = []
+        for i in range(5):
+            hub.dispatch(["user:1"], f"event {i}")
+            await asyncio.sleep(0)
+            received += drain(fast)
+        # The fourth event overflowed the slow consumer's buffer
+        assert slow.dropped.is_set() and slow.queue.empty()
+        assert received == [f"event {i}" for i in range(5)]
+        assert not fast.dropped.is_set()
+
+        hub.dispatch(["user:1"], "after drop")
+        await asyncio.sleep(0)
+        assert slow.queue.empty()
+        hub.unsubscribe(slow)
+        hub.unsubscribe(fast)
+
+    asyncio.run(main())
+    assert hub._channels == {}
+
+
+def test_dispatch_once_per_subscription_and_across_threads():
+    hub = EventHub(buffer_size=10)
+
+    async def main():
+        subscription = hub.subscribe([user_channel(1), patient_channel(5)])
+        # Published from a worker thread, e.g. a sync endpoint in the threadpool
+        thread = threading.Thread(target=hub.dispatch, args=([user_channel(1), patient_channel(5)], "both"))
+        thread.start()
+        thread.join()
+        await asyncio.sleep(0)
+        assert drain(subscription) == ["both"]
+
+        hub.remove_channel(subscription, patient_channel(5))
+        hub.dispatch([patient_channel(5)], "unfollowed")
+        await asyncio.sleep(0)
+        assert drain(subscription) == []
+        return subscription
+
+    subscription = asyncio.run(main())
+    # The connection's loop is gone; dispatching must not raise
+    hub.dispatch([user_channel(1)], "late")
+    hub.unsubscribe(subscription)
+
+
+class FailingBroker(LocalEventBroker):
+    def publish(self, message: str) -> None:
+        raise ConnectionError("broker down")
+
+
+def test_bus_publishes_through_broker(caplog):
+    bus = EventBus(LocalEventBroker(), buffer_size=10)
+    bus.start()
+
+    async def main():
+        subscription = bus.hub.subscribe([patient_channel(2)])
+        bus.publish([user_channel(1), patient_channel(2)], {"type": "patient.updated", "patient_id": 2})
+        bus._receive("{not json")
+        await asyncio.sleep(0)
+        return drain(subscription)
+
+    assert asyncio.run(main()) == ['{"type":"patient.updated","patient_id":2}']
+
+    # Publishing never fails the request
+    EventBus(FailingBroker(), buffer_size=10).publish(["user:1"], {"type": "test.created"})
+    assert "Failed to publish test.created event" in caplog.text
+
+
+@pytest.fixture
+def bus(monkeypatch):
+    bus = EventBus(LocalEventBroker(), buffer_size=3)
+    bus.start()
+    monkeypatch.setattr(events, "event_bus", bus)
+    monkeypatch.setattr(routes, "event_bus", bus)
+    return bus
+
+
+def wait_for_subscription(bus, channel):
+    deadline = time.monotonic() + 5
+    while not bus.hub._channels.get(channel):
+        assert time.monotonic() < deadline, "connection did not subscribe"
+        time.sleep(0.01)
+    return next(iter(bus.hub._channels[channel]))
+
+
+def test_event_stream_pushes_patient_updates(api, bus, user, make_patient):
+    patient = make_patient("555-0800")
+    token = api.headers["Authorization"].split()[1]
+    with api.websocket_connect(f"/ws/events?token={token}") as websocket:
+        wait_for_subscription(bus, user_channel(user.id))
+        update = {"name": "Renamed", "dateOfBirth": "1970-01-01", "gender": "Other"}
+        assert api.put(f"/api/patients/{patient.id}", json=update).status_code == 200
+        event = json.loads(websocket.receive_text())
+        assert (event["type"], event["patient_id"], event["name"]) == ("patient.updated", patient.id, "Renamed")
+
+    assert bus.hub._channels == {}
+
+
+def test_event_stream_closes_slow_consumer(api, bus, user):
+    token = api.headers["Authorization"].split()[1]
+    with api.websocket_connect(f"/ws/events?token={token}") as websocket:
+        subscription = wait_for_subscription(bus, user_channel(user.id))
+        # A burst the connection cannot forward before its buffer of three overflows
+        subscription.loop.call_soon_threadsafe(lambda: [subscription.offer(f"event {i}") for i in range(10)])
+        with pytest.raises(WebSocketDisconnect) as error:
+            websocket.receive_text()
+    assert error.value.code == 1013
+    assert bus.hub._channels == {}
+
+
+def test_event_stream_rejects_bad_token(api, bus):
+    with api.websocket_connect("/ws/events?token=not-a-jwt") as websocket:
+        with pytest.raises(WebSocketDisconnect) as error:
+            websocket.receive_text()
+    assert error.value.code == 1008
@@ -0,0 +1,103 @@
+import csv
+import io
+import json
+from datetime import date, datetime
+
+import pyarrow.parquet as pq
+import pytest
+
+from backend.app import helpers
+from backend.app.export import PATIENT_COLUMNS, export_patients, export_tests, prediction_column
+from backend.app.models import Patient, Test, User
+
+CLASSES = {0: "COVID-19", 1: "Normal", 2: "Viral Pneumonia"}
+PRED_COLUMNS = ["pred_covid_19", "pred_normal", "pred_viral_pneumonia"]
+
+
+@pytest.fixture
+def records(db, user, monkeypatch):
+    monkeypatch.setattr(helpers, "class_indices", CLASSES)
+    other = User(username="other", password_hash="x", display_name="Other")
+    db.add(other)
+    db.commit()
+
+    patients = [
+        Patient(name=f"Patient {i}", user_id=user.id if i < 4 else other.id, date_of_birth=date(1980, 1, i + 1),
+                gender="Female", phone=f"555-10{i:02d}", created_at=datetime(2024, 1, i + 1))
+        for i in range(5)
+    ]
+    db.add_all(patients)
+    db.commit()
+
+    predictions = [
+        json.dumps([["COVID-19", 0.7], ["Normal", 0.2], ["Viral Pneumonia", 0.1]]),
+        json.dumps([["Normal", 0.9]]),  # Classes missing from older rows stay empty
+        "not json",
+        None,
+        json.dumps([["Normal", 0.6], ["Retired class", 0.4]]),
+    ]
+    db.add_all([
+        Test(patient_id=patient.id, user_id=patient.user_id, result="Normal", confidence=0.5,
+             image_path=f"ab/cd/{i}.png", predictions=predictions[i], date_conducted=datetime(2024, 2, i + 1))
+        for i, patient in enumerate(patients)
+    ])
+    db.commit()
+    return user, other
+
+
+def read_csv(chunks):
+    return list(csv.DictReader(io.StringIO(b"".join(chunks).decode("utf-8"))))
+
+
+def test_prediction_column_names():
+    assert [prediction_column(name) for name in CLASSES.values()] == PRED_COLUMNS
+
+
+def test_patients_csv(db, records):
+    user, _ = records
+    chunks = list(export_patients(db, "csv", batch_size=2))
+    # Header, then one chunk per batch of two
+    assert len(chunks) == 1 + 3
+    rows = read_csv(chunks)
+    assert list(rows[0]) == PATIENT_COLUMNS
+    assert [row["phone"] for row in rows] == [f"555-10{i:02d}" for i in range(5)]
+
+    rows = read_csv(export_patients(db, "csv", user_id=user.id, date_from=datetime(2024, 1, 2), date_to=datetime(2024, 1, 4)))
+    assert [row["name"] for row in rows] == ["Patient 1", "Patient 2"]
+
+
+def test_tests_csv_expands_predictions(db, records):
+    rows = read_csv(export_tests(db, "csv", batch_size=2))
+    assert list(rows[0])[-3:] == PRED_COLUMNS
+    assert "predictions" not in rows[0]
+    assert [row["pred_covid_19"] for row in rows] == ["0.7", "", "", "", ""]
+    assert [row["pred_normal"] for row in rows] == ["0.2", "0.9", "", "", "0.6"]
+    assert [row["pred_viral_pneumonia"] for row in rows] == ["0.1", "", "", "", ""]
+
+
+def test_tests_parquet(db, records):
+    _, other = records
+    data = b"".join(export_tests(db, "parquet", batch_size=2))
+    parquet = pq.ParquetFile(io.BytesIO(data))
+    assert parquet.metadata.num_row_groups == 3
+
+    table = parquet.read()
+    assert table.schema.names[-3:] == PRED_COLUMNS
+    assert str(table.schema.field("date_conducted").type) == "timestamp[us]"
+    assert table.column("pred_normal").to_pylist() == [0.2, 0.9, None, None, 0.6]
+    assert table.column("date_conducted").to_pylist()[0] == datetime(2024, 2, 1)
+
+    table = pq.read_table(io.BytesIO(b"".join(export_tests(db, "parquet", user_id=other.id))))
+    assert table.num_rows == 1
+    assert table.column("image_path").to_pylist() == ["ab/cd/4.png"]
+
+
+def test_patients_parquet_when_empty(db, user):
+    table = pq.read_table(io.BytesIO(b"".join(export_patients(db, "parquet"))))
+    assert table.num_rows == 0
+    assert table.schema.names == PATIENT_COLUMNS
+
+
+def test_unknown_format(db):
+    with pytest.raises(ValueError):
+        export_patients(db, "xlsx")
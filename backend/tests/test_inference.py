@@ -0,0 +1,77 @@
+import logging
+
+import numpy as np
+import pytest
+import tensorflow as tf
+
+from backend.app import inference
+from backend.app.config import settings
+from backend.app.inference import (
+    INPUT_SHAPE, InferenceProfile, compile_predict, configure_runtime, embedding_layer, with_embedding_output,
+)
+
+
+@pytest.fixture(scope="module")
+def model():
+    inputs = tf.keras.Input(shape=INPUT_SHAPE)
+    x = tf.keras.layers.Conv2D(4, 3, strides=8, activation="relu")(inputs)
+    x = tf.keras.layers.GlobalAveragePooling2D(name="pool")(x)
+    x = tf.keras.layers.Dense(8, activation="relu")(x)
+    x = tf.keras.layers.Dropout(0.5)(x)
+    outputs = tf.keras.layers.Dense(3, activation="softmax")(x)
+    return tf.keras.Model(inputs, outputs)
+
+
+def batch(n=2):
+    return np.random.default_rng(0).random((n,) + INPUT_SHAPE, dtype=np.float32)
+
+
+def test_profile_from_settings(monkeypatch):
+    monkeypatch.setattr(settings, "INFERENCE_INTRA_OP_THREADS", 2)
+    monkeypatch.setattr(settings, "INFERENCE_INTER_OP_THREADS", 1)
+    monkeypatch.setattr(settings, "INFERENCE_COMPILED_PREDICT", False)
+    monkeypatch.setattr(settings, "INFERENCE_XLA", True)
+    monkeypatch.setattr(settings, "INFERENCE_BF16", False)
+    assert InferenceProfile.from_settings() == InferenceProfile(2, 1, compiled=False, xla=True, bf16=False)
+
+
+@pytest.mark.parametrize("compiled", [True, False])
+def test_compile_predict_matches_model(model, compiled):
+    predict = compile_predict(model, InferenceProfile(compiled=compiled))
+    expected = model.predict(batch(), verbose=0)
+    np.testing.assert_allclose(predict(batch()), expected, rtol=1e-5, atol=1e-6)
+    # Any batch size is served by the one traced signature
+    assert predict(batch(5)).shape == (5, 3)
+
+
+def test_embedding_output(model):
+    assert embedding_layer(model).name == "pool"
+    assert embedding_layer(model, "pool") is model.get_layer("pool")
+
+    predict = compile_predict(with_embedding_output(model), InferenceProfile())
+    scores, features = predict(batch())
+    np.testing.assert_allclose(scores, model.predict(batch(), verbose=0), rtol=1e-5, atol=1e-6)
+    assert features.shape == (2, 4)
+
+
+def test_embedding_layer_needs_pooled_features():
+    inputs = tf.keras.Input(shape=(4,))
+    model = tf.keras.Model(inputs, tf.keras.layers.Dense(2)(tf.keras.layers.Dense(3)(inputs)))
+    with pytest.raises(ValueError, match="EMBEDDING_LAYER"):
+        embedding_layer(model)
+
+
+def test_bf16_falls_back_without_cpu_support(monkeypatch, caplog):
+    options = []
+    monkeypatch.setattr(tf.config.optimizer, "set_experimental_options", options.append)
+
+    monkeypatch.setattr(inference, "cpu_supports_bf16", lambda: False)
+    with caplog.at_level(logging.WARNING, logger="inference"):
+        configure_runtime(InferenceProfile(bf16=True))
+    assert options == []
+    assert "using float32" in caplog.text
+
+    monkeypatch.setattr(inference, "cpu_supports_bf16", lambda: True)
+    monkeypatch.setenv("TF_ENABLE_ONEDNN_OPTS", "1")
+    configure_runtime(InferenceProfile(bf16=True))
+    assert options == [{"auto_mixed_precision_onednn_bfloat16": True}]
@@ -0,0 +1,77 @@
+import time
+
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+from backend.app.metrics import RequestMetricsMiddleware, metrics_registry, record_cache, stage_timer
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def make_client():
+    app = FastAPI()
+    app.add_middleware(RequestMetricsMiddleware)
+
+    @app.get("/items/{item_id}")
+    def get_item(item_id: int):
+        if item_id == 0:
+            raise HTTPException(status_code=404, detail="Not found")
+        return {"id": item_id}
+
+    return TestClient(app)
+
+
+def test_requests_are_labelled_by_route_template():
+    client = make_client()
+    ok = dict(method="GET", route="/items/{item_id}", status="200")
+    missing = dict(method="GET", route="/items/{item_id}", status="404")
+    unmatched = dict(method="GET", route="unmatched", status="404")
+    before = [sample("ldcs_request_duration_seconds_count", **labels) for labels in (ok, missing, unmatched)]
+
+    for item_id in (1, 2, 3):
+        assert client.get(f"/items/{item_id}").status_code == 200
+    assert client.get("/items/0").status_code == 404
+    assert client.get("/nowhere").status_code == 404
+
+    after = [sample("ldcs_request_duration_seconds_count", **labels) for labels in (ok, missing, unmatched)]
+    assert [b - a for a, b in zip(before, after)] == [3, 1, 1]
+    # Paths themselves never become labels
+    assert sample("ldcs_request_duration_seconds_count", method="GET", route="/items/1", status="200") == 0
+
+
+def test_stage_timer_observes_duration():
+    labels = dict(pipeline="test_pipeline", stage="sleep")
+    count = sample("ldcs_stage_duration_seconds_count", **labels)
+    total = sample("ldcs_stage_duration_seconds_sum", **labels)
+
+    with stage_timer("test_pipeline", "sleep"):
+        time.sleep(0.02)
+    try:
+        with stage_timer("test_pipeline", "sleep"):
+            raise ValueError
+    except ValueError:
+        pass
+
+    assert sample("ldcs_stage_duration_seconds_count", **labels) == count + 2
+    assert sample("ldcs_stage_duration_seconds_sum", **labels) - total >= 0.02
+
+
+def test_record_cache():
+    hits = sample("ldcs_cache_events_total", cache="test_cache", result="hit")
+    misses = sample("ldcs_cache_events_total", cache="test_cache", result="miss")
+    record_cache("test_cache", True)
+    record_cache("test_cache", True)
+    record_cache("test_cache", False)
+    assert sample("ldcs_cache_events_total", cache="test_cache", result="hit") == hits + 2
+    assert sample("ldcs_cache_events_total", cache="test_cache", result="miss") == misses + 1
+
+
+def test_registry_aggregates_worker_files(tmp_path, monkeypatch):
+    assert metrics_registry() is REGISTRY
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+    registry = metrics_registry()
+    assert registry is not REGISTRY
+    assert list(registry.collect()) == []
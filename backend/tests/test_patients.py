@@ -0,0 +1,79 @@
+from contextlib import contextmanager
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import event
+
+from backend.app.extensions import engine
+from backend.app.models import Patient, Test, User
+
+
+@pytest.fixture
+def patients(db, user, make_patient):
+    """Three patients of `user` with 2, 0 and 3 tests, and one patient of another user."""
+    patients = [make_patient(f"555-07{i:02d}") for i in range(3)]
+    other = User(username="other", password_hash="x", display_name="Other")
+    db.add(other)
+    db.commit()
+    db.add(Patient(name="Not mine", user_id=other.id, date_of_birth=date(1970, 1, 1), gender="Other", phone="555-0799"))
+
+    def add_test(patient, result, conducted):
+        db.add(Test(patient_id=patient.id, user_id=user.id, result=result, confidence=0.9,
+                    image_path="ab/cd/scan.png", date_conducted=conducted))
+        db.commit()
+
+    add_test(patients[0], "Normal", datetime(2024, 3, 1))
+    add_test(patients[0], "COVID-19", datetime(2024, 1, 1))
+    add_test(patients[2], "Normal", datetime(2024, 2, 1, 9, 30))
+    # Two tests at the same time: the later one wins
+    add_test(patients[2], "Viral Pneumonia", datetime(2024, 2, 1, 9, 30))
+    add_test(patients[2], "COVID-19", datetime(2023, 12, 1))
+    return patients
+
+
+@contextmanager
+def recorded_statements():
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+
+def test_patient_list_with_latest_test(api, patients):
+    response = api.get("/api/patients", params={"include_latest_test": True})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["total_count"] == 3
+    assert [patient["id"] for patient in body["patients"]] == [patient.id for patient in patients]
+    assert [patient["test_count"] for patient in body["patients"]] == [2, 0, 3]
+    assert [patient["latest_test"] for patient in body["patients"]] == [
+        {"result": "Normal", "confidence": 0.9, "date_conducted": "2024-03-01 00:00:00"},
+        None,
+        {"result": "Viral Pneumonia", "confidence": 0.9, "date_conducted": "2024-02-01 09:30:00"},
+    ]
+
+
+def test_latest_test_is_paginated(api, patients):
+    body = api.get("/api/patients", params={"include_latest_test": True, "limit": 1, "offset": 2}).json()
+    assert body["total_count"] == 3
+    assert [(patient["id"], patient["test_count"]) for patient in body["patients"]] == [(patients[2].id, 3)]
+
+    # Without the flag the list is unchanged
+    body = api.get("/api/patients", params={"limit": 2}).json()
+    assert [patient["id"] for patient in body["patients"]] == [patients[0].id, patients[1].id]
+    assert "latest_test" not in body["patients"][0]
+
+
+def test_summaries_come_from_one_query(api, patients):
+    with recorded_statements() as one_patient:
+        api.get("/api/patients", params={"include_latest_test": True, "limit": 1})
+    with recorded_statements() as three_patients:
+        api.get("/api/patients", params={"include_latest_test": True, "limit": 3})
+    assert len(three_patients) == len(one_patient)
+    assert sum("row_number() OVER" in statement for statement in three_patients) == 1
@@ -0,0 +1,125 @@
+import json
+import multiprocessing
+import os
+
+import pytest
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+
+from backend.app import profiling
+from backend.app.extensions import AuthJWT, SessionLocal
+from backend.app.models import User
+from backend.app.profiling import (
+    PROFILE_HEADER, PROFILE_ID_HEADER, ProfiledRoute, ProfilingMiddleware, RequestTrace, _export_spans, span,
+)
+
+
+def export_traces(count: int):
+    for _ in range(count):
+        trace = RequestTrace("GET", "/api/patients")
+        token = profiling._current_trace.set(trace)
+        try:
+            for i in range(20):
+                with span("db.query", statement="x" * 2000, index=i):
+                    pass
+        finally:
+            profiling._current_trace.reset(token)
+        _export_spans(trace)
+
+
+def test_spans_from_workers_do_not_interleave(tmp_path, monkeypatch):
+    path = tmp_path / "spans.jsonl"
+    monkeypatch.setattr(profiling.settings, "TRACE_EXPORT_PATH", str(path))
+
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=export_traces, args=(25,)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+        assert worker.exitcode == 0
+
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert len(records) == 4 * 25 * 20
+    # Each trace's spans form one consecutive run of lines
+    runs = [records[start]["traceId"] for start in range(0, len(records), 20)]
+    assert len(set(runs)) == 100
+    for start in range(0, len(records), 20):
+        assert {record["traceId"] for record in records[start:start + 20]} == {records[start]["traceId"]}
+
+
+@pytest.fixture
+def client(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling.settings, "PROFILES_DIR", str(tmp_path / "profiles"))
+    monkeypatch.setattr(profiling.settings, "TRACE_EXPORT_PATH", str(tmp_path / "spans.jsonl"))
+    router = APIRouter(route_class=ProfiledRoute)
+
+    @router.get("/items")
+    def list_items():
+        session = SessionLocal()
+        try:
+            with span("items.load", source="db"):
+                session.query(User).count()
+        finally:
+            session.close()
+        return []
+
+    def make(sample_rate):
+        app = FastAPI()
+        app.include_router(router)
+        app.add_middleware(ProfilingMiddleware, sample_rate=sample_rate)
+        return TestClient(app)
+    return make
+
+
+def read_spans(path):
+    return [json.loads(line) for line in path.read_text().splitlines()] if path.exists() else []
+
+
+def test_sampled_request_is_profiled(client, tmp_path):
+    response = client(1.0).get("/items")
+    trace_id = response.headers[PROFILE_ID_HEADER]
+
+    profiles = sorted(os.listdir(tmp_path / "profiles"))
+    assert [os.path.splitext(name)[1] for name in profiles] == [".prof", ".txt"]
+    assert trace_id[:8] in profiles[0]
+
+    records = read_spans(tmp_path / "spans.jsonl")
+    spans = {record["name"]: record for record in records}
+    # One span each, also for routes re-created by include_router
+    assert sorted(spans) == sorted(record["name"] for record in records)
+    assert {"GET /items", "endpoint.list_items", "items.load", "db.query"} <= set(spans)
+    assert {record["traceId"] for record in records} == {trace_id}
+    # Spans nest: request > endpoint > custom span > query
+    assert spans["GET /items"]["parentSpanId"] is None
+    assert spans["endpoint.list_items"]["parentSpanId"] == spans["GET /items"]["spanId"]
+    assert spans["items.load"]["parentSpanId"] == spans["endpoint.list_items"]["spanId"]
+    assert spans["db.query"]["parentSpanId"] == spans["items.load"]["spanId"]
+    assert spans["items.load"]["attributes"] == {"source": "db"}
+
+
+def test_profile_header_requires_admin(client, db, user, tmp_path):
+    admin = User(username="admin", password_hash="x", display_name="Admin", is_admin=True)
+    db.add(admin)
+    db.commit()
+    app = client(0.0)
+
+    def get(username):
+        headers = {PROFILE_HEADER: "1"}
+        if username:
+            headers["Authorization"] = f"Bearer {AuthJWT().create_access_token(subject=username)}"
+        return app.get("/items", headers=headers)
+
+    assert PROFILE_ID_HEADER not in get(None).headers
+    assert PROFILE_ID_HEADER not in get("doctor").headers
+    assert PROFILE_ID_HEADER not in app.get("/items").headers
+    assert read_spans(tmp_path / "spans.jsonl") == []
+
+    assert PROFILE_ID_HEADER in get("admin").headers
+    assert read_spans(tmp_path / "spans.jsonl")
+
+
+def test_spans_outside_a_trace_are_free():
+    with span("unused") as unused:
+        pass
+    assert unused.trace is None
@@ -0,0 +1,119 @@
+import asyncio
+import hashlib
+import os
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from backend.app.models import ResumableUpload
+from backend.app.resumable import (
+    _open_locked, append_chunk, assemble, collect_expired_uploads, create_upload, current_offset, data_path,
+)
+from backend.app.uploads import FIRST_CHUNK_SIZE, UploadPolicy
+from backend.tests.conftest import png_bytes
+
+IMAGE = png_bytes(50, size=(64, 64))
+
+
+@pytest.fixture
+def upload(db, make_patient):
+    patient = make_patient("555-0100")
+    upload = create_upload(db, patient.user_id, patient.id, len(IMAGE))
+    path = data_path(upload.id)
+    yield upload
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def append(upload, offset, *chunks):
+    async def body():
+        for chunk in chunks:
+            yield chunk
+    return asyncio.run(append_chunk(upload, offset, body()))
+
+
+def test_create_upload_checks_length(db, make_patient):
+    patient = make_patient("555-0101")
+    with pytest.raises(HTTPException) as error:
+        create_upload(db, patient.user_id, patient.id, 0)
+    assert error.value.status_code == 400
+    with pytest.raises(HTTPException) as error:
+        create_upload(db, patient.user_id, patient.id, 2048, UploadPolicy("test_image", 1024, ("png",)))
+    assert error.value.status_code == 413
+
+
+def test_chunks_append_at_offset(upload):
+    assert current_offset(upload) == 0
+    assert append(upload, 0, IMAGE[:10], IMAGE[10:20]) == 20
+    assert current_offset(upload) == 20
+    assert append(upload, 20, IMAGE[20:]) == len(IMAGE)
+    with open(data_path(upload.id), "rb") as f:
+        assert f.read() == IMAGE
+
+
+def test_stale_offset_conflicts(upload):
+    append(upload, 0, IMAGE[:30])
+    for offset in (0, 10, 40):
+        with pytest.raises(HTTPException) as error:
+            append(upload, offset, IMAGE[offset:])
+        assert error.value.status_code == 409
+        assert error.value.detail == "Upload-Offset must be 30"
+    assert current_offset(upload) == 30
+
+
+def test_concurrent_append_conflicts(upload):
+    with _open_locked(upload.id):
+        with pytest.raises(HTTPException) as error:
+            append(upload, 0, IMAGE)
+    assert error.value.status_code == 409
+    assert current_offset(upload) == 0
+
+
+def test_overflow_keeps_received_bytes(upload):
+    with pytest.raises(HTTPException) as error:
+        append(upload, 0, IMAGE[:40], IMAGE[40:] + b"extra")
+    assert error.value.status_code == 413
+    assert current_offset(upload) == 40
+
+
+def test_wrong_format_is_rejected_with_first_chunk(db, make_patient):
+    patient = make_patient("555-0102")
+    upload = create_upload(db, patient.user_id, patient.id, 2 * FIRST_CHUNK_SIZE)
+    with pytest.raises(HTTPException) as error:
+        append(upload, 0, b"GIF89a" + bytes(FIRST_CHUNK_SIZE))
+    assert error.value.status_code == 415
+    os.remove(data_path(upload.id))
+
+
+def test_assemble_requires_all_bytes(upload):
+    append(upload, 0, IMAGE[:-1])
+    with pytest.raises(HTTPException) as error:
+        assemble(upload, hashlib.sha256(IMAGE).hexdigest())
+    assert error.value.status_code == 409
+
+
+def test_assemble_checks_checksum(upload):
+    append(upload, 0, IMAGE)
+    with pytest.raises(HTTPException) as error:
+        assemble(upload, hashlib.sha256(b"something else").hexdigest())
+    assert error.value.status_code == 400
+    assert error.value.detail == "Checksum mismatch"
+
+    ingested = assemble(upload, hashlib.sha256(IMAGE).hexdigest().upper())
+    assert ingested.digest == hashlib.sha256(IMAGE).hexdigest()
+    assert (ingested.kind, ingested.width, ingested.height, ingested.size) == ("png", 64, 64, len(IMAGE))
+    assert ingested.temp_path == data_path(upload.id)
+
+
+def test_collect_expired_uploads(db, upload):
+    upload_id = upload.id
+    append(upload, 0, IMAGE[:10])
+    assert collect_expired_uploads() == 0
+
+    upload.expires_at = datetime.utcnow() - timedelta(minutes=1)
+    db.commit()
+    assert collect_expired_uploads() == 1
+    db.expire_all()
+    assert db.get(ResumableUpload, upload_id) is None
+    assert not os.path.exists(data_path(upload_id))
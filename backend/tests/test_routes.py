@@ -0,0 +1,56 @@
+import hashlib
+import io
+import os
+import tempfile
+
+import pytest
+from fastapi import HTTPException
+
+from backend.app import routes
+from backend.app.models import StoredBlob, Test
+from backend.app.storage import blob_key, blob_store
+from backend.app.uploads import TEST_IMAGE_POLICY, ingest_file
+from backend.tests.conftest import png_bytes
+
+
+def ingest(data: bytes):
+    """Returns an ingest callable like the upload routes pass to _create_test."""
+    def ingest():
+        fd, path = tempfile.mkstemp(dir=blob_store.temp_dir)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        return ingest_file(path, TEST_IMAGE_POLICY)
+    return ingest
+
+
+def fail(*args, **kwargs):
+    raise RuntimeError("boom")
+
+
+def test_failed_test_creation_discards_new_blob(db, user, make_patient, monkeypatch):
+    patient = make_patient("555-0200")
+    data = png_bytes(60, size=(64, 64))
+    monkeypatch.setattr(routes, "create_derivatives", fail)
+
+    with pytest.raises(HTTPException) as error:
+        routes._create_test(db, user, patient, ingest(data))
+    assert error.value.status_code == 500
+
+    assert db.query(StoredBlob).count() == 0
+    assert db.query(Test).count() == 0
+    assert not blob_store.exists(blob_key(hashlib.sha256(data).hexdigest(), ".png"))
+
+
+def test_failed_test_creation_keeps_shared_blob(db, user, make_patient, monkeypatch):
+    patient = make_patient("555-0201")
+    data = png_bytes(70, size=(64, 64))
+    key = blob_store.put(db, io.BytesIO(data), "scan.png")
+    db.commit()
+    monkeypatch.setattr(routes, "create_derivatives", lambda image_path: None)
+    monkeypatch.setattr(routes, "predict_with_embedding", fail)
+
+    with pytest.raises(HTTPException):
+        routes._create_test(db, user, patient, ingest(data))
+
+    assert db.get(StoredBlob, key).ref_count == 1
+    assert blob_store.exists(key)
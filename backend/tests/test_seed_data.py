@@ -0,0 +1,61 @@
+import io
+import json
+
+import pytest
+from PIL import Image
+
+from backend.app.models import Patient, StoredBlob, Test, User
+from backend.app.uploads import TEST_IMAGE_POLICY, check_head
+from backend.load_test import Stats
+from backend.synthetic import synthetic_xray
+
+CLASSES = {0: "COVID-19", 1: "Normal", 2: "Viral Pneumonia"}
+
+
+def test_synthetic_xray_is_deterministic_png():
+    data = synthetic_xray(size=128, seed=3)
+    assert data == synthetic_xray(size=128, seed=3)
+    assert data != synthetic_xray(size=128, seed=4)
+    assert check_head(data, TEST_IMAGE_POLICY) == ("png", 128, 128)
+
+    image = Image.open(io.BytesIO(data))
+    assert image.mode == "RGB"
+    # Lung fields are darker than the body between them
+    pixels = image.convert("L").load()
+    assert pixels[41, 64] < pixels[64, 100]
+
+
+def test_seed_inserts_rows_and_shares_images(db, monkeypatch):
+    pytest.importorskip("faker")
+    from backend import seed_data
+
+    monkeypatch.setattr(seed_data, "load_class_dict", lambda: CLASSES)
+    monkeypatch.setattr(seed_data, "hash_password", lambda password: "x")
+    monkeypatch.setattr(seed_data, "synthetic_xray", lambda seed: synthetic_xray(size=64, seed=seed))
+    seed_data.seed(n_users=2, n_patients=5, n_tests=12, n_images=3, prefix="seeded", seed_value=7)
+
+    assert sorted(db.query(User.username)) == [("seeded0",), ("seeded1",)]
+    assert db.query(Patient).count() == 5
+    tests = db.query(Test).all()
+    assert len(tests) == 12
+    assert {json.loads(test.predictions)[0][0] for test in tests} == {"COVID-19"}
+    assert all(test.result in CLASSES.values() for test in tests)
+
+    # Reference counts match the tests that point at each pooled image
+    blobs = {blob.key: blob.ref_count for blob in db.query(StoredBlob)}
+    assert len(blobs) == 3
+    assert blobs == {key: sum(test.image_path == key for test in tests) for key in blobs}
+
+
+def test_stats_report(capsys):
+    stats = Stats()
+    for i in range(1, 101):
+        stats.record("list_patients", i / 1000, ok=i % 10 != 0)
+    stats.record("login", 0.5, ok=True)
+    stats.report(elapsed=2.0)
+
+    lines = capsys.readouterr().out.splitlines()
+    assert "101 requests in 2.0s (50.5 req/s)" in lines
+    rows = {line.split()[0]: line.split()[1:] for line in lines if line.startswith(("list_patients", "login"))}
+    assert rows["list_patients"] == ["100", "50.0", "10", "50.5", "95.0", "99.0"]
+    assert rows["login"] == ["1", "0.5", "0", "500.0", "500.0", "500.0"]
@@ -0,0 +1,85 @@
+import os
+import socket
+import time
+from argparse import Namespace
+
+import pytest
+
+from backend import serve
+from backend.app import helpers
+from backend.app.config import settings
+
+
+class FakeModel:
+    input_shape = (None, 4, 4, 3)
+
+
+def args(**overrides):
+    values = dict(host="127.0.0.1", port=0, workers=2, preload="none", fork_check_timeout=5, max_requests=0,
+                  max_requests_jitter=0, max_rss_mb=0, graceful_timeout=1, memory_report_interval=0)
+    values.update(overrides)
+    return Namespace(**values)
+
+
+def test_process_memory():
+    memory = serve.process_memory(os.getpid())
+    assert 0 < memory["pss"] <= memory["rss"]
+    assert serve.current_rss() > 0
+    # A process that no longer exists reports nothing
+    assert serve.process_memory(2 ** 22 + 1) == {"rss": 0, "pss": 0, "shared": 0}
+
+
+@pytest.mark.parametrize("behaviour, expected", [("ok", True), ("crash", False), ("hang", False)])
+def test_check_fork_safe(monkeypatch, behaviour, expected):
+    def predict(batch):
+        assert batch.shape == (1, 4, 4, 3)
+        if behaviour == "crash":
+            raise RuntimeError("thread pool lost in fork")
+        if behaviour == "hang":
+            time.sleep(30)
+
+    monkeypatch.setattr(helpers, "model", FakeModel(), raising=False)
+    monkeypatch.setattr(helpers, "predict_fn", predict, raising=False)
+    started = time.monotonic()
+    assert serve.check_fork_safe(timeout=1) is expected
+    assert time.monotonic() - started < 5
+
+
+def test_several_workers_need_a_shared_broker(monkeypatch, tmp_path):
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "EVENTS_BROKER", "local")
+    with pytest.raises(SystemExit, match="shared broker"):
+        serve.serve(args(workers=2))
+
+
+def test_master_spawns_and_stops_workers(monkeypatch):
+    # Workers idle until the master's SIGTERM, which they no longer handle themselves
+    monkeypatch.setattr(serve, "run_worker", lambda *a: time.sleep(30))
+    sock = serve.bind_socket("127.0.0.1", 0)
+    master = serve.Master(None, sock, args())
+
+    master.spawn()
+    master.spawn()
+    assert len(master.workers) == 2
+    master.reap()
+    assert len(master.workers) == 2
+
+    master.shutdown()
+    assert master.workers == {}
+    assert sock.fileno() == -1
+
+
+def test_master_replaces_exited_workers(monkeypatch):
+    monkeypatch.setattr(serve, "run_worker", lambda *a: None)
+    master = serve.Master(None, socket.socket(), args(workers=1))
+    master.spawn()
+    (pid,) = master.workers
+
+    deadline = time.monotonic() + 5
+    while master.workers and time.monotonic() < deadline:
+        master.reap()
+        time.sleep(0.02)
+    assert master.workers == {}
+    master.spawn()
+    assert len(master.workers) == 1 and pid not in master.workers
+    master.shutdown()
@@ -0,0 +1,86 @@
+import hashlib
+import io
+import os
+
+import pytest
+
+from backend.app.models import StoredBlob
+from backend.app.storage import BlobStore, LocalObjectStoreClient, ObjectStoreBackend, blob_key
+from backend.tests.conftest import png_bytes
+
+
+@pytest.fixture
+def store(db, tmp_path):
+    backend = ObjectStoreBackend(LocalObjectStoreClient(str(tmp_path / "objects")), "ldcs", "images")
+    return BlobStore(backend, temp_dir=str(tmp_path / "tmp"))
+
+
+def object_path(store, key):
+    return store.backend.client._path(store.backend.bucket, store.backend._object_key(key))
+
+
+def test_put_stores_content_addressed_object(db, store):
+    data = png_bytes(10)
+    key = store.put(db, io.BytesIO(data), "scan.PNG")
+    db.commit()
+
+    assert key == blob_key(hashlib.sha256(data).hexdigest(), ".png")
+    assert os.path.exists(object_path(store, key))
+    with store.open(key) as f:
+        assert f.read() == data
+    assert db.get(StoredBlob, key).ref_count == 1
+    # The spooled temp file was consumed
+    assert os.listdir(store.temp_dir) == []
+
+
+def test_duplicate_put_adds_reference(db, store):
+    data = png_bytes(20)
+    first = store.put(db, io.BytesIO(data), "a.png")
+    second = store.put(db, io.BytesIO(data), "b.png")
+    db.commit()
+
+    assert first == second
+    assert db.get(StoredBlob, first).ref_count == 2
+    assert os.listdir(store.temp_dir) == []
+
+
+def test_release_returns_key_on_last_reference(db, store):
+    key = store.put(db, io.BytesIO(png_bytes(30)), "a.png")
+    store.put(db, io.BytesIO(png_bytes(30)), "a.png")
+    db.commit()
+
+    assert store.release(db, key) is None
+    db.commit()
+    assert db.get(StoredBlob, key).ref_count == 1
+    assert store.exists(key)
+
+    assert store.release(db, key) == key
+    db.commit()
+    assert db.get(StoredBlob, key) is None
+    # The object is only removed by discard, after the release committed
+    assert store.exists(key)
+
+    store.discard(db, [key])
+    assert not store.exists(key)
+    assert not os.path.exists(object_path(store, key))
+
+
+def test_release_ignores_missing_and_legacy_keys(db, store):
+    assert store.release(db, None) is None
+    assert store.release(db, "uploads/old.png") is None
+
+
+def test_discard_keeps_object_stored_again(db, store):
+    data = png_bytes(40)
+    key = store.put(db, io.BytesIO(data), "a.png")
+    db.commit()
+    assert store.release(db, key) == key
+    db.commit()
+
+    # Uploaded again before the released object was discarded
+    assert store.put(db, io.BytesIO(data), "a.png") == key
+    db.commit()
+    store.discard(db, [key])
+
+    assert store.exists(key)
+    assert db.get(StoredBlob, key).ref_count == 1
@@ -0,0 +1,158 @@
+import asyncio
+import io
+import os
+import struct
+
+import pytest
+from fastapi import HTTPException, UploadFile
+from PIL import Image
+
+from backend.app.storage import blob_store
+from backend.app.uploads import (
+    FIRST_CHUNK_SIZE, MAX_HEADER_SIZE, MULTIPART_OVERHEAD, PROFILE_PICTURE_POLICY, TEST_IMAGE_POLICY,
+    UploadPolicy, UploadSizeLimitMiddleware, check_head, ingest_upload, read_head, sniff_kind,
+)
+from backend.tests.conftest import png_bytes
+
+
+def jpeg_bytes(size=(64, 48), padding=0) -> bytes:
+    """A JPEG with `padding` bytes of APP1 segments between SOI and the frame header."""
+    buffer = io.BytesIO()
+    Image.new("L", size, color=128).save(buffer, format="JPEG")
+    data = buffer.getvalue()
+    segments = b""
+    while padding > 0:
+        length = min(padding, 65533)
+        segments += b"\xff\xe1" + struct.pack(">H", length + 2) + bytes(length)
+        padding -= length
+    return data[:2] + segments + data[2:]
+
+
+def png_header(width: int, height: int) -> bytes:
+    return b"\x89PNG\r\n\x1a\n" + struct.pack(">I", 13) + b"IHDR" + struct.pack(">II", width, height) + bytes(5)
+
+
+def dicom_head(rows: int = 64, columns: int = 64) -> bytes:
+    from pydicom.dataset import Dataset, FileMetaDataset
+    from pydicom.uid import ExplicitVRLittleEndian, SecondaryCaptureImageStorage, generate_uid
+
+    meta = FileMetaDataset()
+    meta.MediaStorageSOPClassUID = SecondaryCaptureImageStorage
+    meta.MediaStorageSOPInstanceUID = generate_uid()
+    meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    ds = Dataset()
+    ds.file_meta = meta
+    ds.Rows, ds.Columns = rows, columns
+    buffer = io.BytesIO()
+    ds.save_as(buffer, enforce_file_format=True)
+    return buffer.getvalue()
+
+
+def rejection(head: bytes, policy: UploadPolicy = TEST_IMAGE_POLICY):
+    with pytest.raises(HTTPException) as error:
+        check_head(head, policy)
+    return error.value.status_code, error.value.detail
+
+
+def test_sniff_kind():
+    assert sniff_kind(png_bytes()) == "png"
+    assert sniff_kind(jpeg_bytes()) == "jpeg"
+    assert sniff_kind(dicom_head()) == "dicom"
+    assert sniff_kind(b"GIF89a" + bytes(200)) is None
+    assert sniff_kind(b"") is None
+
+
+def test_check_head_reads_dimensions():
+    assert check_head(png_bytes(size=(64, 40)), TEST_IMAGE_POLICY) == ("png", 64, 40)
+    assert check_head(jpeg_bytes((64, 48)), TEST_IMAGE_POLICY) == ("jpeg", 64, 48)
+    assert check_head(dicom_head(rows=50, columns=70), TEST_IMAGE_POLICY) == ("dicom", 70, 50)
+
+
+def test_check_head_rejections():
+    assert rejection(b"") == (400, "Empty file")
+    assert rejection(b"GIF89a" + bytes(200)) == (415, "Invalid file type")
+    # DICOM is only accepted for test images
+    assert rejection(dicom_head(), PROFILE_PICTURE_POLICY) == (415, "Invalid file type")
+    assert rejection(png_bytes()[:20]) == (400, "Could not read image dimensions")
+    assert rejection(b"\xff\xd8\xff\xe0garbage") == (400, "Could not read image dimensions")
+    assert rejection(png_header(16, 400)) == (400, "Unsupported image dimensions 16x400")
+    assert rejection(png_header(20000, 20000)) == (400, "Unsupported image dimensions 20000x20000")
+
+
+def test_jpeg_frame_header_past_first_chunk():
+    data = jpeg_bytes((64, 48), padding=3 * FIRST_CHUNK_SIZE)
+    head = read_head(io.BytesIO(data).read)
+    assert FIRST_CHUNK_SIZE < len(head) < len(data)
+    assert check_head(head, TEST_IMAGE_POLICY) == ("jpeg", 64, 48)
+
+    # Metadata beyond MAX_HEADER_SIZE is not followed
+    data = jpeg_bytes((64, 48), padding=MAX_HEADER_SIZE)
+    head = read_head(io.BytesIO(data).read)
+    assert len(head) <= MAX_HEADER_SIZE
+    assert rejection(head) == (400, "Could not read image dimensions")
+
+
+def test_ingest_upload_hashes_and_stores():
+    data = png_bytes(size=(64, 64))
+    ingested = ingest_upload(UploadFile(io.BytesIO(data), filename="scan.png"), TEST_IMAGE_POLICY)
+    try:
+        assert (ingested.kind, ingested.width, ingested.height, ingested.size) == ("png", 64, 64, len(data))
+        assert ingested.filename == f"{ingested.digest}.png"
+        with open(ingested.temp_path, "rb") as f:
+            assert f.read() == data
+    finally:
+        os.remove(ingested.temp_path)
+
+
+def test_ingest_upload_stops_at_size_limit():
+    data = png_bytes(size=(64, 64)) + bytes(4096)
+    before = set(os.listdir(blob_store.temp_dir))
+    with pytest.raises(HTTPException) as error:
+        ingest_upload(UploadFile(io.BytesIO(data), filename="scan.png"), UploadPolicy("test_image", 1024, ("png",)))
+    assert error.value.status_code == 413
+    assert set(os.listdir(blob_store.temp_dir)) == before
+
+
+POLICY = UploadPolicy("test_image", 1000, ("png",))
+
+
+def run_middleware(headers, chunks):
+    """Sends a POST /upload body through the middleware; returns (status, bytes the app read)."""
+    read = []
+    sent = []
+
+    async def app(scope, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                raise RuntimeError("client disconnected")
+            read.append(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    messages = [{"type": "http.request", "body": chunk, "more_body": i < len(chunks) - 1} for i, chunk in enumerate(chunks)]
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "POST", "path": "/upload", "headers": headers}
+    middleware = UploadSizeLimitMiddleware(app, {("POST", "/upload"): POLICY})
+    asyncio.run(middleware(scope, receive, send))
+    return sent[0]["status"], sum(len(chunk) for chunk in read)
+
+
+def test_size_limit_middleware():
+    limit = POLICY.max_bytes + MULTIPART_OVERHEAD
+    assert run_middleware([(b"content-length", str(limit).encode())], [bytes(limit)]) == (200, limit)
+    assert run_middleware([(b"content-length", b"abc")], [b""]) == (400, 0)
+    assert run_middleware([(b"content-length", str(limit + 1).encode())], [bytes(limit + 1)]) == (413, 0)
+
+    # Without Content-Length the body is cut off once it passes the limit
+    status_code, read = run_middleware([], [bytes(limit // 2), bytes(limit // 2), bytes(limit // 2)])
+    assert status_code == 413
+    assert read <= limit
@@ -74,6 +74,15 @@ const TestResults = ({ result }) => {
       <h3 className="text-2xl font-semibold text-gray-900 mb-4 text-center">
         Test Details
       </h3>
+      {result.thumbnails && (
+        <img
+          src={`${process.env.REACT_APP_API_URL}${result.thumbnails["256"]}`}
+          srcSet={`${process.env.REACT_APP_API_URL}${result.thumbnails["512"]} 2x`}
+          alt={`X-ray for test ${result.id}`}
+          loading="lazy"
+          className="rounded-md max-h-60 mx-auto shadow-md border"
+        />
+      )}
       <ul className="text-gray-800 space-y-4">
         <li className="flex justify-between items-center border-b pb-2">
           <span className="font-medium">